@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of ROM CRC16: old bit by bit loop against crc_hqx
+(python3 tests/bench_crc16.py)
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0,
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zx123_tool  # pylint: disable=wrong-import-position
+from test_zx123_tool import bit_crc16  # pylint: disable=wrong-import-position
+
+
+def get_speed(bench_func, i_len, i_repeat):
+    """
+    Measure speed of a function
+    :param bench_func: Function to measure
+    :param i_len: Bytes processed by each call
+    :param i_repeat: Number of calls
+    :return: Speed in MB/s (best of 3 runs)
+    """
+    f_time = min(timeit.repeat(bench_func, number=i_repeat, repeat=3))
+    return i_len * i_repeat / f_time / 1000000
+
+
+def main():
+    """Main routine"""
+    rom_data = os.urandom(8 * 16384)
+    pack_data = os.urandom(255 * 16384)
+
+    print(f'Python {sys.version.split()[0]}')
+    f_old = get_speed(lambda: bit_crc16(rom_data, 0, 16384), 16384, 1)
+    print(f'old get_crc16 (16 KiB):            {f_old:10.3f} MB/s')
+    f_rom = get_speed(lambda: zx123_tool.get_rom_crc(rom_data), len(rom_data),
+                      100)
+    print(f'get_rom_crc (8 x 16 KiB):          {f_rom:10.3f} MB/s')
+    f_blocks = get_speed(
+        lambda: zx123_tool.get_crc16_blocks(pack_data, 0, 16384),
+        len(pack_data), 10)
+    print(f'get_crc16_blocks (255 x 16 KiB):   {f_blocks:10.3f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for zx123_tool"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0,
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import zx123_tool  # pylint: disable=wrong-import-position
+
+
+def bit_crc16(data, offset, length):
+    """
+    Computes CRC16 bit by bit, as get_crc16 did before using crc_hqx
+    :param data: ByteArray which contains the data
+    :param offset: Data offset to begin the calculation
+    :param length: Number of bytes after the offset
+    :return: Integer with CRC
+    """
+    crc = 0xFFFF
+    for i in range(0, length):
+        crc ^= data[offset + i] << 8
+        for _ in range(0, 8):
+            if (crc & 0x8000) > 0:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc = crc << 1
+    return crc & 0xFFFF
+
+
+def new_roms(arr_roms):
+    """
+    Build a ROMs list
+    :param arr_roms: List of (slot, size) pairs
+    :return: List of RomEntry objects
+    """
+    return [
+        zx123_tool.RomEntry(rom_index, rom_slot, f'ROM{rom_index}', rom_size,
+                            '', '')
+        for rom_index, (rom_slot, rom_size) in enumerate(arr_roms)
+    ]
+
+
+def moved_bytes(arr_moves):
+    """
+    Count bytes copied by a defrag plan
+    :param arr_moves: List of (RomEntry, new slot) pairs
+    :return: Number of bytes
+    """
+    return sum(rom_entry.size * 16384 for rom_entry, _ in arr_moves)
+
+
+def final_slots(roms_list, arr_moves):
+    """
+    Get the slots used after applying a defrag plan
+    :param roms_list: List of RomEntry objects
+    :param arr_moves: List of (RomEntry, new slot) pairs
+    :return: Sorted list of used slots
+    """
+    dict_slots = {rom_entry.index: rom_entry.slot for rom_entry in roms_list}
+    for rom_entry, new_slot in arr_moves:
+        dict_slots[rom_entry.index] = new_slot
+
+    arr_slots = []
+    for rom_entry in roms_list:
+        rom_slot = dict_slots[rom_entry.index]
+        arr_slots += range(rom_slot, rom_slot + rom_entry.size)
+
+    return sorted(arr_slots)
+
+
+class TestPlanRomDefrag(unittest.TestCase):
+    """Tests for plan_rom_defrag"""
+
+    def test_minimal_moves(self):
+        """Only the ROMs past the used space are moved"""
+        roms_list = new_roms([(2, 1), (10, 8), (17, 4), (40, 2), (30, 1)])
+        arr_moves = zx123_tool.plan_rom_defrag(roms_list, 64)
+
+        self.assertEqual(final_slots(roms_list, arr_moves), list(range(16)))
+        self.assertNotIn(roms_list[0], [move[0] for move in arr_moves])
+        self.assertEqual(moved_bytes(arr_moves), (8 + 4 + 2 + 1) * 16384)
+
+    def test_packed(self):
+        """Nothing is moved if there are no gaps"""
+        roms_list = new_roms([(0, 1), (1, 8), (9, 2)])
+        self.assertEqual(zx123_tool.plan_rom_defrag(roms_list, 64), [])
+
+    def test_slide(self):
+        """ROMs after the first gap slide down if gaps are too small"""
+        roms_list = new_roms([(0, 1), (2, 1), (4, 2)])
+        arr_moves = zx123_tool.plan_rom_defrag(roms_list, 64)
+
+        self.assertEqual(final_slots(roms_list, arr_moves), list(range(4)))
+        self.assertEqual(moved_bytes(arr_moves), 3 * 16384)
+
+
+class TestCrc16(unittest.TestCase):
+    """Tests for CRC16 with crc_hqx, against the old bit by bit version"""
+
+    def setUp(self):
+        self.rng = random.Random(1234)
+
+    def test_get_crc16(self):
+        """Same CRC for random data, lengths and offsets"""
+        for _ in range(50):
+            data = bytes(
+                self.rng.getrandbits(8)
+                for _ in range(self.rng.randint(1, 3000)))
+            offset = self.rng.randrange(len(data))
+            length = self.rng.randint(0, len(data) - offset)
+            self.assertEqual(zx123_tool.get_crc16(data, offset, length),
+                             bit_crc16(data, offset, length))
+
+    def test_get_rom_crc(self):
+        """Same CRC string for random ROMs of 1, 2 and 4 blocks"""
+        for rom_blocks in [1, 2, 4]:
+            rom_data = bytes(
+                self.rng.getrandbits(8) for _ in range(rom_blocks * 16384))
+            str_crc = ''
+            for rom_block in range(rom_blocks):
+                block_crc = bit_crc16(rom_data, rom_block * 16384, 16384)
+                str_crc = f'{block_crc:04X}{str_crc}'
+            self.assertEqual(zx123_tool.get_rom_crc(rom_data), str_crc)
+
+
+if __name__ == '__main__':
+    unittest.main()
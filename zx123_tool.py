@@ -38,28 +38,80 @@ from __future__ import print_function
 import logging
 import sys
 import argparse
+import atexit
 import os
+import glob
 import json
+import marshal
 import hashlib
-from binascii import unhexlify
+from binascii import unhexlify, crc_hqx
 import struct
 import ssl
-from zipfile import ZipFile, is_zipfile
+from zipfile import ZipFile, BadZipFile, is_zipfile
 import tempfile
 import shutil
 import ctypes
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import as_completed
+import time
+import io
+import contextlib
+import http.client
+import zlib
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
 if sys.version_info.major == 3:
     import urllib.request
+    import urllib.parse
+    import urllib.error
 if os.name == 'nt':
     import msvcrt  # pylint: disable=import-error
 
 __MY_VERSION__ = '3.6.1'
 
 MAIN_URL = 'https://raw.githubusercontent.com/kounch/zx123_tool/main'
+DELTA_URL = ''  # Base URL of database patches (none if empty)
 MY_DIRPATH = os.path.dirname(sys.argv[0])
 MY_DIRPATH = os.path.abspath(MY_DIRPATH)
 STR_OUTDIR = ''
 IS_COL_TERM = False
+OUTPUT_FORMAT = 'text'
+JSON_STREAM = sys.stdout
+MSG_STREAM = None  # For messages when stdout is only for JSON data
+JOURNAL_MAGIC = b'ZX123JNL'
+SECTOR_LEN = 4096
+HASH_INDEX = {}
+DEVICE_LAYOUTS = {}
+FLASH_IMAGES = {}
+IDENT_CACHE = None
+IDENT_CACHE_MAX = 20000
+HASH_THREADS = None
+DL_CHUNK_LEN = 65536
+DL_RETRIES = 5
+DL_BACKOFF = 1.0
+DL_TIMEOUT = 30
+DL_RANGE_LEN = 1048576
+HTTP_CONNS = {}
+HTTP_LOCK = threading.Lock()
+HTTP_MAX_IDLE = 4
+HTTP_MAX_REDIRECTS = 5
+ZIP_MAGIC = b'PK\x03\x04'
+BATCH_HASH = {}
+DL_THREADS = 8
+DL_HOST_THREADS = 4
+DL_CACHE_DIR = ''
+DL_CACHE_MAX = 512 * 1048576
+DL_CACHE_LOCK = threading.Lock()
+MIRROR_MAP = {}
+FLAG_TABLES = {}
+BYTE_VALUES = [bytes([i]) for i in range(256)]
+ROM_ENTRY = struct.Struct('<5B3x16s8x32s')
+MIRROR_MAP_FILE = 'zx123_mirror.json'
+MIRROR_KEYS = ['latest', '2m', '1core', 'base', 'vertical', 'arcade']
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -90,15 +142,41 @@ def main():
     STR_OUTDIR = arg_data['output_dir']
     output_file = arg_data['output_file']
 
-    fulldict_hash = load_json_bd(str_file, output_file, arg_data['update'])
+    json_file = str_file
+    if arg_data['fleet']:
+        json_file = arg_data['fleet'][0]
+    fulldict_hash = load_json_bd(json_file,
+                                 output_file,
+                                 arg_data['update'],
+                                 b_caches=True)
     if not fulldict_hash:
         LOGGER.error("There's no JSON data")
         sys.exit(2)
 
     if arg_data['stats']:
-        print_stats(fulldict_hash, arg_data['detail'])
+        dict_stats = print_stats(fulldict_hash, arg_data['detail'])
+        if OUTPUT_FORMAT != 'text':
+            print_result(dict_stats)
         sys.exit(0)
 
+    if arg_data['batch']:
+        batch_zxdata(arg_data['batch'])
+        sys.exit(0)
+
+    if arg_data['fleet']:
+        if not arg_data['update'] or not arg_data['force']:
+            LOGGER.error('--fleet needs -u and -f')
+            sys.exit(3)
+        update_fleet(arg_data['fleet'], fulldict_hash, arg_data['update'],
+                     arg_data['1core'], arg_data['2mb'])
+        sys.exit(0)
+
+    if arg_data['mirror']:
+        if not str_file and not output_file:
+            arr_failed = build_mirror(arg_data['mirror'], fulldict_hash)
+            sys.exit(1 if arr_failed else 0)
+        set_mirror(arg_data['mirror'])
+
     # Analyze/initialize input file and output dir location and extension
     b_new_img = False
     if not str_file:
@@ -118,20 +196,23 @@ def main():
             STR_OUTDIR = os.path.dirname(str_file)
 
     str_extension, dict_hash, filetype = detect_file(str_file, fulldict_hash)
+    dict_res = {'file': str_file, 'kind': filetype}
 
     if filetype == 'FlashImage':
         supported_exts = ['ZX1', 'ZX2', 'ZXD', 'ZXT']
 
         # List main ROMs, Cores and BIOS settings
         if arg_data['list']:
-            list_zxdata(str_file, dict_hash, arg_data['show_hashes'],
-                        arg_data['check_updated'], arg_data['1core'],
-                        arg_data['2mb'], arg_data['detail'])
+            dict_res.update(
+                list_zxdata(str_file, dict_hash, arg_data['show_hashes'],
+                            arg_data['check_updated'], arg_data['1core'],
+                            arg_data['2mb'], arg_data['detail']))
 
         # List ZX Spectrum ROMs
         if arg_data['roms']:
-            list_romsdata(str_file, fulldict_hash, str_extension,
-                          arg_data['show_hashes'])
+            dict_res['roms'], _ = list_romsdata(str_file, fulldict_hash,
+                                                str_extension,
+                                                arg_data['show_hashes'])
 
         # Extract Cores and/or ROMs
         for x_item in arg_data['extract']:
@@ -152,7 +233,7 @@ def main():
 
         if arg_data['update'] != '':
             if str_extension in supported_exts:
-                print('\nStarting update...')
+                print('\nStarting update...', file=MSG_STREAM)
                 if not output_file:
                     output_file = str_file
 
@@ -177,6 +258,16 @@ def main():
                             arg_data['keyboard_layout'],
                             arg_data['boot_timer'], arg_data['force'])
 
+        # Join free ZX Spectrum ROM slots
+        if arg_data['defrag_roms']:
+            if str_extension in supported_exts:
+                if not output_file:
+                    output_file = str_file
+                if defrag_romsdata(str_file, output_file, fulldict_hash,
+                                   str_extension, arg_data['force']):
+                    arg_data['force'] = True
+                    str_file = output_file
+
         # Inject Cores and/or ROMs
         if arg_data['inject']:
             if str_extension in supported_exts:
@@ -219,15 +310,26 @@ def main():
                             arg_data['default_rom'], arg_data['force'])
     elif filetype == 'ROMPack v2':
         # List ZX Spectrum ROMs
-        if not arg_data['extract'] and not arg_data['inject']:
-            list_romsdata(str_file, fulldict_hash, 'RPv2',
-                          arg_data['show_hashes'], True)
+        if not (arg_data['extract'] or arg_data['inject']
+                or arg_data['defrag_roms']):
+            dict_res['roms'], dict_res['default_rom'] = list_romsdata(
+                str_file, fulldict_hash, 'RPv2', arg_data['show_hashes'],
+                True)
 
         # Extract ROMs
         for x_item in arg_data['extract']:
             extractfrom_zxdata(str_file, x_item, fulldict_hash, STR_OUTDIR,
                                'RPv2', arg_data['force'], False)
 
+        # Join free ROM slots
+        if arg_data['defrag_roms']:
+            if not output_file:
+                output_file = str_file
+            if defrag_romsdata(str_file, output_file, fulldict_hash, 'RPv2',
+                               arg_data['force']):
+                arg_data['force'] = True
+                str_file = output_file
+
         # Inject  ROMs
         if arg_data['inject']:
             if not output_file:
@@ -239,7 +341,7 @@ def main():
         # Convert between Standard and Spectrum Core?
         if arg_data['convert_core']:
             if output_file:
-                print(f'Trying to convert {str_file}...')
+                print(f'Trying to convert {str_file}...', file=MSG_STREAM)
                 convert_core(str_file, dict_hash, output_file,
                              arg_data['force'])
             else:
@@ -247,15 +349,30 @@ def main():
         else:
             # File header unknown, try to guess only from hash and size
             try:
-                find_zxfile(str_file, fulldict_hash, str_extension,
-                            arg_data['show_hashes'], arg_data['detail'])
+                dict_res.update(
+                    find_zxfile(str_file, fulldict_hash, str_extension,
+                                arg_data['show_hashes'], arg_data['detail']))
             except FileNotFoundError:
                 LOGGER.error('Input file not found!')
 
-    print('')
+    if OUTPUT_FORMAT == 'text':
+        print('', file=MSG_STREAM)
+    else:
+        print_result(dict_res)
     LOGGER.debug("Finished.")
 
 
+def print_result(dict_res):
+    """
+    Print data as JSON (in one line if the output format is ndjson)
+    :param dict_res: Dictionary with data
+    """
+    if OUTPUT_FORMAT == 'ndjson':
+        print(json.dumps(dict_res), file=JSON_STREAM)
+    else:
+        print(json.dumps(dict_res, indent=4), file=JSON_STREAM)
+
+
 def enable_term_col():
     """
     Enable TERM colours (Windows 10)
@@ -292,12 +409,12 @@ class Colours:
     ENDC = '\033[m'
 
 
-def printcol(str_col, str_txt, end=''):
+def printcol(str_col, str_txt, end='', file=None):
     """Print with TERM colour"""
     if IS_COL_TERM:
-        print(f'{str_col}{str_txt}{Colours.ENDC}', end=end)
+        print(f'{str_col}{str_txt}{Colours.ENDC}', end=end, file=file)
     else:
-        print(str_txt, end=end)
+        print(str_txt, end=end, file=file)
 
 
 def parse_args():
@@ -307,6 +424,10 @@ def parse_args():
     """
     global LOGGER  # pylint: disable=global-variable-not-assigned
     global IS_COL_TERM  # pylint: disable=global-statement
+    global HASH_THREADS  # pylint: disable=global-statement
+    global OUTPUT_FORMAT  # pylint: disable=global-statement
+    global MSG_STREAM  # pylint: disable=global-statement
+    global DL_CACHE_MAX  # pylint: disable=global-statement
 
     values = {}
     values['input_file'] = ''
@@ -316,6 +437,9 @@ def parse_args():
     values['list'] = False
     values['detail'] = False
     values['stats'] = False
+    values['batch'] = ''
+    values['mirror'] = ''
+    values['fleet'] = []
     values['roms'] = False
     values['show_hashes'] = False
     values['extract'] = []
@@ -324,6 +448,7 @@ def parse_args():
     values['rename'] = []
     values['wipe_flash'] = False
     values['expand_flash'] = False
+    values['defrag_roms'] = False
     values['convert_core'] = False
     values['1core'] = False
     values['2mb'] = False
@@ -379,6 +504,22 @@ def parse_args():
                         dest='detail',
                         help='Show Core Features')
     parser.add_argument('--stats', action='store_true', dest='stats')
+    parser.add_argument('--batch',
+                        required=False,
+                        action='store',
+                        dest='batch',
+                        help='Identify all the files in a directory')
+    parser.add_argument('--mirror',
+                        required=False,
+                        action='store',
+                        dest='mirror',
+                        help='Download all files to a directory, or use them'
+                        ' to update an image')
+    parser.add_argument('--fleet',
+                        required=False,
+                        nargs='+',
+                        dest='fleet',
+                        help='Image files to update at once (with -u and -f)')
     parser.add_argument('-r',
                         '--roms',
                         required=False,
@@ -428,6 +569,11 @@ def parse_args():
                         action='store_true',
                         dest='expand_flash',
                         help='Expand, if needed, flash file to 32MiB')
+    parser.add_argument('--defrag-roms',
+                        required=False,
+                        action='store_true',
+                        dest='defrag_roms',
+                        help='Move ROMs so all the free slots are together')
     parser.add_argument('-t',
                         '--convert',
                         required=False,
@@ -506,6 +652,24 @@ def parse_args():
                         action='store_true',
                         dest='nocol',
                         help='Do not use terminal colours')
+    parser.add_argument('--cache_size',
+                        required=False,
+                        type=int,
+                        action='store',
+                        dest='cache_size',
+                        help='Max size of downloads cache in MiB (0: no cache)')
+    parser.add_argument('--format',
+                        required=False,
+                        choices=['text', 'json', 'ndjson'],
+                        default='text',
+                        dest='output_format',
+                        help='Output format for list, roms, find and stats')
+    parser.add_argument('--threads',
+                        required=False,
+                        type=int,
+                        action='store',
+                        dest='threads',
+                        help='Number of threads used to identify blocks')
     parser.add_argument('--debug', action='store_true', dest='debug')
 
     arguments = parser.parse_args()
@@ -513,8 +677,23 @@ def parse_args():
     if arguments.nocol:
         IS_COL_TERM = False
 
+    if arguments.threads:
+        HASH_THREADS = arguments.threads
+
+    if arguments.cache_size is not None:
+        DL_CACHE_MAX = arguments.cache_size * 1048576
+
+    if arguments.output_format != 'text':
+        OUTPUT_FORMAT = arguments.output_format
+        # Keep stdout only for JSON data, progress messages go to stderr
+        LOG_STREAM.stream = sys.stderr
+        MSG_STREAM = sys.stderr
+
     if arguments.debug:
-        printcol(Colours.PURPLE, 'Debugging Enabled!!', end='\n')
+        printcol(Colours.PURPLE,
+                 'Debugging Enabled!!',
+                 end='\n',
+                 file=MSG_STREAM)
         LOGGER.setLevel(logging.DEBUG)
 
     LOGGER.debug(sys.argv)
@@ -540,6 +719,15 @@ def parse_args():
     if arguments.stats:
         values['stats'] = arguments.stats
 
+    if arguments.batch:
+        values['batch'] = os.path.abspath(arguments.batch)
+
+    if arguments.mirror:
+        values['mirror'] = os.path.abspath(arguments.mirror)
+
+    if arguments.fleet:
+        values['fleet'] = [os.path.abspath(x) for x in arguments.fleet]
+
     if arguments.parse_roms:
         values['roms'] = arguments.parse_roms
 
@@ -564,6 +752,9 @@ def parse_args():
     if arguments.expand_flash:
         values['expand_flash'] = arguments.expand_flash
 
+    if arguments.defrag_roms:
+        values['defrag_roms'] = arguments.defrag_roms
+
     if arguments.convert_core:
         values['convert_core'] = arguments.convert_core
 
@@ -600,12 +791,20 @@ def parse_args():
 # Main Functions
 
 
-def load_json_bd(str_file='', output_file='', str_update='', base_dir=None):
+def load_json_bd(str_file='',
+                 output_file='',
+                 str_update='',
+                 base_dir=None,
+                 b_caches=False):
     """
     Loads the Hash Database
     :param str_file: Input file (to determine if update)
     :param output_file: Output file (to determine if update)
     :param str_update: Update parameter from options
+    :param base_dir: Directory of the database (if not the app directory)
+    :param b_caches: If True, save the compiled database cache and use the
+     identification and downloads caches of the database directory. Only
+     for the user data directory
     :return: Dictionary with Hashes from database
     """
 
@@ -618,25 +817,289 @@ def load_json_bd(str_file='', output_file='', str_update='', base_dir=None):
     if str_update != '':
         if str_update == 'json' or (not str_file and not STR_OUTDIR
                                     and not output_file):
-            if os.path.isfile(str_json):
-                os.remove(str_json)
+            fulldict_hash = update_json_bd(str_json)
 
     if not os.path.isfile(str_json):
-        dl_url = MAIN_URL + '/zx123_hash.json'
-        print('\nDownloading JSON database...', end='')
-        urllib.request.urlretrieve(dl_url, str_json)
-        print('OK')
+        fulldict_hash = update_json_bd(str_json)
 
     if not os.path.isfile(str_json):
         LOGGER.error('Hash database not found: %s', str_json)
-    with open(str_json, 'r', encoding='utf-8') as json_handle:
-        LOGGER.debug('Loading dictionary with hashes...')
-        fulldict_hash = json.load(json_handle)
-        LOGGER.debug('%s loaded OK', str_json)
+    b_save = bool(fulldict_hash)
+    if not fulldict_hash:
+        fulldict_hash = load_json_cache(str_json)
+    if not fulldict_hash:
+        with open(str_json, 'r', encoding='utf-8') as json_handle:
+            LOGGER.debug('Loading dictionary with hashes...')
+            fulldict_hash = json.load(json_handle)
+            LOGGER.debug('%s loaded OK', str_json)
+        b_save = True
+
+    if b_caches:
+        if b_save:
+            save_json_cache(str_json, fulldict_hash)
+        open_ident_cache(str_json, fulldict_hash.get('version', ''))
+        set_download_cache(
+            os.path.join(os.path.dirname(str_json), 'downloads'))
+
+    return fulldict_hash
+
+
+def get_json_version(str_json):
+    """
+    Read the version of a hash database file, without using it
+    :param str_json: Path to hash database file
+    :return: Version string (empty if not available)
+    """
+    try:
+        with open(str_json, 'r', encoding='utf-8') as json_handle:
+            return json.load(json_handle).get('version', '')
+    except (OSError, ValueError) as error:
+        LOGGER.debug('Error loading %s: %s', str_json, error)
+
+    return ''
+
+
+def update_json_bd(str_json):
+    """
+    Update the Hash Database from the repository, only if it has changed.
+    The ETag and date of the last download are saved beside the file and
+    sent with a conditional request. If there are changes, tries to get a
+    patch from the current version to the latest, and, if not available,
+    downloads the whole file.
+    :param str_json: Path to hash database file
+    :return: Dictionary with the new Hashes, or empty if not changed
+    """
+    str_meta = f'{os.path.splitext(str_json)[0]}.meta'
+    dl_url = MAIN_URL + '/zx123_hash.json'
+    b_exists = os.path.isfile(str_json)
+
+    dict_meta = {}
+    if b_exists and os.path.isfile(str_meta):
+        try:
+            with open(str_meta, 'r', encoding='utf-8') as meta_handle:
+                dict_meta = json.load(meta_handle)
+        except (OSError, ValueError) as error:
+            LOGGER.debug('Error loading %s: %s', str_meta, error)
+        if dict_meta.get('key') != get_json_cache_key(str_json):
+            dict_meta = {}
+
+    print('\nChecking JSON database...', end='', file=MSG_STREAM)
+    dict_headers = {}
+    if dict_meta.get('etag'):
+        dict_headers['If-None-Match'] = dict_meta['etag']
+    if dict_meta.get('last_modified'):
+        dict_headers['If-Modified-Since'] = dict_meta['last_modified']
+    dict_new = {}
+    try:
+        with http_open(dl_url, dict_headers, 'HEAD') as url_data:
+            dict_new['etag'] = url_data.headers.get('ETag', '')
+            dict_new['last_modified'] = url_data.headers.get(
+                'Last-Modified', '')
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            print('Up to date', file=MSG_STREAM)
+            return {}
+        LOGGER.debug(error)
+    except urllib.error.URLError as error:
+        if b_exists:
+            print('Error!', file=MSG_STREAM)
+            LOGGER.warning('Could not check for database updates: %s', error)
+            return {}
+
+    fulldict_hash = {}
+    if dict_meta.get('version'):
+        fulldict_hash = patch_json_bd(str_json, dict_meta['version'])
+
+    if fulldict_hash:
+        print('Patched', file=MSG_STREAM)
+    else:
+        print('\nDownloading JSON database...', end='', file=MSG_STREAM)
+        try:
+            str_part, _ = download_file(dl_url, str_json)
+        except urllib.error.URLError as error:
+            if not b_exists:
+                raise
+            # Keep the current database (and the unfinished download)
+            print('Error!', file=MSG_STREAM)
+            LOGGER.warning('Could not download database: %s', error)
+            return {}
+        os.replace(str_part, str_json)
+        with open(str_json, 'r', encoding='utf-8') as json_handle:
+            fulldict_hash = json.load(json_handle)
+        print('OK', file=MSG_STREAM)
+
+    dict_new['version'] = fulldict_hash.get('version', '')
+    dict_new['key'] = get_json_cache_key(str_json)
+    try:
+        with open(str_meta, 'w', encoding='utf-8') as meta_handle:
+            json.dump(dict_new, meta_handle)
+    except OSError as error:
+        LOGGER.debug('Error saving %s: %s', str_meta, error)
+
+    return fulldict_hash
+
+
+def patch_json_bd(str_json, str_version):
+    """
+    Update the Hash Database applying the patch from its version to the
+    latest one, if DELTA_URL is set and the patch is available there. The
+    patch is a JSON object with the new version, the sha256 of the patched
+    database (as compact JSON with sorted keys) and a list of operations
+    ('add', 'replace' or 'remove', with a JSON pointer path, as in RFC 6902)
+    :param str_json: Path to hash database file
+    :param str_version: Version of the database file
+    :return: Dictionary with the new Hashes, or empty if not patched
+    """
+    if not DELTA_URL:
+        return {}
+
+    dl_url = f'{DELTA_URL}/{urllib.parse.quote(str_version)}.json'
+    try:
+        with http_open(dl_url, b_gzip=True) as url_data:
+            dict_delta = json.load(url_data)
+        with open(str_json, 'r', encoding='utf-8') as json_handle:
+            fulldict_hash = json.load(json_handle)
+        if fulldict_hash.get('version') != str_version:
+            return {}
+
+        apply_json_patch(fulldict_hash, dict_delta['patch'])
+        fulldict_hash['version'] = dict_delta['version']
+        str_hash = hashlib.sha256(
+            json.dumps(fulldict_hash, sort_keys=True,
+                       separators=(',', ':')).encode('utf-8')).hexdigest()
+        if str_hash != dict_delta['sha256']:
+            raise ValueError('Patched database is not valid')
+
+        str_tmp = f'{str_json}.tmp'
+        with open(str_tmp, 'w', encoding='utf-8') as json_handle:
+            json.dump(fulldict_hash, json_handle, indent=4)
+        os.replace(str_tmp, str_json)
+    except (urllib.error.URLError, OSError, http.client.HTTPException,
+            ValueError, KeyError, IndexError, TypeError) as error:
+        LOGGER.debug('Database patch not available: %s', error)
+        return {}
+
+    LOGGER.debug('Database patched from %s to %s', str_version,
+                 fulldict_hash['version'])
+    return fulldict_hash
+
+
+def apply_json_patch(dict_data, arr_patch):
+    """
+    Apply a list of JSON patch operations to a dictionary, in place
+    :param dict_data: Dictionary to modify
+    :param arr_patch: List of operations (dictionaries with op, path and
+     value)
+    :raises ValueError: If an operation is not valid
+    """
+    for dict_op in arr_patch:
+        arr_path = [
+            str_key.replace('~1', '/').replace('~0', '~')
+            for str_key in dict_op['path'].split('/')[1:]
+        ]
+        if not arr_path:
+            raise ValueError(f'Invalid path: {dict_op["path"]}')
+
+        parent = dict_data
+        for str_key in arr_path[:-1]:
+            if isinstance(parent, list):
+                str_key = int(str_key)
+            parent = parent[str_key]
+
+        str_key = arr_path[-1]
+        str_op = dict_op['op']
+        if isinstance(parent, list):
+            if str_op == 'add' and str_key == '-':
+                str_key = len(parent)
+            str_key = int(str_key)
+            if str_op == 'add':
+                parent.insert(str_key, dict_op['value'])
+                continue
+        if str_op in ('add', 'replace'):
+            if str_op == 'replace':
+                _ = parent[str_key]
+            parent[str_key] = dict_op['value']
+        elif str_op == 'remove':
+            del parent[str_key]
+        else:
+            raise ValueError(f'Unknown operation: {str_op}')
+
+
+def get_json_cache_key(str_json):
+    """
+    Obtain the key that identifies the compiled cache of a hash database
+    :param str_json: Path to hash database file
+    :return: List with tool version, Python version (marshal format may
+     change), database file size and modification time
+    """
+    f_stat = os.stat(str_json)
+    return [
+        __MY_VERSION__, sys.version_info[0], sys.version_info[1],
+        f_stat.st_size, f_stat.st_mtime_ns
+    ]
+
+
+def load_json_cache(str_json):
+    """
+    Load the hash database, and the reverse indexes of its hashes, from the
+    compiled cache, if it's up to date
+    :param str_json: Path to hash database file
+    :return: Dictionary with Hashes from database (empty if not available)
+    """
+    str_cache = f'{os.path.splitext(str_json)[0]}.cache'
+    if not os.path.isfile(str_cache):
+        return {}
+
+    # marshal only builds plain data (unlike pickle, it can't run code), and
+    # any unexpected content just means that the cache has to be rebuilt
+    try:
+        with open(str_cache, 'rb') as cache_handle:
+            cache_key, fulldict_hash, arr_index = marshal.load(cache_handle)
+        if cache_key != get_json_cache_key(str_json) + [
+                fulldict_hash.get('version', '')
+        ]:
+            LOGGER.debug('%s is outdated', str_cache)
+            return {}
+
+        dict_index = {}
+        for hash_dict, hash_index in arr_index:
+            dict_index[id(hash_dict)] = (hash_dict, hash_index)
+    except Exception as error:  # pylint: disable=broad-except
+        LOGGER.debug('Error loading %s: %s', str_cache, error)
+        return {}
+
+    HASH_INDEX.update(dict_index)
+    LOGGER.debug('%s loaded OK', str_cache)
 
     return fulldict_hash
 
 
+def save_json_cache(str_json, fulldict_hash):
+    """
+    Save the hash database, with prebuilt reverse indexes for each block
+    kind, to a compiled cache file
+    :param str_json: Path to hash database file
+    :param fulldict_hash: Dictionary with Hashes from database
+    """
+    arr_index = []
+    for kind_dict in fulldict_hash.values():
+        if isinstance(kind_dict, dict):
+            for hash_dict in kind_dict.values():
+                if isinstance(hash_dict, dict):
+                    arr_index.append((hash_dict, get_hash_index(hash_dict)))
+
+    cache_key = get_json_cache_key(str_json)
+    cache_key.append(fulldict_hash.get('version', ''))
+    str_cache = f'{os.path.splitext(str_json)[0]}.cache'
+    str_tmp = f'{str_cache}.tmp'
+    try:
+        with open(str_tmp, 'wb') as cache_handle:
+            marshal.dump((cache_key, fulldict_hash, arr_index), cache_handle)
+        os.replace(str_tmp, str_cache)
+    except (OSError, ValueError) as error:
+        LOGGER.debug('Error saving %s: %s', str_cache, error)
+
+
 def unzip_image(str_path, str_output, hash_dict, b_force):
     """
     Extract base image file from ZIP. Download ZIP from repository if needed.
@@ -657,9 +1120,16 @@ def unzip_image(str_path, str_output, hash_dict, b_force):
         str_zipfile = os.path.join(str_path, str_zip)
         if not os.path.isfile(str_zipfile):
             dl_url = f'{MAIN_URL}/{str_zip}'
-            print('\nDownloading base image ZIP file...', end='')
-            urllib.request.urlretrieve(dl_url, str_zipfile)
-            print('OK')
+            print('\nDownloading base image ZIP file...',
+                  end='',
+                  file=MSG_STREAM)
+            try:
+                str_part, _ = download_file(dl_url, str_zipfile)
+                os.replace(str_part, str_zipfile)
+                print('OK', file=MSG_STREAM)
+            except urllib.error.URLError as error:
+                print('Error!', file=MSG_STREAM)
+                LOGGER.debug(error)
 
         if is_zipfile(str_zipfile):
             with ZipFile(str_zipfile, 'r') as zip_obj:
@@ -667,12 +1137,15 @@ def unzip_image(str_path, str_output, hash_dict, b_force):
                 for str_name in arr_files:
                     if str_name == str_image:
                         with tempfile.TemporaryDirectory() as str_tmpdir:
-                            print('\nExtracting image...', end='')
+                            print('\nExtracting image...',
+                                  end='',
+                                  file=MSG_STREAM)
                             zip_obj.extract(str_name, str_tmpdir)
-                            print('OK')
+                            print('OK', file=MSG_STREAM)
                             str_file = os.path.join(str_tmpdir, str_name)
                             if b_force or check_overwrite(str_output):
                                 try:
+                                    release_flash_image(str_output)
                                     shutil.move(str_file, str_output)
                                     str_file = str_output
                                 except FileNotFoundError:
@@ -755,14 +1228,91 @@ def detect_file(str_file, fulldict_hash):
     return str_extension, dict_hash, filetype
 
 
+def batch_zxdata(str_dir):
+    """
+    Identify all the SPI flash images, ROMPacks and ROM files in a directory
+    tree using a pool of processes, printing a JSON line for each one
+    :param str_dir: Directory to scan
+    """
+    arr_files = []
+    for str_root, _, arr_names in os.walk(str_dir):
+        for str_name in arr_names:
+            str_extension = os.path.splitext(str_name)[1].upper()
+            if str_extension in ['.ZX1', '.ZX2', '.ZXD', '.ROM']:
+                arr_files.append(os.path.join(str_root, str_name))
+    arr_files.sort()
+
+    # Keep stdout only for JSON data
+    LOG_STREAM.stream = sys.stderr
+    release_flash_image()
+    close_ident_cache()
+    http_close_all()
+    with ProcessPoolExecutor(initializer=init_batch_worker,
+                             initargs=(MY_DIRPATH, )) as executor:
+        for dict_res in executor.map(identify_zxfile, arr_files):
+            print(json.dumps(dict_res), file=JSON_STREAM, flush=True)
+
+
+def init_batch_worker(str_json_dir):
+    """
+    Prepare a batch process, loading the hash database only once
+    :param str_json_dir: Directory with the hash database
+    """
+    global BATCH_HASH  # pylint: disable=global-statement
+    global HASH_THREADS  # pylint: disable=global-statement
+    global OUTPUT_FORMAT  # pylint: disable=global-statement
+
+    LOG_STREAM.stream = sys.stderr
+    http_close_all()
+    HASH_THREADS = 1
+    OUTPUT_FORMAT = 'ndjson'
+    BATCH_HASH = load_json_bd(base_dir=str_json_dir, b_caches=True)
+
+
+def identify_zxfile(str_file):
+    """
+    Identify a file, like when listing its contents
+    :param str_file: Path to file
+    :return: Dictionary with file path, kind and the data found
+    """
+    dict_res = {'file': str_file}
+    try:
+        str_extension, dict_hash, filetype = detect_file(str_file, BATCH_HASH)
+        dict_res['kind'] = filetype
+        dict_res['extension'] = str_extension
+        if filetype == 'FlashImage':
+            dict_res.update(list_zxdata(str_file, dict_hash, False))
+            dict_res['roms'], _ = list_romsdata(str_file, BATCH_HASH,
+                                                str_extension, False)
+        elif filetype == 'ROMPack v2':
+            dict_res['roms'], dict_res['default_rom'] = list_romsdata(
+                str_file, BATCH_HASH, 'RPv2', False, True)
+        elif dict_hash:
+            dict_res.update(
+                find_zxfile(str_file, BATCH_HASH, str_extension, False))
+    except Exception as error:  # pylint: disable=broad-except
+        # A malformed file must not stop the rest of the batch
+        dict_res['error'] = str(error) or type(error).__name__
+    finally:
+        release_flash_image(str_file)
+
+    return dict_res
+
+
 def print_stats(fulldict_hash, b_detail=False):
-    """Show Stats"""
+    """
+    Show Stats
+    :return: Dictionary with the number of entries and hashes of each kind
+    """
+    b_text = OUTPUT_FORMAT == 'text'
 
-    print('')
-    printcol(Colours.CYAN, 'JSON Database Stats', end='\n')
-    if 'version' in fulldict_hash:
-        print(f'Version: {fulldict_hash["version"]}')
-    print('')
+    dict_stats = {'version': fulldict_hash.get('version', ''), 'kinds': {}}
+    if b_text:
+        print('')
+        printcol(Colours.CYAN, 'JSON Database Stats', end='\n')
+        if 'version' in fulldict_hash:
+            print(f'Version: {fulldict_hash["version"]}')
+        print('')
 
     total = 0
     total_cores = 0
@@ -770,9 +1320,13 @@ def print_stats(fulldict_hash, b_detail=False):
     total_hashes_cores = 0
     for str_kind in fulldict_hash:
         if str_kind != 'version':
-            printcol(Colours.BLUE,
-                     fulldict_hash[str_kind]['description'],
-                     end='\n')
+            dict_kind = {}
+            dict_kind['description'] = fulldict_hash[str_kind]['description']
+            dict_kind['parts'] = {}
+            if b_text:
+                printcol(Colours.BLUE,
+                         fulldict_hash[str_kind]['description'],
+                         end='\n')
 
             subtotal = 0
             subtotal_hashes = 0
@@ -780,7 +1334,8 @@ def print_stats(fulldict_hash, b_detail=False):
                 if isinstance(fulldict_hash[str_kind][chld], dict):
                     count, part = count_hashes(fulldict_hash[str_kind][chld])
                     if count:
-                        if b_detail:
+                        dict_kind['parts'][chld] = [len(part), count]
+                        if b_detail and b_text:
                             print('')
                             for str_name, h_count in part.items():
                                 printcol(Colours.BLUE,
@@ -793,7 +1348,9 @@ def print_stats(fulldict_hash, b_detail=False):
                                     str_name]
                                 feat_det = dict_det.get('features', {})
                                 print_detail(str_name, feat_det)
-                        print(f'{chld}: {len(part):>4} ({count:03} hashes)')
+                        if b_text:
+                            print(f'{chld}: {len(part):>4} '
+                                  f'({count:03} hashes)')
                         subtotal += len(part)
                         subtotal_hashes += count
 
@@ -804,20 +1361,30 @@ def print_stats(fulldict_hash, b_detail=False):
 
             count, part = count_hashes(fulldict_hash[str_kind])
             if count:
-                print(f'Other: {len(part):>4} ({count:03} hashes)')
+                dict_kind['other'] = [len(part), count]
+                if b_text:
+                    print(f'Other: {len(part):>4} ({count:03} hashes)')
                 total += len(part)
                 subtotal += len(part)
                 subtotal_hashes += count
                 total_hashes += count
 
-            if subtotal:
+            dict_kind['total'] = [subtotal, subtotal_hashes]
+            dict_stats['kinds'][str_kind] = dict_kind
+            if subtotal and b_text:
                 print(f'Total: {subtotal:>4} ({subtotal_hashes:03} hashes)')
                 print('')
 
-    print('')
-    print(f'Total Cores: {total_cores:>4} ({total_hashes_cores:03} hashes)')
-    print(f'      Total: {total:>4} ({total_hashes:03} hashes)')
-    print('')
+    dict_stats['total_cores'] = [total_cores, total_hashes_cores]
+    dict_stats['total'] = [total, total_hashes]
+    if b_text:
+        print('')
+        print(f'Total Cores: {total_cores:>4} '
+              f'({total_hashes_cores:03} hashes)')
+        print(f'      Total: {total:>4} ({total_hashes:03} hashes)')
+        print('')
+
+    return dict_stats
 
 
 def print_detail(str_name, dict_det):
@@ -866,16 +1433,20 @@ def list_zxdata(str_in_file,
     :param hash_dict: Dictionary with hashes for different blocks
     :param show_hashes: If True, print also block hashes
     :param check_updated: If True, check with 'latest', '1core' or '2m'
+    :return: Dictionary with the data found
     """
     LOGGER.debug('Listing contents of file: %s', str_in_file)
+    b_text = OUTPUT_FORMAT == 'text'
     str_name = os.path.basename(str_in_file)
     str_description = hash_dict['description']
 
     dict_res = {}
     dict_res['description'] = str_description
-    print(f'\nContents of {str_name} (possibly {str_description})\n')
+    if b_text:
+        print(f'\nContents of {str_name} (possibly {str_description})\n')
 
     dict_blocks = {}
+    dict_latest = {}
     block_list = ['BIOS', 'esxdos', 'Spectrum', 'Special']
     for block_name in block_list:
         if block_name in hash_dict['parts']:
@@ -885,22 +1456,33 @@ def list_zxdata(str_in_file,
             block_version, block_hash = arr_block
             if block_version:
                 dict_blocks[block_name] = arr_block
-                print(f'{block_name}: {block_version}', end='')
                 if check_updated:
-                    update_check(hash_dict[block_name], block_version,
-                                 get_1core, get_2mb)
-                print('')
-                if show_hashes:
-                    print(f'Hash: {block_hash}')
+                    dict_latest[block_name] = get_latest_version(
+                        hash_dict[block_name], get_1core, get_2mb)
+                if b_text:
+                    print(f'{block_name}: {block_version}', end='')
+                    if check_updated:
+                        update_check(hash_dict[block_name], block_version,
+                                     get_1core, get_2mb)
+                    print('')
+                    if show_hashes:
+                        print(f'Hash: {block_hash}')
 
     dict_cores = {}
     core_list = get_core_list(str_in_file, hash_dict['parts'])
+    arr_versions = get_cores_version(str_in_file, range(len(core_list)),
+                                     hash_dict['parts'], hash_dict['Cores'])
     for index, name in enumerate(core_list):
-        arr_core = get_core_version(str_in_file, index, hash_dict['parts'],
-                                    hash_dict['Cores'])
+        arr_core = arr_versions[index]
         block_name, block_version, block_hash, dict_det = arr_core
 
         dict_cores[index + 2] = [name] + list(arr_core)
+        if check_updated and block_name in hash_dict['Cores']:
+            dict_latest[block_name] = get_latest_version(
+                hash_dict['Cores'][block_name], get_1core, get_2mb)
+        if not b_text:
+            continue
+
         print(
             f'Core {index + 2:02d} "{name}" -> {block_name}: {block_version}',
             end='')
@@ -918,31 +1500,25 @@ def list_zxdata(str_in_file,
             print(f'Core {index + 2:02d}: {block_hash}')
 
     dict_defaults = {}
-    print('\nBIOS Defaults:')
-
-    default_rom = get_peek(str_in_file, 28736)
-    print(f'\tDefault ROM -> {default_rom:02}')
-    dict_defaults['default_rom'] = default_rom
-
-    default_core = get_peek(str_in_file, 28737) + 1
-    print(f'\tDefault Core -> {default_core:02}')
-    dict_defaults['default_core'] = default_core
-
-    boot_timer = get_peek(str_in_file, 28738)
-    print(f'\tBoot Timer -> {boot_timer}')
-    dict_defaults['boot_timer'] = boot_timer
-
-    keyb_layout = get_peek(str_in_file, 28746)
-    print(f'\tKeyboard Layout -> {keyb_layout}')
-    dict_defaults['keyb_layout'] = keyb_layout
-
-    video_mode = get_peek(str_in_file, 28749)
-    print(f'\tVideo Mode -> {video_mode}')
-    dict_defaults['video_mode'] = video_mode
+    dict_defaults['default_rom'] = get_peek(str_in_file, 28736)
+    dict_defaults['default_core'] = get_peek(str_in_file, 28737) + 1
+    dict_defaults['boot_timer'] = get_peek(str_in_file, 28738)
+    dict_defaults['keyb_layout'] = get_peek(str_in_file, 28746)
+    dict_defaults['video_mode'] = get_peek(str_in_file, 28749)
+
+    if b_text:
+        print('\nBIOS Defaults:')
+        print(f'\tDefault ROM -> {dict_defaults["default_rom"]:02}')
+        print(f'\tDefault Core -> {dict_defaults["default_core"]:02}')
+        print(f'\tBoot Timer -> {dict_defaults["boot_timer"]}')
+        print(f'\tKeyboard Layout -> {dict_defaults["keyb_layout"]}')
+        print(f'\tVideo Mode -> {dict_defaults["video_mode"]}')
 
     dict_res['blocks'] = dict_blocks
     dict_res['cores'] = dict_cores
     dict_res['defaults'] = dict_defaults
+    if check_updated:
+        dict_res['latest'] = dict_latest
     return dict_res
 
 
@@ -952,11 +1528,7 @@ def update_check(hash_dict, block_version, get_1core=False, get_2mb=False):
     :param hash_dict: Dictionary for entry (e.g. Spectrum Core)
     :param block_version: Version string to check
     """
-    last_version = hash_dict.get('latest', [''])[0]
-    if (get_2mb or get_1core) and '2m' in hash_dict:
-        last_version = hash_dict['2m'][0]
-    if get_1core and '1core' in hash_dict:
-        last_version = hash_dict['1core'][0]
+    last_version = get_latest_version(hash_dict, get_1core, get_2mb)
 
     if last_version:
         if block_version == last_version:
@@ -969,6 +1541,21 @@ def update_check(hash_dict, block_version, get_1core=False, get_2mb=False):
         LOGGER.debug('Latest entry not found in JSON')
 
 
+def get_latest_version(hash_dict, get_1core=False, get_2mb=False):
+    """
+    Obtain latest version of an entry
+    :param hash_dict: Dictionary for entry (e.g. Spectrum Core)
+    :return: Version string (empty if not found)
+    """
+    last_version = hash_dict.get('latest', [''])[0]
+    if (get_2mb or get_1core) and '2m' in hash_dict:
+        last_version = hash_dict['2m'][0]
+    if get_1core and '1core' in hash_dict:
+        last_version = hash_dict['1core'][0]
+
+    return last_version
+
+
 def list_romsdata(str_in_file,
                   hash_dict,
                   in_file_ext,
@@ -980,36 +1567,48 @@ def list_romsdata(str_in_file,
     :param hash_dict: Dictionary
     :param in_file_ext: File key in dictionary (e.g. ZXD)
     :param show_hashes: If True, print also block hashes
-    :param roms_file: If True, add extra offset as in ROMS.ZX1 file
+    :param roms_file: If True, it's a ROMPack (ROMS.ZX1 or RPv2) file
     :return: True if there are ROMs to list
     """
     LOGGER.debug('Listing ROMs of file: %s', str_in_file)
-    roms_list = get_rom_list(str_in_file, hash_dict[in_file_ext]['parts'])
-
     default_rom = -1
+    if roms_file:
+        with ROMPack(str_in_file, hash_dict, in_file_ext) as rom_pack:
+            roms_list = rom_pack.entries()
+            default_rom = rom_pack.default_rom()
+            arr_versions = rom_pack.rom_versions(roms_list)
+    else:
+        roms_list = get_rom_list(str_in_file, hash_dict[in_file_ext]['parts'])
+        arr_versions = get_roms_version(str_in_file,
+                                        [rom.slot for rom in roms_list],
+                                        [rom.size for rom in roms_list],
+                                        hash_dict, in_file_ext)
+
+    b_text = OUTPUT_FORMAT == 'text'
     dict_res = {}
     if roms_list:
         if roms_file:
-            if in_file_ext == 'RPv2':
-                print('ZX ROMPack file (v2)')
-            else:
-                print('ZX1 ROMPack File')
-            def_addr = int(hash_dict[in_file_ext]['parts']['roms_data'][0])
-            default_rom = get_peek(str_in_file, def_addr)
-            print(f'\tDefault ROM -> {default_rom:02}')
-
-        print('\nZX Spectrum ROMs:')
-        for rom in roms_list:
-            rom_name = rom[2]
-            block_version, block_hash, _ = get_rom(str_in_file, rom[1], rom[3],
-                                                   hash_dict, in_file_ext,
-                                                   roms_file)
-            dict_res[rom[0]] = [
-                rom[1], rom[4], rom[5], rom_name, rom[3] * 16, block_version,
-                block_hash
+            if b_text:
+                if in_file_ext == 'RPv2':
+                    print('ZX ROMPack file (v2)')
+                else:
+                    print('ZX1 ROMPack File')
+                print(f'\tDefault ROM -> {default_rom:02}')
+
+        if b_text:
+            print('\nZX Spectrum ROMs:')
+        for rom, arr_version in zip(roms_list, arr_versions):
+            rom_name = rom.name
+            block_version, block_hash = arr_version
+            dict_res[rom.index] = [
+                rom.slot, rom.flags, rom.crc, rom_name, rom.size * 16,
+                block_version, block_hash
             ]
-            str_rominfo = f' {rom[0]:02d} (Slot {rom[1]:02d}) {rom[4]:>10} ({rom[5]:>16}) '
-            str_rominfo += f'"{rom_name}" {rom[3] * 16}K -> {block_version}'
+            if not b_text:
+                continue
+
+            str_rominfo = f' {rom.index:02d} (Slot {rom.slot:02d}) {rom.flags:>10} ({rom.crc:>16}) '
+            str_rominfo += f'"{rom_name}" {rom.size * 16}K -> {block_version}'
             print(str_rominfo)
 
             if show_hashes:
@@ -1037,10 +1636,6 @@ def extractfrom_zxdata(str_in_file,
     """
     hash_dict = fullhash_dict[str_extension]
 
-    b_romfile = False
-    if str_extension == 'RPv2':
-        b_romfile = True
-
     block_list = ['BIOS', 'esxdos', 'Spectrum', 'Special']
     for block_name in block_list:
         if block_name in hash_dict['parts']:
@@ -1049,7 +1644,7 @@ def extractfrom_zxdata(str_in_file,
                 block_version, _ = get_version(str_in_file,
                                                hash_dict['parts'][block_name],
                                                hash_dict[block_name])
-                print(f'Extracting {block_name}...')
+                print(f'Extracting {block_name}...', file=MSG_STREAM)
                 block_info = hash_dict['parts'][block_name]
                 str_bin = f'{block_name}_{block_version}.{str_extension}'
                 str_bin = os.path.join(str_dir, str_bin)
@@ -1064,7 +1659,7 @@ def extractfrom_zxdata(str_in_file,
             core_number = int(extract_item)
             core_list = get_core_list(str_in_file, hash_dict['parts'])
             if core_number > 1 and core_number < (len(core_list) + 2):
-                print(f'Extracting Core {core_number}...')
+                print(f'Extracting Core {core_number}...', file=MSG_STREAM)
                 core_number -= 2
                 core_name = core_list[core_number].strip()
                 block_name, block_version, _, _ = get_core_version(
@@ -1072,15 +1667,13 @@ def extractfrom_zxdata(str_in_file,
                     hash_dict['Cores'])
                 if block_name == 'Unknown':
                     block_name = core_name
-                splitcore_index = int(hash_dict['parts']['cores_dir'][4])
-                core_bases = hash_dict['parts']['core_base']
-                block_data = get_core_blockdata(core_number, splitcore_index,
-                                                core_bases)
+                layout = get_layout(hash_dict['parts'])
+                block_data = layout.core_block(core_number)
                 str_bin = f'CORE{core_number + 2:02d}'
                 str_bin += f'_{block_name.replace(" ", "_")}_v{block_version}'
                 str_bin += f'.{str_extension}'
                 str_bin = os.path.join(str_dir, str_bin)
-                core_magic = core_bases[3]
+                core_magic = layout.magic['core_base']
                 validate_and_export_bin(str_in_file, block_data, str_bin,
                                         b_force, core_magic)
             else:
@@ -1091,16 +1684,23 @@ def extractfrom_zxdata(str_in_file,
             rom_number = int(extract_item)
             rom_list = get_rom_list(str_in_file, hash_dict['parts'])
             if rom_number > -1 and rom_number < len(rom_list):
-                print(f'Extracting ZX Spectrum ROM {rom_number}...')
+                print(f'Extracting ZX Spectrum ROM {rom_number}...',
+                      file=MSG_STREAM)
                 for rom in rom_list:
-                    if rom[0] == rom_number:
-                        rom_version, _, rom_data = get_rom(
-                            str_in_file, rom[1], rom[3], fullhash_dict,
-                            str_extension, b_romfile)
-                        rom_name = rom[2].strip()
+                    if rom.index == rom_number:
+                        if str_extension == 'RPv2':
+                            with ROMPack(str_in_file,
+                                         fullhash_dict) as rom_pack:
+                                rom_version, _ = rom_pack.rom_version(rom)
+                                rom_data = rom_pack.rom_data(rom)
+                        else:
+                            rom_version, _, rom_data = get_rom(
+                                str_in_file, rom.slot, rom.size,
+                                fullhash_dict, str_extension)
+                        rom_name = rom.name.strip()
                         if rom_version != 'Unknown':
                             rom_name = rom_version.strip()
-                        str_bin = f'{rom[0]:02d}_{rom_name}.rom'
+                        str_bin = f'{rom.index:02d}_{rom_name}.rom'
                         str_bin = os.path.join(str_dir, str_bin)
                         export_bindata(rom_data, str_bin, b_force)
                         break
@@ -1110,27 +1710,23 @@ def extractfrom_zxdata(str_in_file,
     if extract_item.upper() == 'ROMS':
         # Extract all ZX Spectrum ROMs to ROMPack v1 file
         default_rom = get_peek(str_in_file, 28736).to_bytes(1, 'little')
-        rom_dict_parts = fullhash_dict['ROMS']['parts']
-        blk_info = rom_dict_parts['roms_dir']
-        blk_bases = rom_dict_parts['roms_data']
-        roms_data = 0x1000 * b'\x00' + 0x40 * b'\xff' + default_rom
-        roms_data += 0x100000 * b'\x00'
+        rom_layout = get_layout(fullhash_dict['ROMS']['parts'])
+        roms_data = bytearray(0x1000 * b'\x00' + 0x40 * b'\xff' + default_rom)
+        roms_data += bytes(0x100000)
         roms_list = get_rom_list(str_in_file, hash_dict['parts'])
         for rom_item in roms_list:
-            rom_index = rom_item[0]
-            rom_slt = rom_item[1]
-            rom_name = rom_item[2]
-            rom_params = rom_item[4]
-            rom_crc = rom_item[5]
+            rom_index = rom_item.index
+            rom_slt = rom_item.slot
+            rom_name = rom_item.name
+            rom_params = rom_item.flags
+            rom_crc = rom_item.crc
 
             rom_version, _, rom_data = get_rom(str_in_file, rom_slt,
-                                               rom_item[3], fullhash_dict,
+                                               rom_item.size, fullhash_dict,
                                                str_extension)
 
-            roms_data, _ = inject_rom_tobin(roms_data, blk_info, blk_bases,
-                                            rom_index, rom_slt, rom_name,
-                                            rom_params, rom_data, rom_crc,
-                                            True)
+            inject_rom_tobin(roms_data, rom_layout, rom_index, rom_slt,
+                             rom_name, rom_params, rom_data, rom_crc, True)
 
         str_bin = 'ROMS.ZX1'
         str_bin = os.path.join(str_dir, str_bin)
@@ -1145,11 +1741,13 @@ def prep_update_zxdata(arr_in_files,
                        b_varcade='',
                        get_1core=False,
                        get_2mb=False,
-                       w_progress=None):
+                       w_progress=None,
+                       dl_queue=None):
     """
     Try to prepare to update several BIOS
     :param str_spi_file: Input SPI flash file
     :param hash_dict: Dictionary with hashes for different blocks
+    :param dl_queue: DownloadQueue where downloads are added
     :return: A valid array for inject_zxfiles
     """
 
@@ -1186,7 +1784,8 @@ def prep_update_zxdata(arr_in_files,
                                                 latest_hash,
                                                 latest[1:],
                                                 block,
-                                                w_progress=w_progress)
+                                                w_progress=w_progress,
+                                                dl_queue=dl_queue)
 
                     if b_append:
                         arr_in_files.append(f'{block},{str_file}')
@@ -1200,7 +1799,8 @@ def prep_update_cores(arr_in_files,
                       arcade_type='None',
                       get_1core=False,
                       get_2mb=False,
-                      w_progress=None):
+                      w_progress=None,
+                      dl_queue=None):
     """
     Try to prepare to update cores
     :param arr_in_files: Array for inject_zxfiles, updated if needed
@@ -1208,6 +1808,7 @@ def prep_update_cores(arr_in_files,
     :param hash_dict: Dictionary with hashes for different blocks
     :b_new: Is this a new Flash Image?
     :b_arcade: When new, only include arcades, else do not include any arcade
+    :param dl_queue: DownloadQueue where downloads are added
     """
 
     hash_dict = fullhash_dict[str_extension]
@@ -1215,10 +1816,12 @@ def prep_update_cores(arr_in_files,
     core_list = []
     tmp_list = get_core_list(str_spi_file, hash_dict['parts'])
     if tmp_list:
+        arr_versions = get_cores_version(str_spi_file, range(len(tmp_list)),
+                                         hash_dict['parts'],
+                                         hash_dict['Cores'])
         for index, name in enumerate(tmp_list):
-            core_list.append([index, name.strip()] + list(
-                get_core_version(str_spi_file, index, hash_dict['parts'],
-                                 hash_dict['Cores']))[:-1])
+            core_list.append([index, name.strip()] +
+                             arr_versions[index][:-1])
 
     if b_new:
         for index, block_name in enumerate(hash_dict['Cores']):
@@ -1263,7 +1866,8 @@ def prep_update_cores(arr_in_files,
                                             block_hash,
                                             base_hash,
                                             base[1:],
-                                            w_progress=w_progress)
+                                            w_progress=w_progress,
+                                            dl_queue=dl_queue)
 
                 if b_append:
                     new_in_file = f'CORE,{index},{name},{str_file}'
@@ -1274,11 +1878,13 @@ def prep_update_roms(arr_in_files,
                      fullhash_dict,
                      str_extension,
                      b_new=False,
-                     b_arcade=False):
+                     b_arcade=False,
+                     dl_queue=None):
     """
     Try to prepare to update ROMs
     :param arr_in_files: Array for inject_zxfiles, updated if needed
     :param fullhash_dict: Dictionary with hashes data
+    :param dl_queue: DownloadQueue where downloads are added
     :b_new: Is this a new Flash Image?
     """
 
@@ -1291,7 +1897,11 @@ def prep_update_roms(arr_in_files,
         latest_hash = hash_versions[latest[0]]
 
         str_roms = os.path.join(STR_OUTDIR, 'ROMS.ZX1')
-        b_append = check_and_update(str_roms, latest_hash, latest[1:], 'ROMS')
+        b_append = check_and_update(str_roms,
+                                    latest_hash,
+                                    latest[1:],
+                                    'ROMS',
+                                    dl_queue=dl_queue)
 
         if b_append:
             new_in_file = f'ROMS,{str_roms}'
@@ -1300,13 +1910,18 @@ def prep_update_roms(arr_in_files,
         if b_arcade:
             b_append = False
             jamma = fullhash_dict['ROM']['16K Spectrum ROM']['arcade']
-            j_hash = fullhash_dict['ROM']['16K Spectrum ROM'][jamma[0]]
+            j_hash = fullhash_dict['ROM']['16K Spectrum ROM']['versions'][
+                jamma[0]]
 
             str_rom = os.path.join(STR_OUTDIR, 'Jamma.rom')
-            b_append = check_and_update(str_rom, j_hash, jamma[1:], 'Jamma')
+            b_append = check_and_update(str_rom,
+                                        j_hash,
+                                        jamma[1:],
+                                        'Jamma',
+                                        dl_queue=dl_queue)
             if b_append:
-                roms_info = fullhash_dict[str_extension]['parts']['roms_dir']
-                i_slot = roms_info[5] + roms_info[6] - 1
+                layout = get_layout(fullhash_dict[str_extension]['parts'])
+                i_slot = layout.max_roms - 1
                 new_in_file = f'ROM,{i_slot},hl17x,Jamma,{str_rom}'
                 arr_in_files.append(new_in_file)
 
@@ -1318,7 +1933,8 @@ def check_and_update(update_file,
                      uchk='',
                      bs_hash='',
                      bs_urls=None,
-                     w_progress=None):
+                     w_progress=None,
+                     dl_queue=None):
     """
     Checks if a file with the desired hash exists. Download from the URL if not
     :param update_file: Path to the file
@@ -1328,16 +1944,17 @@ def check_and_update(update_file,
     :param uchk: Control text to download older versions
     :param bs_hash: Base hash (fallback if there's not latest)
     :param bs_urls: Base download URIs
-    :returns: True if a new file was needed, found and downloaded
+    :param dl_queue: DownloadQueue. If set, the download is only added to it
+    :returns: True if a new file was needed, found and downloaded (or queued)
     """
 
     if not bs_urls:
         bs_urls = []
     update_url = ''
     file_hash = ''
-    update_extension = os.path.splitext(update_file)[1].upper()
     dl_result = False
-    if os.path.isfile(update_file):
+    b_plan = dl_queue is not None and dl_queue.dry_run
+    if not b_plan and os.path.isfile(update_file):
         file_hash = get_file_hash(update_file)
         if file_hash == upd_hash:
             LOGGER.debug('Not downloading, already available: %s', update_file)
@@ -1351,175 +1968,1354 @@ def check_and_update(update_file,
             LOGGER.debug('Not downloading base, available: %s', update_file)
             dl_result = True
         update_url = bs_urls[0]
+        upd_hash = bs_hash
+
+    if not (dl_result or b_plan) and update_url and get_mirror_file(
+            update_url, upd_hash, update_file):
+        LOGGER.debug('Not downloading, found in mirror: %s', update_file)
+        dl_result = True
+
+    if not (dl_result or b_plan) and update_url and get_cached_download(
+            upd_hash, update_file):
+        LOGGER.debug('Not downloading, found in cache: %s', update_file)
+        dl_result = True
 
     if not dl_result and update_url:
+        if dl_queue is not None:
+            dl_queue.add(update_url, update_file, upd_hash, upd_name)
+            return True
+
         str_message = f'Downloading {upd_name}...'
         if w_progress:
             w_progress.update(str_message)
         else:
-            print(str_message, end='')
-        try:
-            LOGGER.debug(update_url)
-            urllib.request.urlretrieve(update_url, update_file)
-            if is_zipfile(update_file):
-                str_message = 'Extracting...'
-                if w_progress:
-                    w_progress.update(str_message)
-                else:
-                    print(str_message, end='')
-                b_found = False
-                str_zipfile = update_file + '.zip'
-                os.rename(update_file, str_zipfile)
-                with ZipFile(str_zipfile, 'r') as zip_obj:
-                    arr_files = zip_obj.namelist()
-                    b_found = False
-                    for str_name in arr_files:
-                        str_extension = os.path.splitext(str_name)[1].upper()
-                        if update_extension == str_extension:
-                            with tempfile.TemporaryDirectory() as str_tmpdir:
-                                zip_obj.extract(str_name, str_tmpdir)
-                                str_file = os.path.join(str_tmpdir, str_name)
-                                shutil.move(str_file, update_file)
-                            b_found = True
-                            break
-                if not b_found:
-                    LOGGER.warning('Not a valid ZIP file')
-                os.remove(str_zipfile)
-            print('OK')
+            print(str_message, end='', file=MSG_STREAM)
+        str_err = fetch_update(update_url, update_file, upd_hash)
+        if str_err:
+            print(str_err, file=MSG_STREAM)
+        else:
+            print('OK', file=MSG_STREAM)
             dl_result = True
-        except urllib.error.HTTPError:
-            print('Error! Is the JSON file up to date?')
 
     return dl_result
 
 
-def update_image(str_file,
-                 str_output_file,
-                 fullhash_dict,
-                 str_extension,
-                 str_update,
-                 b_new_img,
-                 b_force,
-                 get_1core,
-                 get_2mb,
-                 w_progress=None):
+def http_open(str_url,
+              dict_headers=None,
+              str_method='GET',
+              b_gzip=False,
+              timeout=DL_TIMEOUT):
     """
-    Update Image File
-    :param str_file: Input SPI flash file
-    :param str_outfile: New SPI flash file to create
-    :param fullhash_dict: Dictionary with hashes data
-    :param str_extension: SPI Flash extension
-    :param str_update: String with update requirements (as 'All', 'BIOS, etc.)
-    :param b_new_img: If True, assume it's a brand, new, clean image
-    :param b_force: Force overwriting file
-    :param get_1core: Use "1core" entries of JSON
-    :param get_2mb: Use "2m" entries of JSON
-    :returns Created or updated image file name, updated b_force
+    Make an HTTP request using a persistent connection to the host, taken
+    from a shared pool, following redirects. Like urllib.request.urlopen,
+    raises HTTPError for error (and 304) responses
+    :param str_url: URL to request
+    :param dict_headers: Dictionary with extra headers
+    :param str_method: HTTP method ('GET' or 'HEAD')
+    :param b_gzip: Accept gzip compressed content, and decompress it
+    :param timeout: Timeout in seconds for connecting and reading
+    :return: HTTPResponse object, to be used as a context manager
+    :raises urllib.error.HTTPError: If the response is an error
+    :raises urllib.error.URLError: If the host can't be reached
     """
-    arr_upd = []
-    if str_update.lower() in ['all', 'bios']:
-        prep_update_zxdata(arr_upd,
-                           str_file,
-                           fullhash_dict,
-                           str_extension, ['BIOS'],
-                           w_progress=w_progress)
-    if str_update.lower() in ['all', 'spectrum']:
-        prep_update_zxdata(arr_upd,
-                           str_file,
-                           fullhash_dict,
-                           str_extension, ['Spectrum'],
-                           get_1core=get_1core,
-                           get_2mb=get_2mb,
-                           w_progress=w_progress)
-    if str_update.lower() in ['all', 'special']:
-        prep_update_zxdata(arr_upd,
-                           str_file,
-                           fullhash_dict,
-                           str_extension, ['Special'],
-                           w_progress=w_progress)
-    if str_update.lower() in ['all', 'cores']:
-        prep_update_cores(arr_upd,
-                          str_file,
-                          fullhash_dict,
-                          str_extension,
-                          b_new_img,
-                          get_1core=get_1core,
-                          get_2mb=get_2mb,
-                          w_progress=w_progress)
-    if b_new_img or str_update.lower() == 'roms':
-        prep_update_roms(arr_upd, fullhash_dict, str_extension, b_new_img)
-    if str_update.lower() == 'arcade':
-        prep_update_zxdata(arr_upd,
-                           str_file,
-                           fullhash_dict,
-                           str_extension, ['BIOS'],
-                           w_progress=w_progress)
-        prep_update_cores(arr_upd,
-                          str_file,
-                          fullhash_dict,
-                          str_extension,
-                          b_new_img,
-                          'arcade',
-                          w_progress=w_progress)
-        prep_update_roms(arr_upd, fullhash_dict, str_extension, b_new_img,
-                         True)
-    if str_update.lower() == 'varcade':
-        prep_update_zxdata(arr_upd,
-                           str_file,
-                           fullhash_dict,
-                           str_extension, ['BIOS'],
-                           True,
-                           w_progress=w_progress)
-        prep_update_cores(arr_upd,
-                          str_file,
-                          fullhash_dict,
-                          str_extension,
-                          b_new_img,
-                          'varcade',
-                          w_progress=w_progress)
-        prep_update_roms(arr_upd, fullhash_dict, str_extension, b_new_img,
-                         True)
-
-    if arr_upd:
-        if inject_zxfiles(str_file,
-                          arr_upd,
-                          str_output_file,
-                          fullhash_dict,
-                          str_extension,
-                          b_force=b_force,
-                          w_progress=w_progress)[0]:
-            b_force = True
-            str_file = str_output_file
-    else:
-        print('Nothing to update')
+    dict_headers = dict(dict_headers or {})
+    if b_gzip:
+        dict_headers['Accept-Encoding'] = 'gzip'
+
+    url_parts = urllib.parse.urlsplit(str_url)
+    if url_parts.scheme not in ('http', 'https') or (
+            url_parts.scheme in urllib.request.getproxies()
+            and not urllib.request.proxy_bypass(url_parts.hostname)):
+        # Proxies and other schemes are left to urllib
+        url_req = urllib.request.Request(str_url,
+                                         headers=dict_headers,
+                                         method=str_method)
+        return HTTPResponse(urllib.request.urlopen(url_req, timeout=timeout),
+                            str_url)
+
+    for _ in range(HTTP_MAX_REDIRECTS + 1):
+        conn_key, http_conn, url_resp = http_request(str_url, dict_headers,
+                                                     str_method, timeout)
+        if url_resp.status in (301, 302, 303, 307, 308):
+            str_location = url_resp.getheader('Location', '')
+            url_resp.read()
+            http_release(conn_key, http_conn, url_resp)
+            if not str_location:
+                raise urllib.error.HTTPError(str_url, url_resp.status,
+                                             url_resp.reason,
+                                             url_resp.headers, None)
+            str_url = urllib.parse.urljoin(str_url, str_location)
+            if url_resp.status == 303:
+                str_method = 'GET'
+            continue
+
+        if url_resp.status >= 300:
+            url_resp.read()
+            http_release(conn_key, http_conn, url_resp)
+            raise urllib.error.HTTPError(str_url, url_resp.status,
+                                         url_resp.reason, url_resp.headers,
+                                         None)
+
+        return HTTPResponse(url_resp, str_url, conn_key, http_conn)
+
+    raise urllib.error.HTTPError(str_url, 310, 'Too many redirects', None,
+                                 None)
+
+
+def http_request(str_url, dict_headers, str_method, timeout):
+    """
+    Send a request, reusing an idle connection to the host if there's one.
+    If a reused connection has been closed by the server, tries again with
+    a new one
+    :param str_url: URL to request
+    :param dict_headers: Dictionary with headers
+    :param str_method: HTTP method
+    :param timeout: Timeout in seconds
+    :return: Connection key, connection and http.client.HTTPResponse
+    :raises urllib.error.URLError: If the host can't be reached
+    """
+    url_parts = urllib.parse.urlsplit(str_url)
+    conn_key = (url_parts.scheme, url_parts.netloc)
+    str_path = url_parts.path or '/'
+    if url_parts.query:
+        str_path += f'?{url_parts.query}'
+
+    while True:
+        b_reused = False
+        with HTTP_LOCK:
+            if HTTP_CONNS.get(conn_key):
+                http_conn = HTTP_CONNS[conn_key].pop()
+                b_reused = True
+        if not b_reused:
+            if url_parts.scheme == 'https':
+                http_conn = http.client.HTTPSConnection(url_parts.netloc,
+                                                        timeout=timeout)
+            else:
+                http_conn = http.client.HTTPConnection(url_parts.netloc,
+                                                       timeout=timeout)
+        http_conn.timeout = timeout
+        if http_conn.sock:
+            http_conn.sock.settimeout(timeout)
 
-    return str_file, b_force
+        try:
+            http_conn.request(str_method, str_path, headers=dict_headers)
+            return conn_key, http_conn, http_conn.getresponse()
+        except (OSError, http.client.HTTPException) as error:
+            http_conn.close()
+            if not b_reused:
+                raise urllib.error.URLError(error) from error
+            LOGGER.debug('Connection to %s closed, retrying', conn_key[1])
 
 
-def expand_image(str_spi_file, str_outfile, flash_len, b_force=False):
+def http_release(conn_key, http_conn, url_resp):
     """
-    Expands, if needed, an image file
-    :param str_spi_file: Input SPI flash file
-    :param str_outfile: New SPI flash file to create
-    :param flash_len: Desired size, in bytes
-    :param b_force: Force overwriting file
+    Return a connection to the pool if it can be used again, or close it
+    :param conn_key: Connection key (scheme and host)
+    :param http_conn: http.client connection
+    :param url_resp: Last response of the connection
     """
+    if url_resp.isclosed() and not (url_resp.will_close or url_resp.length):
+        with HTTP_LOCK:
+            arr_idle = HTTP_CONNS.setdefault(conn_key, [])
+            if len(arr_idle) < HTTP_MAX_IDLE:
+                arr_idle.append(http_conn)
+                return
+    url_resp.close()
+    http_conn.close()
 
-    b_len = os.stat(str_spi_file).st_size
-    if b_len < flash_len:
+
+def http_close_all():
+    """Close all idle connections"""
+    with HTTP_LOCK:
+        for arr_idle in HTTP_CONNS.values():
+            for http_conn in arr_idle:
+                http_conn.close()
+        HTTP_CONNS.clear()
+
+
+atexit.register(http_close_all)
+
+
+class HTTPResponse:
+    """
+    Response of http_open, which decompresses gzip content and gives back
+    the connection to the pool when closed
+    """
+
+    def __init__(self, url_resp, str_url, conn_key=None, http_conn=None):
+        """
+        :param url_resp: http.client (or urllib) response
+        :param str_url: Final URL, after redirects
+        :param conn_key: Connection key, if the connection is pooled
+        :param http_conn: http.client connection, if pooled
+        """
+        self.url_resp = url_resp
+        self.url = str_url
+        self.status = url_resp.status
+        self.headers = url_resp.headers
+        self.conn_key = conn_key
+        self.http_conn = http_conn
+        self.decompressor = None
+        if self.headers.get('Content-Encoding', '') == 'gzip':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def read(self, amt=None):
+        """
+        Read (and decompress, if needed) data
+        :param amt: Max amount of data to read (all if None)
+        :return: Bytes with the data (empty at the end)
+        """
+        if not self.decompressor:
+            return self.url_resp.read(amt)
+
+        b_data = b''
+        while not b_data:
+            b_raw = self.url_resp.read(amt)
+            if not b_raw:
+                return self.decompressor.flush()
+            b_data = self.decompressor.decompress(b_raw)
+
+        return b_data
+
+    def close(self):
+        """Close the response, and release its connection"""
+        if self.http_conn:
+            http_release(self.conn_key, self.http_conn, self.url_resp)
+            self.http_conn = None
+        else:
+            self.url_resp.close()
+
+
+def get_content_total(url_data, i_pos):
+    """
+    Obtain the full length of a file being downloaded from a Range response
+    :param url_data: HTTPResponse object
+    :param i_pos: Position asked with the Range header
+    :return: Total length (-1 if unknown), or -2 if the response doesn't
+     continue from i_pos
+    """
+    if url_data.status != 206:
+        return -2
+
+    str_range = url_data.headers.get('Content-Range', '')
+    if not str_range.startswith(f'bytes {i_pos}-'):
+        return -2
+
+    str_total = str_range.rpartition('/')[2]
+    if str_total.isdigit():
+        return int(str_total)
+
+    return -1
+
+
+def download_file(dl_url, str_file):
+    """
+    Download a file to a temporary .part file, resuming it (with a Range
+    request) if the transfer is interrupted or if it was left unfinished by
+    a previous run. Retries wait exponentially longer each time.
+    :param dl_url: URL to download
+    :param str_file: Path to the file (the data is written to str_file.part)
+    :return: Path to the .part file and sha256 hash object of its contents
+    :raises urllib.error.URLError: If the file can't be downloaded
+    """
+    str_part = f'{str_file}.part'
+    last_error = None
+    for i_try in range(DL_RETRIES):
+        if i_try:
+            LOGGER.debug('Retrying %s (%s): %s', dl_url, i_try, last_error)
+            time.sleep(DL_BACKOFF * 2**(i_try - 1))
+
+        i_pos = 0
+        file_hash = hashlib.sha256()
+        if os.path.isfile(str_part):
+            with open(str_part, 'rb') as in_data:
+                for dl_data in iter(lambda: in_data.read(DL_CHUNK_LEN), b''):
+                    file_hash.update(dl_data)
+                    i_pos += len(dl_data)
+
+        dict_headers = {}
+        if i_pos:
+            dict_headers['Range'] = f'bytes={i_pos}-'
+        try:
+            with http_open(dl_url, dict_headers) as url_data:
+                str_mode = 'ab'
+                i_len = get_content_total(url_data, i_pos)
+                if i_len == -2:
+                    # Range not supported (or not the asked one): start again
+                    str_mode = 'wb'
+                    file_hash = hashlib.sha256()
+                    i_pos = 0
+                    i_len = int(url_data.headers.get('Content-Length', -1))
+                with open(str_part, str_mode) as out_data:
+                    for dl_data in iter(lambda: url_data.read(DL_CHUNK_LEN),
+                                        b''):
+                        file_hash.update(dl_data)
+                        out_data.write(dl_data)
+                        i_pos += len(dl_data)
+            if -1 < i_len != i_pos:
+                # Connection closed before the end: resume it
+                raise http.client.IncompleteRead(b'', i_len - i_pos)
+            return str_part, file_hash
+        except urllib.error.HTTPError as error:
+            if error.code == 416 and i_pos:
+                str_range = error.headers.get('Content-Range', '')
+                if str_range == f'bytes */{i_pos}':
+                    # Already complete
+                    return str_part, file_hash
+                os.remove(str_part)
+            elif error.code < 500:
+                raise
+            last_error = error
+        except (urllib.error.URLError, OSError,
+                http.client.HTTPException) as error:
+            last_error = error
+
+    if isinstance(last_error, urllib.error.URLError):
+        raise last_error
+    raise urllib.error.URLError(last_error)
+
+
+def fetch_update(update_url, update_file, upd_hash=''):
+    """
+    Download a file (extracting it if it's inside a ZIP file) and verify it,
+    hashing the data while it's received. The file is only created (or
+    replaced) if the hash is correct. Interrupted downloads are kept, so
+    they can be resumed later
+    :param update_url: URL to download
+    :param update_file: Path to the file
+    :param upd_hash: Hash to check (not checked if empty)
+    :returns: Error string (empty when no error)
+    """
+    str_part = ''
+    str_tmp = f'{update_file}.tmp'
+    str_err = ''
+    try:
+        LOGGER.debug(update_url)
+        if urllib.parse.urlparse(update_url).path.upper().endswith('.ZIP'):
+            # Only the wanted member is written, never the whole ZIP file
+            str_part = str_tmp
+            file_hash = fetch_remote_member(update_url, update_file, str_tmp)
+            if not file_hash:
+                file_hash = fetch_zip_member(update_url, update_file,
+                                             str_tmp)
+        else:
+            str_part, file_hash = download_file(update_url, update_file)
+            with open(str_part, 'rb') as in_data:
+                b_zip = in_data.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+            if b_zip:
+                # ZIP file served from a URL without .zip extension
+                file_hash = extract_update(str_part, update_file, str_tmp)
+                if file_hash:
+                    os.replace(str_tmp, str_part)
+    except urllib.error.HTTPError:
+        str_err = 'Error! Is the JSON file up to date?'
+    except (urllib.error.URLError, OSError,
+            http.client.HTTPException) as error:
+        str_err = f'Error! {error}'
+        str_part = ''
+    except BadZipFile as error:
+        str_err = f'Error! {error}'
+
+    if not str_err:
+        if not file_hash:
+            str_err = 'Error! Not a valid ZIP file'
+        elif upd_hash and file_hash.hexdigest() != upd_hash:
+            str_err = 'Error! Downloaded file is not valid'
+
+    if str_err:
+        # Keep interrupted downloads, but not invalid ones
+        for str_rm in [str_part, str_tmp]:
+            if str_rm and os.path.isfile(str_rm):
+                os.remove(str_rm)
+        return str_err
+
+    os.replace(str_part, update_file)
+    if upd_hash:
+        store_cached_download(update_file, upd_hash)
+
+    return ''
+
+
+def fetch_remote_member(update_url, update_file, str_part):
+    """
+    Extract the member of a remote ZIP file with the same extension as the
+    update file, downloading only the central directory and the data of that
+    member
+    :param update_url: URL of the ZIP file
+    :param update_file: Path to the update file
+    :param str_part: Path to the file where the member is written
+    :returns: sha256 hash object of the extracted data, or None if not
+     possible (e.g. the server does not support ranges)
+    """
+    try:
+        with RemoteFile(update_url) as remote_data:
+            file_hash = extract_update(remote_data, update_file, str_part)
+            LOGGER.debug('%s: %s of %s bytes read', update_url,
+                         remote_data.bytes_read, remote_data.size)
+            return file_hash
+    except (ValueError, BadZipFile, urllib.error.URLError, OSError,
+            http.client.HTTPException) as error:
+        LOGGER.debug('Remote ZIP not available (%s): %s', update_url, error)
+        if os.path.isfile(str_part):
+            os.remove(str_part)
+
+    return None
+
+
+def fetch_zip_member(update_url, update_file, str_part):
+    """
+    Extract the member of a remote ZIP file with the same extension as the
+    update file while the ZIP file is downloaded, for servers that don't
+    support ranges
+    :param update_url: URL of the ZIP file
+    :param update_file: Path to the update file
+    :param str_part: Path to the file where the member is written
+    :returns: sha256 hash object of the extracted data, or None if not found
+    """
+    with http_open(update_url) as url_data:
+        return stream_update(StreamReader(url_data), update_file, str_part)
+
+
+class RemoteFile:
+    """
+    Read only, seekable, access to a remote file using HTTP Range requests,
+    reading ahead to avoid too many small requests
+    """
+
+    def __init__(self, str_url, read_ahead=DL_RANGE_LEN):
+        """
+        Get the size of the file and its last bytes (where the central
+        directory of a ZIP file is)
+        :param str_url: URL of the file
+        :param read_ahead: Minimum amount of data obtained with each request
+        :raises ValueError: If the server does not support ranges
+        """
+        self.str_url = str_url
+        self.read_ahead = read_ahead
+        self.pos = 0
+        self.size = 0
+        self.bytes_read = 0
+        self.buf_pos = 0
+        self.buf = b''
+        self.get_range(f'-{read_ahead}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get_range(self, str_range):
+        """
+        Download a range of bytes and keep it as the current buffer
+        :param str_range: Range in HTTP format (e.g. '100-199' or '-100')
+        :raises ValueError: If the server does not return a valid range
+        """
+        with http_open(self.str_url,
+                       {'Range': f'bytes={str_range}'}) as url_data:
+            str_content = url_data.headers.get('Content-Range', '')
+            if url_data.status != 206 or not str_content.startswith('bytes '):
+                raise ValueError('Range requests not supported')
+            arr_range = str_content[6:].replace('/', '-').split('-')
+            self.buf_pos = int(arr_range[0])
+            self.size = int(arr_range[2])
+            self.buf = url_data.read()
+        self.bytes_read += len(self.buf)
+
+    def seekable(self):
+        """
+        :return: Always True
+        """
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Change the current position
+        :param offset: New position, relative to whence
+        :param whence: os.SEEK_SET, os.SEEK_CUR or os.SEEK_END
+        :return: New position
+        """
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        """
+        :return: Current position
+        """
+        return self.pos
+
+    def read(self, size=-1):
+        """
+        Read data from the current position, downloading it if it's not in
+        the buffer
+        :param size: Number of bytes (all the remaining data if negative)
+        :return: Bytes with the data
+        """
+        i_end = self.size
+        if size is not None and size >= 0:
+            i_end = min(self.pos + size, self.size)
+        if self.pos >= i_end:
+            return b''
+
+        buf_end = self.buf_pos + len(self.buf)
+        if self.pos < self.buf_pos or i_end > buf_end:
+            i_last = min(max(i_end, self.pos + self.read_ahead), self.size)
+            self.get_range(f'{self.pos}-{i_last - 1}')
+
+        b_data = self.buf[self.pos - self.buf_pos:i_end - self.buf_pos]
+        self.pos += len(b_data)
+        return b_data
+
+    def close(self):
+        """Discard the buffer"""
+        self.buf = b''
+
+
+def extract_update(zip_data, update_file, str_part):
+    """
+    Extract the member of a ZIP file with the same extension as the update
+    file, hashing it while it's written
+    :param zip_data: Path or file object with the ZIP file data
+    :param update_file: Path to the update file
+    :param str_part: Path to the file where the member is written
+    :returns: sha256 hash object of the extracted data, or None if not found
+    """
+    update_extension = os.path.splitext(update_file)[1].upper()
+    with ZipFile(zip_data, 'r') as zip_obj:
+        for str_name in zip_obj.namelist():
+            str_extension = os.path.splitext(str_name)[1].upper()
+            if update_extension == str_extension:
+                file_hash = hashlib.sha256()
+                with zip_obj.open(str_name) as in_data, open(
+                        str_part, 'wb') as out_data:
+                    dl_data = in_data.read(DL_CHUNK_LEN)
+                    while dl_data:
+                        file_hash.update(dl_data)
+                        out_data.write(dl_data)
+                        dl_data = in_data.read(DL_CHUNK_LEN)
+                return file_hash
+
+    LOGGER.warning('Not a valid ZIP file')
+    return None
+
+
+class StreamReader:
+    """Sequential reader of a stream, where read data can be put back"""
+
+    def __init__(self, in_data):
+        """
+        :param in_data: File object (or HTTP response) to read
+        """
+        self.in_data = in_data
+        self.buf = b''
+
+    def read(self, size):
+        """
+        Read data (less than asked only at the end of the stream)
+        :param size: Number of bytes
+        :return: Bytes with the data
+        """
+        b_data = self.buf[:size]
+        self.buf = self.buf[size:]
+        while len(b_data) < size:
+            in_data = self.in_data.read(size - len(b_data))
+            if not in_data:
+                break
+            b_data += in_data
+
+        return b_data
+
+    def read_exact(self, size):
+        """
+        Read data
+        :param size: Number of bytes
+        :return: Bytes with the data
+        :raises BadZipFile: If the stream ends before
+        """
+        b_data = self.read(size)
+        if len(b_data) < size:
+            raise BadZipFile('Truncated ZIP data')
+
+        return b_data
+
+    def unread(self, b_data):
+        """
+        Put back data, so it's read again
+        :param b_data: Bytes with the data
+        """
+        self.buf = b_data + self.buf
+
+
+def stream_update(zip_stream, update_file, str_part):
+    """
+    Extract the member of a ZIP file with the same extension as the update
+    file, reading the ZIP data only once and in order (using the local
+    headers instead of the central directory), and hashing it while it's
+    written. Only stored and deflated members are supported
+    :param zip_stream: StreamReader with the ZIP file data
+    :param update_file: Path to the update file
+    :param str_part: Path to the file where the member is written
+    :returns: sha256 hash object of the extracted data, or None if not found
+    :raises BadZipFile: If the data is not valid or not supported
+    """
+    update_extension = os.path.splitext(update_file)[1].upper()
+    while True:
+        zip_header = zip_stream.read(30)
+        if len(zip_header) < 30 or zip_header[:4] != ZIP_MAGIC:
+            # Central directory (or end of data) reached
+            break
+        (_, _, i_flags, i_method, _, _, i_crc, i_csize, _, i_name,
+         i_extra) = struct.unpack('<4sHHHHHIIIHH', zip_header)
+        str_name = zip_stream.read_exact(i_name).decode(
+            'utf-8' if i_flags & 0x800 else 'cp437')
+        zip_stream.read_exact(i_extra)
+
+        b_member = os.path.splitext(str_name)[1].upper() == update_extension
+        b_descriptor = i_flags & 0x08
+        if i_flags & 0x01 or i_method not in [0, 8] or (
+                b_descriptor and i_method != 8) or i_csize == 0xffffffff:
+            raise BadZipFile(f'Cannot extract {str_name} while downloading')
+
+        i_left = None if b_descriptor else i_csize
+        unzip_data = None
+        if i_method == 8 and (b_member or b_descriptor):
+            unzip_data = zlib.decompressobj(-zlib.MAX_WBITS)
+        file_hash = hashlib.sha256()
+        i_crc_data = 0
+        with contextlib.ExitStack() as out_stack:
+            if b_member:
+                out_data = out_stack.enter_context(open(str_part, 'wb'))
+            while i_left is None or i_left > 0:
+                if i_left is None:
+                    zip_data = zip_stream.read(DL_CHUNK_LEN)
+                    if not zip_data:
+                        raise BadZipFile('Truncated ZIP data')
+                else:
+                    zip_data = zip_stream.read_exact(min(i_left, DL_CHUNK_LEN))
+                    i_left -= len(zip_data)
+                if unzip_data:
+                    zip_data = unzip_data.decompress(zip_data)
+                if b_member:
+                    file_hash.update(zip_data)
+                    i_crc_data = zlib.crc32(zip_data, i_crc_data)
+                    out_data.write(zip_data)
+                if unzip_data and unzip_data.eof:
+                    zip_stream.unread(unzip_data.unused_data)
+                    break
+
+        if b_descriptor:
+            zip_desc = zip_stream.read_exact(12)
+            if zip_desc[:4] == b'PK\x07\x08':
+                zip_desc = zip_desc[4:] + zip_stream.read_exact(4)
+            i_crc = struct.unpack_from('<I', zip_desc)[0]
+        if b_member:
+            if i_crc_data != i_crc:
+                raise BadZipFile(f'Bad CRC-32 for file {str_name}')
+            return file_hash
+
+    LOGGER.warning('Not a valid ZIP file')
+    return None
+
+
+class LogProgress:
+    """Progress window replacement that only logs the messages"""
+
+    def update(self, str_message):
+        """
+        Log a progress message
+        :param str_message: Text of the message
+        """
+        LOGGER.debug(str_message)
+
+
+class DownloadQueue:
+    """
+    List of files to download, fetched later in parallel, with a limit of
+    simultaneous connections to each host
+    """
+
+    def __init__(self,
+                 max_threads=DL_THREADS,
+                 max_host=DL_HOST_THREADS,
+                 dry_run=False):
+        """
+        Create an empty queue
+        :param max_threads: Max number of simultaneous downloads
+        :param max_host: Max number of simultaneous downloads from a host
+        :param dry_run: If True, the queue is only used to plan downloads,
+         so existing local files are not checked nor copied
+        """
+        self.max_threads = max_threads
+        self.dry_run = dry_run
+        self.max_host = max_host
+        self.arr_jobs = []
+        self.dict_alias = {}
+        self.dict_hashes = {}
+        self.arr_conflicts = []
+        self.host_locks = {}
+        self.lock = threading.Lock()
+
+    def add(self, str_url, str_file, str_hash, str_name):
+        """
+        Add a file to download. If a file with the same hash is already in
+        the queue, it's only downloaded once, and then copied.
+        If the same path is already in the queue with another hash, the file
+        is reported as failed, so it's not used for any of them
+        :param str_url: URL to download
+        :param str_file: Path to the file
+        :param str_hash: Hash to check
+        :param str_name: Text to show while downloading
+        """
+        if str_file in self.dict_hashes:
+            if self.dict_hashes[str_file] != str_hash:
+                LOGGER.error('%s is already queued with another hash',
+                             str_file)
+                if str_file not in self.arr_conflicts:
+                    self.arr_conflicts.append(str_file)
+            return
+
+        self.dict_hashes[str_file] = str_hash
+        for job in self.arr_jobs:
+            if str_hash and job[2] == str_hash:
+                self.dict_alias[job[1]].append(str_file)
+                return
+        self.arr_jobs.append([str_url, str_file, str_hash, str_name])
+        self.dict_alias[str_file] = []
+
+    def fetch(self, job):
+        """
+        Download one file, waiting if there are too many downloads from the
+        same host
+        :param job: List with URL, file path, hash and name
+        :returns: Error string (empty when no error)
+        """
+        str_host = urllib.parse.urlsplit(job[0]).netloc
+        with self.lock:
+            if str_host not in self.host_locks:
+                self.host_locks[str_host] = threading.BoundedSemaphore(
+                    self.max_host)
+            host_lock = self.host_locks[str_host]
+
+        with host_lock:
+            return fetch_update(job[0], job[1], job[2])
+
+    def run(self, w_progress=None):
+        """
+        Download all the files in the queue and empty it
+        :returns: List of files that could not be downloaded or verified
+        """
+        arr_failed = list(self.arr_conflicts)
+        if not self.arr_jobs:
+            return arr_failed
+
+        str_message = f'Downloading {len(self.arr_jobs)} files...'
+        if w_progress:
+            w_progress.update(str_message)
+        else:
+            print(str_message, file=MSG_STREAM)
+
+        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
+            dict_futures = {}
+            for job in self.arr_jobs:
+                dict_futures[executor.submit(self.fetch, job)] = job
+            for future in as_completed(dict_futures):
+                job = dict_futures[future]
+                str_err = future.result()
+                for str_alias in self.dict_alias[job[1]]:
+                    if not str_err:
+                        try:
+                            copy_file(job[1], str_alias)
+                            continue
+                        except OSError as error:
+                            LOGGER.debug('Error copying %s: %s', str_alias,
+                                         error)
+                    arr_failed.append(str_alias)
+                if str_err:
+                    arr_failed.append(job[1])
+                    str_message = f'{job[3]}: {str_err}'
+                else:
+                    str_message = f'{job[3]}...OK'
+                if w_progress:
+                    w_progress.update(str_message)
+                else:
+                    print(str_message, file=MSG_STREAM)
+
+        self.arr_jobs = []
+        self.dict_alias = {}
+        self.dict_hashes = {}
+        self.arr_conflicts = []
+        return arr_failed
+
+
+def set_download_cache(str_dir):
+    """
+    Set the directory of the downloads cache
+    :param str_dir: Path to directory
+    """
+    global DL_CACHE_DIR  # pylint: disable=global-statement
+
+    DL_CACHE_DIR = str_dir
+
+
+def get_cached_download(str_hash, str_file):
+    """
+    Look for a file in the downloads cache, by its hash, and, if found, copy
+    it to the desired path
+    :param str_hash: Hash of the file
+    :param str_file: Path where the file is needed
+    :returns: True if the file was found
+    """
+    if not str_hash or not DL_CACHE_DIR or DL_CACHE_MAX <= 0:
+        return False
+
+    str_cached = os.path.join(DL_CACHE_DIR, str_hash)
+    with DL_CACHE_LOCK:
+        if not os.path.isfile(str_cached):
+            return False
+        if get_file_hash(str_cached) != str_hash:
+            LOGGER.debug('Removing corrupted cache file: %s', str_cached)
+            os.remove(str_cached)
+            return False
+
+        try:
+            copy_file(str_cached, str_file)
+            # Modification time is used as last access time
+            os.utime(str_cached)
+        except OSError as error:
+            LOGGER.debug('Error using cache file %s: %s', str_cached, error)
+            return False
+
+    return True
+
+
+def store_cached_download(str_file, str_hash):
+    """
+    Add a downloaded (and verified) file to the downloads cache, removing
+    the least recently used files if the cache is too big
+    :param str_file: Path to file
+    :param str_hash: Hash of the file
+    """
+    if not DL_CACHE_DIR or DL_CACHE_MAX <= 0:
+        return
+
+    str_cached = os.path.join(DL_CACHE_DIR, str_hash)
+    with DL_CACHE_LOCK:
+        try:
+            os.makedirs(DL_CACHE_DIR, exist_ok=True)
+            if not os.path.isfile(str_cached):
+                str_tmp = f'{str_cached}.tmp'
+                copy_file(str_file, str_tmp)
+                os.replace(str_tmp, str_cached)
+
+            arr_cached = []
+            i_total = 0
+            for dir_entry in os.scandir(DL_CACHE_DIR):
+                if dir_entry.is_file():
+                    f_stat = dir_entry.stat()
+                    arr_cached.append(
+                        [f_stat.st_mtime, f_stat.st_size, dir_entry.path])
+                    i_total += f_stat.st_size
+
+            arr_cached.sort()
+            for _, i_size, str_path in arr_cached:
+                if i_total <= DL_CACHE_MAX:
+                    break
+                LOGGER.debug('Removing from cache: %s', str_path)
+                os.remove(str_path)
+                i_total -= i_size
+        except OSError as error:
+            LOGGER.debug('Error storing %s in cache: %s', str_file, error)
+
+
+def copy_file(str_src, str_dst):
+    """
+    Copy a file, replacing the destination if it exists. Hard links are not
+    used, since a change in place of one of the files (e.g. an output file)
+    would change the other one (e.g. in the downloads cache or the mirror)
+    :param str_src: Path to the original file
+    :param str_dst: Path to the new file
+    """
+    if os.path.lexists(str_dst):
+        os.remove(str_dst)
+    shutil.copyfile(str_src, str_dst)
+
+
+def get_mirror_files(fulldict_hash):
+    """
+    Find all the downloadable files in the hash database (latest, 2m, 1core,
+    base, vertical and arcade entries) which have a known hash
+    :param fulldict_hash: Dictionary with hash database
+    :return: Dictionary with file name (hash and extension) as key and a list
+     with hash, name and URLs
+    """
+    dict_files = {}
+    arr_pending = []
+    for str_kind, kind_dict in fulldict_hash.items():
+        if isinstance(kind_dict, dict):
+            str_ext = str_kind
+            if str_kind == 'ROM':
+                str_ext = 'rom'
+            elif str_kind == 'ROMS':
+                str_ext = 'ZX1'
+            arr_pending.append((kind_dict, str_ext, str_kind))
+
+    while arr_pending:
+        hash_dict, str_ext, str_name = arr_pending.pop()
+        hash_versions = hash_dict.get('versions', hash_dict)
+        for str_key, value in hash_dict.items():
+            if isinstance(value, dict) and str_key != 'versions':
+                arr_pending.append((value, str_ext, f'{str_name} {str_key}'))
+            elif str_key in MIRROR_KEYS and len(value) > 1:
+                str_hash = hash_versions.get(value[0], '')
+                if isinstance(str_hash, str) and str_hash:
+                    dict_files[f'{str_hash}.{str_ext}'] = [
+                        str_hash, f'{str_name} {value[0]}'
+                    ] + value[1:]
+                else:
+                    LOGGER.debug('No hash for %s %s', str_name, value[0])
+
+    return dict_files
+
+
+def build_mirror(str_dir, fulldict_hash):
+    """
+    Download to a directory, in parallel and verifying them, all the files
+    that can be used to update images, so updates can be done without
+    network access, and save a map of URLs to local files
+    :param str_dir: Directory for the mirror
+    :param fulldict_hash: Dictionary with hash database
+    :return: List of files that could not be downloaded or verified
+    """
+    str_map = os.path.join(str_dir, MIRROR_MAP_FILE)
+    os.makedirs(str_dir, exist_ok=True)
+    dict_map = {}
+    if os.path.isfile(str_map):
+        with open(str_map, 'r', encoding='utf-8') as map_handle:
+            dict_map = json.load(map_handle)
+
+    dl_queue = DownloadQueue()
+    dict_files = get_mirror_files(fulldict_hash)
+    for str_name, arr_data in dict_files.items():
+        str_file = os.path.join(str_dir, str_name)
+        for str_url in arr_data[2:]:
+            dict_map[str_url] = str_name
+        if os.path.isfile(str_file) and get_file_hash(str_file) == arr_data[0]:
+            continue
+        if not get_cached_download(arr_data[0], str_file):
+            dl_queue.add(arr_data[2], str_file, arr_data[0], arr_data[1])
+
+    arr_failed = dl_queue.run()
+    for str_url in list(dict_map):
+        if os.path.join(str_dir, dict_map[str_url]) in arr_failed:
+            del dict_map[str_url]
+
+    str_tmp = f'{str_map}.tmp'
+    with open(str_tmp, 'w', encoding='utf-8') as map_handle:
+        json.dump(dict_map, map_handle, indent=4)
+    os.replace(str_tmp, str_map)
+
+    print(f'{len(dict_files) - len(arr_failed)} of {len(dict_files)} files'
+          f' available in {str_dir}', file=MSG_STREAM)
+    return arr_failed
+
+
+def set_mirror(str_dir):
+    """
+    Use a local mirror, made with build_mirror, instead of downloading files
+    :param str_dir: Directory of the mirror
+    """
+    str_map = os.path.join(str_dir, MIRROR_MAP_FILE)
+    if not os.path.isfile(str_map):
+        LOGGER.error('Mirror not found: %s', str_map)
+        return
+
+    with open(str_map, 'r', encoding='utf-8') as map_handle:
+        dict_map = json.load(map_handle)
+    for str_url, str_name in dict_map.items():
+        MIRROR_MAP[str_url] = os.path.join(str_dir, str_name)
+
+
+def get_mirror_file(str_url, str_hash, str_file):
+    """
+    Look for a file in the local mirror, by its URL, and, if found and valid,
+    copy it to the desired path
+    :param str_url: URL of the file
+    :param str_hash: Hash of the file
+    :param str_file: Path where the file is needed
+    :returns: True if the file was found
+    """
+    str_mirror = MIRROR_MAP.get(str_url, '')
+    if not str_mirror or not os.path.isfile(str_mirror):
+        return False
+    if str_hash and get_file_hash(str_mirror) != str_hash:
+        LOGGER.warning('%s is not valid', str_mirror)
+        return False
+
+    try:
+        copy_file(str_mirror, str_file)
+    except OSError as error:
+        LOGGER.debug('Error using mirror file %s: %s', str_mirror, error)
+        return False
+
+    return True
+
+
+def plan_update(str_file,
+                fullhash_dict,
+                str_extension,
+                str_update,
+                b_new_img,
+                get_1core,
+                get_2mb,
+                w_progress=None,
+                dl_queue=None):
+    """
+    Find what needs to be updated in an image file, adding the required
+    downloads to a queue
+    :param str_file: Input SPI flash file
+    :param fullhash_dict: Dictionary with hashes data
+    :param str_extension: SPI Flash extension
+    :param str_update: String with update requirements (as 'All', 'BIOS, etc.)
+    :param b_new_img: If True, assume it's a brand, new, clean image
+    :param get_1core: Use "1core" entries of JSON
+    :param get_2mb: Use "2m" entries of JSON
+    :param dl_queue: DownloadQueue where downloads are added
+    :returns: A valid array for inject_zxfiles
+    """
+    arr_upd = []
+    if str_update.lower() in ['all', 'bios']:
+        prep_update_zxdata(arr_upd,
+                           str_file,
+                           fullhash_dict,
+                           str_extension, ['BIOS'],
+                           w_progress=w_progress,
+                           dl_queue=dl_queue)
+    if str_update.lower() in ['all', 'spectrum']:
+        prep_update_zxdata(arr_upd,
+                           str_file,
+                           fullhash_dict,
+                           str_extension, ['Spectrum'],
+                           get_1core=get_1core,
+                           get_2mb=get_2mb,
+                           w_progress=w_progress,
+                           dl_queue=dl_queue)
+    if str_update.lower() in ['all', 'special']:
+        prep_update_zxdata(arr_upd,
+                           str_file,
+                           fullhash_dict,
+                           str_extension, ['Special'],
+                           w_progress=w_progress,
+                           dl_queue=dl_queue)
+    if str_update.lower() in ['all', 'cores']:
+        prep_update_cores(arr_upd,
+                          str_file,
+                          fullhash_dict,
+                          str_extension,
+                          b_new_img,
+                          get_1core=get_1core,
+                          get_2mb=get_2mb,
+                          w_progress=w_progress,
+                          dl_queue=dl_queue)
+    if b_new_img or str_update.lower() == 'roms':
+        prep_update_roms(arr_upd,
+                         fullhash_dict,
+                         str_extension,
+                         b_new_img,
+                         dl_queue=dl_queue)
+    if str_update.lower() == 'arcade':
+        prep_update_zxdata(arr_upd,
+                           str_file,
+                           fullhash_dict,
+                           str_extension, ['BIOS'],
+                           w_progress=w_progress,
+                           dl_queue=dl_queue)
+        prep_update_cores(arr_upd,
+                          str_file,
+                          fullhash_dict,
+                          str_extension,
+                          b_new_img,
+                          'arcade',
+                          w_progress=w_progress,
+                          dl_queue=dl_queue)
+        prep_update_roms(arr_upd,
+                         fullhash_dict,
+                         str_extension,
+                         b_new_img,
+                         True,
+                         dl_queue=dl_queue)
+    if str_update.lower() == 'varcade':
+        prep_update_zxdata(arr_upd,
+                           str_file,
+                           fullhash_dict,
+                           str_extension, ['BIOS'],
+                           True,
+                           w_progress=w_progress,
+                           dl_queue=dl_queue)
+        prep_update_cores(arr_upd,
+                          str_file,
+                          fullhash_dict,
+                          str_extension,
+                          b_new_img,
+                          'varcade',
+                          w_progress=w_progress,
+                          dl_queue=dl_queue)
+        prep_update_roms(arr_upd,
+                         fullhash_dict,
+                         str_extension,
+                         b_new_img,
+                         True,
+                         dl_queue=dl_queue)
+
+    return arr_upd
+
+
+def update_image(str_file,
+                 str_output_file,
+                 fullhash_dict,
+                 str_extension,
+                 str_update,
+                 b_new_img,
+                 b_force,
+                 get_1core,
+                 get_2mb,
+                 w_progress=None):
+    """
+    Update Image File
+    :param str_file: Input SPI flash file
+    :param str_outfile: New SPI flash file to create
+    :param fullhash_dict: Dictionary with hashes data
+    :param str_extension: SPI Flash extension
+    :param str_update: String with update requirements (as 'All', 'BIOS, etc.)
+    :param b_new_img: If True, assume it's a brand, new, clean image
+    :param b_force: Force overwriting file
+    :param get_1core: Use "1core" entries of JSON
+    :param get_2mb: Use "2m" entries of JSON
+    :returns Created or updated image file name, updated b_force
+    """
+    dl_queue = DownloadQueue()
+    arr_upd = plan_update(str_file,
+                          fullhash_dict,
+                          str_extension,
+                          str_update,
+                          b_new_img,
+                          get_1core,
+                          get_2mb,
+                          w_progress=w_progress,
+                          dl_queue=dl_queue)
+
+    # Download everything, and only inject the files that are verified
+    arr_failed = dl_queue.run(w_progress)
+    arr_upd = [
+        str_upd for str_upd in arr_upd
+        if str_upd.split(',')[-1] not in arr_failed
+    ]
+
+    if arr_upd:
+        if inject_zxfiles(str_file,
+                          arr_upd,
+                          str_output_file,
+                          fullhash_dict,
+                          str_extension,
+                          b_force=b_force,
+                          w_progress=w_progress)[0]:
+            b_force = True
+            str_file = str_output_file
+    else:
+        print('Nothing to update', file=MSG_STREAM)
+
+    return str_file, b_force
+
+
+def update_fleet(arr_files, fullhash_dict, str_update, get_1core, get_2mb):
+    """
+    Update several image files at once: find what each one needs, download
+    every file only once and then inject the updates into each image with a
+    pool of processes
+    :param arr_files: List of SPI flash files (updated in place)
+    :param fullhash_dict: Dictionary with hashes data
+    :param str_update: String with update requirements (as 'All', 'BIOS, etc.)
+    :param get_1core: Use "1core" entries of JSON
+    :param get_2mb: Use "2m" entries of JSON
+    :returns: Dictionary with the result for each image file
+    """
+    global STR_OUTDIR  # pylint: disable=global-statement
+
+    dict_res = {}
+    with contextlib.ExitStack() as dir_stack:
+        if not STR_OUTDIR:
+            STR_OUTDIR = dir_stack.enter_context(tempfile.TemporaryDirectory())
+
+        dl_queue = DownloadQueue()
+        arr_plans = []
+        for str_file in arr_files:
+            str_extension, _, filetype = detect_file(str_file, fullhash_dict)
+            if filetype != 'FlashImage' or str_extension not in [
+                    'ZX1', 'ZX2', 'ZXD', 'ZXT'
+            ]:
+                LOGGER.error('Not a valid filetype: %s', str_file)
+                dict_res[str_file] = 'Not a valid filetype'
+                continue
+
+            print(f'\nChecking {str_file}...', file=MSG_STREAM)
+            arr_upd = plan_update(str_file,
+                                  fullhash_dict,
+                                  str_extension,
+                                  str_update,
+                                  False,
+                                  get_1core,
+                                  get_2mb,
+                                  dl_queue=dl_queue)
+            arr_plans.append([str_file, str_extension, arr_upd])
+
+        arr_failed = dl_queue.run()
+        for plan in arr_plans:
+            plan[2] = [
+                str_upd for str_upd in plan[2]
+                if str_upd.split(',')[-1] not in arr_failed
+            ]
+            if not plan[2]:
+                dict_res[plan[0]] = 'Nothing to update'
+        arr_plans = [plan for plan in arr_plans if plan[2]]
+
+        release_flash_image()
+        close_ident_cache()
+        http_close_all()
+        with ProcessPoolExecutor(initializer=init_fleet_worker,
+                                 initargs=(MY_DIRPATH, STR_OUTDIR)) as executor:
+            for plan, (str_err, str_out) in zip(
+                    arr_plans, executor.map(inject_fleet_image, arr_plans)):
+                print(f'\n{plan[0]}:\n{str_out}', end='', file=MSG_STREAM)
+                dict_res[plan[0]] = str_err or 'Updated OK'
+
+    for str_file in arr_files:
+        print(f'{str_file}: {dict_res[str_file]}', file=MSG_STREAM)
+
+    return dict_res
+
+
+def init_fleet_worker(str_json_dir, str_outdir):
+    """
+    Prepare a process to update images, loading the hash database only once
+    :param str_json_dir: Directory with the hash database
+    :param str_outdir: Directory with the downloaded files
+    """
+    global BATCH_HASH  # pylint: disable=global-statement
+    global HASH_THREADS  # pylint: disable=global-statement
+    global STR_OUTDIR  # pylint: disable=global-statement
+
+    http_close_all()
+    HASH_THREADS = 1
+    STR_OUTDIR = str_outdir
+    BATCH_HASH = load_json_bd(base_dir=str_json_dir, b_caches=True)
+
+
+def inject_fleet_image(plan):
+    """
+    Inject the updates planned for an image file
+    :param plan: List with image file path, extension and inject_zxfiles array
+    :return: Error string (empty if there's no error) and text output
+    """
+    str_file, str_extension, arr_upd = plan
+    with contextlib.redirect_stdout(io.StringIO()) as str_out:
+        try:
+            _, arr_err = inject_zxfiles(str_file,
+                                        arr_upd,
+                                        str_file,
+                                        BATCH_HASH,
+                                        str_extension,
+                                        b_force=True)
+            str_err = ', '.join(arr_err)
+        except Exception as error:  # pylint: disable=broad-except
+            str_err = str(error) or type(error).__name__
+
+    return str_err, str_out.getvalue()
+
+
+def plan_prefetch(str_file,
+                  fullhash_dict,
+                  str_extension,
+                  str_update='all',
+                  get_1core=False,
+                  get_2mb=False):
+    """
+    Find the files that would be downloaded to update an image file, so they
+    can be fetched in advance to the downloads cache. Only plans: no local
+    file is hashed, copied or created, and files that are already in the
+    cache are left out
+    :param str_file: Input SPI flash file
+    :param fullhash_dict: Dictionary with hashes data
+    :param str_extension: SPI Flash extension
+    :param str_update: String with update requirements (as 'All', 'BIOS, etc.)
+    :param get_1core: Use "1core" entries of JSON
+    :param get_2mb: Use "2m" entries of JSON
+    :returns: List of downloads (URL, file path, hash and name)
+    """
+    if not DL_CACHE_DIR or DL_CACHE_MAX <= 0:
+        return []
+
+    dl_queue = DownloadQueue(dry_run=True)
+    plan_update(str_file,
+                fullhash_dict,
+                str_extension,
+                str_update,
+                False,
+                get_1core,
+                get_2mb,
+                dl_queue=dl_queue)
+
+    return [
+        job for job in dl_queue.arr_jobs if job[2]
+        and not os.path.isfile(os.path.join(DL_CACHE_DIR, job[2]))
+    ]
+
+
+def prefetch_updates(arr_jobs):
+    """
+    Download files to the downloads cache (only), using a temporary
+    directory. Intended to be run in a background thread
+    :param arr_jobs: List of downloads, as returned by plan_prefetch
+    :returns: List of files that could not be downloaded or verified
+    """
+    with tempfile.TemporaryDirectory() as str_tmpdir:
+        dl_queue = DownloadQueue()
+        for str_url, str_file, str_hash, str_name in arr_jobs:
+            str_file = os.path.join(str_tmpdir, os.path.basename(str_file))
+            dl_queue.add(str_url, str_file, str_hash, str_name)
+
+        return dl_queue.run(LogProgress())
+
+
+def expand_image(str_spi_file, str_outfile, flash_len, b_force=False):
+    """
+    Expands, if needed, an image file
+    :param str_spi_file: Input SPI flash file
+    :param str_outfile: New SPI flash file to create
+    :param flash_len: Desired size, in bytes
+    :param b_force: Force overwriting file
+    """
+
+    b_len = os.stat(str_spi_file).st_size
+    if b_len < flash_len:
         extra_len = flash_len - b_len
-        print('Expanding image file...')
+        print('Expanding image file...', file=MSG_STREAM)
         if b_force or check_overwrite(str_outfile):
-            with open(str_spi_file, "rb") as in_zxdata:
-                b_data = in_zxdata.read(b_len)
+            b_data = read_bindata(str_spi_file, b_len)
 
             # Extra 0s
-            b_data += b'\x00' * extra_len
+            b_data += bytes(extra_len)
 
-            with open(str_outfile, "wb") as out_zxdata:
-                out_zxdata.write(b_data)
-                print(f'{str_outfile} created OK.')
-                b_force = True
+            save_bindata(b_data, str_outfile, str_spi_file)
+            b_force = True
 
     return b_force
 
@@ -1545,60 +3341,141 @@ def wipe_zxdata(str_spi_file,
     dict_parts = hash_dict['parts']
 
     LOGGER.debug('Reading Flash...')
-    b_len = os.stat(str_spi_file).st_size
-    with open(str_spi_file, "rb") as in_zxdata:
-        b_data = in_zxdata.read(b_len)
-
-    # SPI flash ROMs
-    block_info = dict_parts['roms_dir']
-    base_slots = int(block_info[5])
-    max_slots = base_slots + int(block_info[6])
-    rom_bases = dict_parts['roms_data']
+    b_data = read_bindata(str_spi_file)
 
-    # SPI flash Cores
-    blk_info = dict_parts['cores_dir']
-    max_cores = splitcore_index = int(blk_info[4])
-    if len(blk_info) > 5:
-        max_cores += int(blk_info[5])
-    core_bases = dict_parts['core_base']
+    layout = get_layout(dict_parts)
 
     # Clear ROM names in directory
-    cur_pos = int(block_info[0])
-    br_data = b_data[:cur_pos]
-    br_data += b'\x00' * 64 * max_slots
-    cur_pos += 64 * max_slots
+    fill_bindata(b_data, layout.roms_dir, 64 * layout.max_roms)
 
     # Clear ROMs list in SPI flash (Temp Binary Data)
-    br_data += b_data[cur_pos:int(block_info[4])]
-    cur_pos = int(block_info[4])
-    br_data += b'\xff' * max_slots
-    cur_pos += max_slots
+    fill_bindata(b_data, layout.roms_use, layout.max_roms, 0xff)
 
     # Clear Core Names in directory
-    br_data += b_data[cur_pos:int(blk_info[0]) + 0x100]
-    cur_pos = int(blk_info[0]) + 0x100
-    br_data += b'\x00' * 32 * max_cores
-    cur_pos += 32 * max_cores
+    fill_bindata(b_data, layout.cores_dir + 0x100, 32 * layout.max_cores)
 
     # Clear data blocks of ROMs
-    br_data += b_data[cur_pos:int(rom_bases[0])]
-    cur_pos = int(rom_bases[0])
-    br_data += b'\x00' * 16384 * base_slots
-    cur_pos += 16384 * base_slots
+    fill_bindata(b_data, layout.roms_base, 16384 * layout.rom_split)
 
     # Clear remaining data blocks (from Core 2)
-    core_end = get_core_blockdata(0, splitcore_index, core_bases)[0]
-    br_data += b_data[cur_pos:core_end]
-    br_data += b'\x00' * (len(b_data) - core_end)
+    core_end = layout.core_block(0)[0]
+    fill_bindata(b_data, core_end, len(b_data) - core_end)
 
-    br_data, _, _ = inject_biossettings(br_data, vid_mode, keyb_layout,
-                                        boot_timer, 0, 0)
+    inject_biossettings(b_data, vid_mode, keyb_layout, boot_timer, 0, 0)
 
     # Write Data
     if b_force or check_overwrite(str_outfile):
-        with open(str_outfile, "wb") as out_zxdata:
-            out_zxdata.write(br_data)
-            print(f'{str_outfile} created OK.')
+        save_bindata(b_data, str_outfile, str_spi_file)
+
+
+def defrag_romsdata(str_spi_file,
+                    str_outfile,
+                    fullhash_dict,
+                    str_extension,
+                    b_force=False):
+    """
+    Move ZX Spectrum ROMs so all free slots are contiguous, at the end
+    :param str_spi_file: Input SPI flash or ROMPack v2 file
+    :param str_outfile: SPI flash or ROMPack v2 file to create or update
+    :param fullhash_dict: Dictionary with hashes data
+    :param str_extension: SPI Flash extension (or RPv2 for ROMPack v2)
+    :param b_force: Force overwriting file
+    :return: True if the file was written
+    """
+    dict_parts = fullhash_dict[str_extension]['parts']
+    layout = get_layout(dict_parts)
+    b_roms = str_extension == 'RPv2'
+
+    LOGGER.debug('Reading Destination File...')
+    b_data = read_bindata(str_spi_file)
+
+    roms_list = get_rom_list(str_spi_file, dict_parts, b_data)
+    arr_moves = plan_rom_defrag(roms_list, layout.max_roms)
+    if not arr_moves:
+        print('ROM slots are not fragmented', file=MSG_STREAM)
+        return False
+
+    # Read all the ROMs to move before writing any of them, so the order
+    # of the moves doesn't matter
+    arr_data = []
+    for rom_entry, _ in arr_moves:
+        arr_blocks = []
+        for i in range(rom_entry.slot, rom_entry.slot + rom_entry.size):
+            rom_offset = layout.rom_offset(i, b_roms)
+            arr_blocks.append(bytes(b_data[rom_offset:rom_offset + 16384]))
+        arr_data.append(arr_blocks)
+
+    i_moved = 0
+    for (rom_entry, new_slot), arr_blocks in zip(arr_moves, arr_data):
+        LOGGER.debug('Moving ROM %i from slot %i to %i', rom_entry.index,
+                     rom_entry.slot, new_slot)
+        for i, rom_block in enumerate(arr_blocks):
+            rom_offset = layout.rom_offset(new_slot + i, b_roms)
+            if rom_offset + 16384 > len(b_data):
+                LOGGER.error('Flash image too small to move: %s',
+                             rom_entry.name)
+                return False
+            b_data[rom_offset:rom_offset + 16384] = rom_block
+            i_moved += 16384
+        b_data[layout.roms_dir + rom_entry.index * ROM_ENTRY.size] = new_slot
+
+    print(f'{len(arr_moves)} ROMs moved ({i_moved} bytes)', file=MSG_STREAM)
+    if b_force or check_overwrite(str_outfile):
+        save_bindata(b_data, str_outfile, str_spi_file)
+        return True
+
+    return False
+
+
+def plan_rom_defrag(roms_list, max_slots):
+    """
+    Plan which ROMs have to be moved (and where) so all the used slots are
+    at the start, copying as few blocks as possible. The ROMs that end past
+    the used space are moved into the free gaps before it, biggest first.
+    If they don't fit there, the ROMs after the first gap are slid down
+    instead. All the ROM data is read before writing, so a ROM may be moved
+    over slots that are still in use by other moved ROMs
+    :param roms_list: List of RomEntry objects
+    :param max_slots: Number of ROM slots
+    :return: List of (RomEntry, new slot) pairs
+    """
+    used_len = sum(rom_entry.size for rom_entry in roms_list)
+    arr_move = [
+        rom_entry for rom_entry in roms_list
+        if rom_entry.slot + rom_entry.size > used_len
+    ]
+    if not arr_move or used_len > max_slots:
+        return []
+
+    # Slots that stay in use, with the ROMs that don't have to move
+    slot_use = bytearray(used_len)
+    for rom_entry in roms_list:
+        if rom_entry not in arr_move:
+            slot_use[rom_entry.slot:rom_entry.slot + rom_entry.size] = (
+                b'\x01' * rom_entry.size)
+
+    arr_moves = []
+    for rom_entry in sorted(arr_move,
+                            key=lambda rom_entry: (-rom_entry.size,
+                                                   rom_entry.slot)):
+        new_slot = slot_use.find(bytes(rom_entry.size))
+        if new_slot < 0:
+            break
+        slot_use[new_slot:new_slot + rom_entry.size] = b'\x01' * (
+            rom_entry.size)
+        arr_moves.append((rom_entry, new_slot))
+    else:
+        return arr_moves
+
+    # Gaps are too small for the ROMs: slide down the ROMs after the first
+    arr_moves = []
+    new_slot = 0
+    for rom_entry in sorted(roms_list, key=lambda rom_entry: rom_entry.slot):
+        if rom_entry.slot != new_slot:
+            arr_moves.append((rom_entry, new_slot))
+        new_slot += rom_entry.size
+
+    return arr_moves
 
 
 def inject_zxfiles(str_spi_file,
@@ -1635,12 +3512,10 @@ def inject_zxfiles(str_spi_file,
 
     def_rom_addr = 28736
     if str_extension == 'RPv2':
-        def_rom_addr = int(hash_dict['parts']['roms_data'][0])
+        def_rom_addr = get_layout(hash_dict['parts']).roms_base
 
     LOGGER.debug('Reading Destination File...')
-    b_len = os.stat(str_spi_file).st_size
-    with open(str_spi_file, "rb") as in_zxdata:
-        b_data = in_zxdata.read(b_len)
+    b_data = read_bindata(str_spi_file)
 
     for str_in_params in arr_in_files:
         # Inject main ROMs
@@ -1664,6 +3539,14 @@ def inject_zxfiles(str_spi_file,
                                                 fullhash_dict, str_extension,
                                                 b_data)
         b_changed |= b_chg
+        if str_err:
+            arr_err.append(str_err)
+        # Inject ZX Spectrum ROMs from a directory
+        b_data, b_chg, str_err = inject_romdirdata(str_spi_file,
+                                                   str_in_params,
+                                                   fullhash_dict,
+                                                   str_extension, b_data)
+        b_changed |= b_chg
         if str_err:
             arr_err.append(str_err)
         # Inject ZX Spectrum ROMs from ROMPack
@@ -1689,9 +3572,7 @@ def inject_zxfiles(str_spi_file,
     if b_changed:
         if b_force or check_overwrite(str_outfile):
             b_force = True
-            with open(str_outfile, "wb") as out_zxdata:
-                out_zxdata.write(b_data)
-                print(f'{str_outfile} created OK.')
+            save_bindata(b_data, str_outfile, str_spi_file)
 
     return b_force, arr_err
 
@@ -1720,35 +3601,29 @@ def savefrom_zxdata(str_in_file,
     :param b_force: Force overwriting file
     """
 
-    dict_parts = hash_dict['parts']
-    block_info = dict_parts['cores_dir']
-    max_cores = int(block_info[4])
+    layout = get_layout(hash_dict['parts'])
+    max_cores = layout.core_split_index
 
     flash_len = bin_len = os.stat(str_in_file).st_size
     if n_cores > -1:
-        flash_len = int(hash_dict['parts']['core_base'][0])
-        flash_len += int(hash_dict['parts']['core_base'][1]) * n_cores
+        flash_len = layout.core_base + layout.core_len * n_cores
 
     if bin_len > flash_len:
         bin_len = flash_len
 
-    print('Copying Flash...')
-    with open(str_in_file, "rb") as in_zxdata:
-        bin_data = in_zxdata.read(bin_len)
+    print('Copying Flash...', file=MSG_STREAM)
+    bin_data = read_bindata(str_in_file, bin_len)
 
-    bin_data, _, _ = inject_biossettings(bin_data, video_mode, keyboard_layout,
-                                         boot_timer, default_core, default_rom)
+    inject_biossettings(bin_data, video_mode, keyboard_layout, boot_timer,
+                        default_core, default_rom)
 
     if n_cores > -1:
         core_offset = 0x7100 + (n_cores * 0x20)
         core_len = (max_cores - n_cores) * 0x20
-        bin_data = bin_data[:core_offset] + b'\x00' * core_len + bin_data[
-            core_offset + core_len:]
+        fill_bindata(bin_data, core_offset, core_len)
 
     if b_force or check_overwrite(str_outfile):
-        with open(str_outfile, "wb") as out_zxdata:
-            out_zxdata.write(bin_data)
-            print(f'{str_outfile} created OK.')
+        save_bindata(bin_data, str_outfile, str_in_file)
 
 
 def convert_core(str_in_file, hash_dict, str_outfile, b_force=False):
@@ -1761,17 +3636,15 @@ def convert_core(str_in_file, hash_dict, str_outfile, b_force=False):
     :return: Error string (empty when no error)
     """
     str_err = ''
-    dict_parts = hash_dict['parts']
+    layout = get_layout(hash_dict['parts'])
 
     # Standard core specs
-    core_bases = dict_parts['core_base']
-    b_corelen = int(core_bases[1])
-    b_corehead = core_bases[3]
+    b_corelen = layout.core_len
+    b_corehead = layout.magic['core_base']
 
     # Spectrum core specs
-    spectrum_bases = dict_parts['Spectrum']
-    b_speclen = int(spectrum_bases[1])
-    b_spechead = spectrum_bases[3]
+    b_speclen = layout.blocks['Spectrum'][1]
+    b_spechead = layout.magic['Spectrum']
 
     b_len = os.stat(str_in_file).st_size
     with open(str_in_file, "rb") as in_zxdata:
@@ -1792,9 +3665,10 @@ def convert_core(str_in_file, hash_dict, str_outfile, b_force=False):
 
     if b_convert:
         if b_force or check_overwrite(str_outfile):
+            release_flash_image(str_outfile)
             with open(str_outfile, "wb") as out_zxdata:
                 out_zxdata.write(b_data)
-                print(f'{str_outfile} created OK.')
+                print(f'{str_outfile} created OK.', file=MSG_STREAM)
 
     if str_err:
         LOGGER.error(str_err)
@@ -1813,7 +3687,9 @@ def find_zxfile(str_in_file,
     :param hash_dict: Dictionary with hashes for different blocks
     :param show_hashes: If True, print also found block hashes
     :param b_detail: If True, show extra info
+    :return: Dictionary with the data found
     """
+    b_text = OUTPUT_FORMAT == 'text'
     found = False
     hash_dict = fulldict_hash[str_extension]
     d_parts = hash_dict['parts']
@@ -1822,12 +3698,13 @@ def find_zxfile(str_in_file,
     dict_res['detail'] = {}
 
     str_name = os.path.basename(str_in_file)
-    print(
-        f'\nAnalyzing {str_name} (possibly {hash_dict["description"]})...\n ')
+    if b_text:
+        print(f'\nAnalyzing {str_name} (possibly {hash_dict["description"]})'
+              '...\n ')
     str_file_hash = get_file_hash(str_in_file)
     dict_res['hash'] = str_file_hash
     i_file_size = os.stat(str_in_file).st_size
-    if show_hashes:
+    if show_hashes and b_text:
         print(f'Hash: {str_file_hash}')
 
     # Check if it's a known ZX Spectrum ROM
@@ -1841,7 +3718,8 @@ def find_zxfile(str_in_file,
                 block_version = get_data_version(str_file_hash,
                                                  hash_dict[block_id])
                 if block_version != 'Unknown':
-                    print(f'{block_id} -  Version: {block_version}')
+                    if b_text:
+                        print(f'{block_id} -  Version: {block_version}')
                     dict_res['kind'] = block_id
                     dict_res['version'] = f'{block_version}'
                     found = True
@@ -1855,46 +3733,48 @@ def find_zxfile(str_in_file,
                 block_version = get_data_version(str_file_hash,
                                                  hash_dict[block_id])
                 if block_version != 'Unknown':
-                    print(f'{block_id} -  Version: {block_version}')
+                    if b_text:
+                        print(f'{block_id} -  Version: {block_version}')
                     dict_res['kind'] = block_id
                     dict_res['version'] = block_version
                     found = True
 
     # Check if it's a Core
     if not found and 'core_base' in d_parts:
-        if validate_file(str_in_file,
-                         d_parts['core_base'][3]) and i_file_size == int(
-                             d_parts['core_base'][1]):
+        layout = get_layout(d_parts)
+        if validate_file(str_in_file, layout.magic['core_base']
+                         ) and i_file_size == layout.core_len:
             LOGGER.debug('Looks like a core')
-            for core_item in hash_dict['Cores']:
-                block_version = get_data_version(str_file_hash,
-                                                 hash_dict['Cores'][core_item])
-                if block_version != 'Unknown':
+            arr_found = get_hash_index(hash_dict['Cores']).get(
+                str_file_hash, [])
+            if arr_found:
+                _, core_item, block_version, dict_det = arr_found[0]
+                dict_res['kind'] = 'Core'
+                dict_res['version'] = f'{core_item}: {block_version}'
+                found = True
+                if b_detail:
+                    dict_res['detail'] = dict_det
+                if b_text:
                     print(f'Core: {core_item} - Version: {block_version}')
-                    dict_res['kind'] = 'Core'
-                    dict_res['version'] = f'{core_item}: {block_version}'
-                    found = True
                     if b_detail:
                         printcol(Colours.BLUE,
                                  f' Features of "{core_item}" Cores:',
                                  end='\n')
-                        dict_det = hash_dict['Cores'][core_item].get(
-                            'features', {})
                         print_detail(core_item, dict_det)
-                        dict_res['detail'] = dict_det
-                    break
 
     # Check if it's a ROMPack ROMs file
     if not found and str_extension == 'ZX1':
-        rompack = fulldict_hash['ROMS']['parts']
-        i_rpck_size = int(rompack['header'][1])
-        if i_rpck_size == i_file_size:
-            found, _ = list_romsdata(str_in_file, fulldict_hash, 'ROMS',
-                                     show_hashes, True)
+        rompack = get_layout(fulldict_hash['ROMS']['parts'])
+        if rompack.blocks['header'][1] == i_file_size:
+            found, default_rom = list_romsdata(str_in_file, fulldict_hash,
+                                               'ROMS', show_hashes, True)
             dict_res['kind'] = 'ROMPack'
             dict_res['version'] = ''
+            if not b_text:
+                dict_res['roms'] = found
+                dict_res['default_rom'] = default_rom
 
-    if not found:
+    if not found and b_text:
         print('Unknown file')
 
     return dict_res
@@ -1912,56 +3792,63 @@ def get_core_version(str_in_file, core_index, dict_parts, dict_cores):
     :param dict_cores: Dictionary with hashes and info for cores
     :return: List with name string, version string and hash string
     """
-
-    block_info = dict_parts['cores_dir']
-    max_cores = splitcore_index = int(block_info[4])
-
-    if len(block_info) > 5:
-        max_cores += int(block_info[5])
-    if core_index > max_cores:
-        LOGGER.error('Invalid core index: %i', core_index)
-
-    core_bases = dict_parts['core_base']
-
-    block_name = block_version = 'Unknown'
-    block_hash = ''
-    dict_details = {}
-    block_data = get_core_blockdata(core_index, splitcore_index, core_bases)
-    LOGGER.debug('Index %i: %X(%i)', core_index + 2, block_data[0],
-                 block_data[0])
-
-    for core_name in dict_cores:
-        block_version, block_hash = get_version(str_in_file, block_data,
-                                                dict_cores[core_name])
-        if block_version != 'Unknown':
-            block_name = core_name
-            dict_details = dict_cores[core_name].get('features', {})
-            break
-
-    return block_name, block_version, block_hash, dict_details
+    return get_cores_version(str_in_file, [core_index], dict_parts,
+                             dict_cores)[0]
 
 
-def get_core_blockdata(core_index, spltcore_index, core_bases):
+def get_cores_version(str_in_file, arr_indexes, dict_parts, dict_cores):
     """
-    Get Core Offset and Length
-    :param core_index: Index of the Core
-    :param splitcore_index: Index of last core before split
-    :param core_bases: Array with base offset and offset after split
-    :return: Array with core offset and core length
+    Obtain name and version from several core blocks in file, hashing them
+    in parallel
+    :param str_in_file: Path to file
+    :param arr_indexes: List of Core Indexes in file
+    :param dict_parts: Dictionary with file blocks info
+    :param dict_cores: Dictionary with hashes and info for cores
+    :return: List with name string, version string and hash string for
+     each core, in the same order as the indexes
     """
 
-    core_base = int(core_bases[0])
-    core_len = int(core_bases[1])
+    layout = get_layout(dict_parts)
+
+    arr_blocks = []
+    arr_hashes = []
+    arr_pending = []
+    for core_index in arr_indexes:
+        if core_index > layout.max_cores:
+            LOGGER.error('Invalid core index: %i', core_index)
 
-    core_split = 0
-    if len(core_bases) > 4:
-        core_split = int(core_bases[4])
+        block_data = layout.core_block(core_index)
+        LOGGER.debug('Index %i: %X(%i)', core_index + 2, block_data[0],
+                     block_data[0])
+        arr_blocks.append(block_data)
 
-    core_offset = core_base + core_index * core_len
-    if core_split and core_index + 2 > spltcore_index:
-        core_offset = core_split + (core_index - spltcore_index + 1) * core_len
+        cached_id = get_cached_id(str_in_file, block_data, 'Core')
+        if cached_id:
+            arr_hashes.append(cached_id[0])
+        else:
+            arr_hashes.append('')
+            arr_pending.append(len(arr_hashes) - 1)
+
+    arr_new = hash_blocks(str_in_file,
+                          [[arr_blocks[i_pos]] for i_pos in arr_pending])
+    for i_pos, block_hash in zip(arr_pending, arr_new):
+        arr_hashes[i_pos] = block_hash
+        put_cached_id(str_in_file, arr_blocks[i_pos], 'Core', block_hash, '')
+
+    arr_cores = []
+    hash_index = get_hash_index(dict_cores)
+    for block_hash in arr_hashes:
+        block_name = block_version = 'Unknown'
+        dict_details = {}
+        if block_hash:
+            arr_found = hash_index.get(block_hash, [])
+            if arr_found:
+                _, block_name, block_version, dict_details = arr_found[0]
+        else:
+            block_version = ''
+        arr_cores.append([block_name, block_version, block_hash, dict_details])
 
-    return [core_offset, core_len]
+    return arr_cores
 
 
 def get_core_list(str_in_file, dict_parts):
@@ -1972,12 +3859,7 @@ def get_core_list(str_in_file, dict_parts):
     :return: List of name strings
     """
     block_info = dict_parts['cores_dir']
-    i_start = int(block_info[0])
-    i_len = int(block_info[1])
-
-    with open(str_in_file, "rb") as in_zxdata:
-        in_zxdata.seek(i_start)
-        bin_data = in_zxdata.read(i_len)
+    bin_data = get_flash_image(str_in_file).block(block_info, True)
 
     name_list = get_core_list_bindata(bin_data, dict_parts)
 
@@ -1991,53 +3873,91 @@ def get_core_list_bindata(bin_data, dict_parts):
     :param dict_parts: Dictionary with file blocks info
     :return: List of name strings
     """
-    block_info = dict_parts['cores_dir']
-    max_cores = int(block_info[4])
-    if len(block_info) > 5:
-        max_cores += int(block_info[5])
-
     name_offset = 0x100
     name_len = 0x20
     name_list = []
-    for index in range(max_cores):
+    for index in range(get_layout(dict_parts).max_cores):
         str_name = bin_data[name_offset + index * name_len:name_offset +
                             (index + 1) * name_len]
         if str_name[0:1] == b'\x00':
             break
         else:
-            name_list.append(str_name.decode('utf-8'))
+            name_list.append(str(str_name, 'utf-8'))
 
     return name_list
 
 
-# ROM data functions
+# ROM data functions
+
+
+def get_rom(str_in_file, rom_slot, rom_blocks, dict_full, in_file_ext):
+    """
+    Obtain name, version and data from ROM block in SPI flash file
+    :param str_in_file: Path to file
+    :param rom_slot: ROM slot number
+    :param rom_blocks: Size of ROM in 16384 bytes blocks
+    :param dict_full: Dictionary with hashes and info for cores
+    :param in_file_ext: Extension of input file
+    :return: List with version string, hash string and offset
+    """
+
+    layout = get_layout(dict_full[in_file_ext]['parts'])
+    rom_data = get_rom_bin(str_in_file, rom_slot, rom_blocks, layout)
+
+    block_version, block_hash = get_romdata_version(rom_data, dict_full['ROM'])
+
+    return block_version, block_hash, rom_data
 
 
-def get_rom(str_in_file,
-            rom_slot,
-            rom_blocks,
-            dict_full,
-            in_file_ext,
-            roms_file=False):
+def get_roms_version(str_in_file, arr_slots, arr_blocks, dict_full,
+                     in_file_ext):
     """
-    Obtain name, version and data from ROM block in file
+    Obtain version from several ROM blocks in SPI flash file, hashing them in
+    parallel
     :param str_in_file: Path to file
-    :param rom_slot: ROM slot number
-    :param rom_blocks: Size of ROM in 16384 bytes blocks
+    :param arr_slots: List of ROM slot numbers
+    :param arr_blocks: List of sizes of ROMs in 16384 bytes blocks
     :param dict_full: Dictionary with hashes and info for cores
     :param in_file_ext: Extension of input file
-    :param roms_file: If True, add extra offset as in ROM.ZX1 file
-    :return: List with version string, hash string and offset
+    :return: List with version string and hash string for each ROM, in the
+     same order as the slots
     """
+    layout = get_layout(dict_full[in_file_ext]['parts'])
+    flash_image = get_flash_image(str_in_file)
+
+    arr_roms = []
+    arr_pieces = []
+    arr_pending = []
+    for rom_slot, rom_blocks in zip(arr_slots, arr_blocks):
+        rom_pieces = []
+        for rom_blk in range(rom_slot, rom_slot + rom_blocks):
+            rom_offset = layout.rom_offset(rom_blk)
+            LOGGER.debug('Slot %i: %X (%i)', rom_blk, rom_offset, rom_offset)
+            rom_pieces.append([rom_offset, 16384])
+        arr_pieces.append(rom_pieces)
+
+        block_info = [rom_pieces[0][0], rom_blocks * 16384]
+        cached_id = get_cached_id(str_in_file, block_info, 'ROM')
+        if cached_id:
+            arr_roms.append([cached_id[1], cached_id[0]])
+        else:
+            arr_roms.append(['', ''])
+            arr_pending.append(len(arr_roms) - 1)
 
-    rom_split = int(dict_full[in_file_ext]['parts']['roms_dir'][5])
-    block_bases = dict_full[in_file_ext]['parts']['roms_data']
-    rom_data = get_rom_bin(str_in_file, rom_slot, rom_blocks, rom_split,
-                           block_bases, roms_file)
-
-    block_version, block_hash = get_romdata_version(rom_data, dict_full['ROM'])
+    arr_new = hash_blocks(str_in_file,
+                          [arr_pieces[i_pos] for i_pos in arr_pending], True)
+    for i_pos, block_hash in zip(arr_pending, arr_new):
+        rom_len = 0
+        for rom_piece in arr_pieces[i_pos]:
+            rom_len += len(flash_image.block(rom_piece, True))
+        block_version = get_romhash_version(block_hash, rom_len,
+                                            dict_full['ROM'])
+        arr_roms[i_pos] = [block_version, block_hash]
+        block_info = [arr_pieces[i_pos][0][0], len(arr_pieces[i_pos]) * 16384]
+        put_cached_id(str_in_file, block_info, 'ROM', block_hash,
+                      block_version)
 
-    return block_version, block_hash, rom_data
+    return arr_roms
 
 
 def get_romdata_version(rom_data, dict_rom_hash):
@@ -2047,17 +3967,51 @@ def get_romdata_version(rom_data, dict_rom_hash):
     :param dict_rom_hash: Dictionary with hashes and info for ROMs
     :return: List with version string, hash string and offset
     """
-    rom_blocks = int(len(rom_data) / 16384)
     block_hash = hashlib.sha256(rom_data).hexdigest()
+    block_version = get_romhash_version(block_hash, len(rom_data),
+                                        dict_rom_hash)
+
+    return block_version, block_hash
+
+
+def get_romhash_version(block_hash, rom_len, dict_rom_hash):
+    """
+    Obtain name and version from ROM hash
+    :param block_hash: Hash string of ROM binary data
+    :param rom_len: Length of ROM binary data
+    :param dict_rom_hash: Dictionary with hashes and info for ROMs
+    :return: Version string
+    """
+    rom_blocks = int(rom_len / 16384)
 
     rom_types = [
         '16K Spectrum ROM', '32K Spectrum ROM', '', '64K Spectrum ROM', '', '',
         '', '128K Spectrum ROM'
     ]
-    block_version = get_data_version(block_hash,
-                                     dict_rom_hash[rom_types[rom_blocks - 1]])
+    return get_data_version(block_hash,
+                            dict_rom_hash[rom_types[rom_blocks - 1]])
 
-    return block_version, block_hash
+
+class RomEntry:
+    """Entry of the ROMs directory"""
+
+    __slots__ = ('index', 'slot', 'name', 'size', 'flags', 'crc')
+
+    def __init__(self, index, slot, name, size, flags, crc):
+        """
+        :param index: ROM index
+        :param slot: First slot used by the ROM
+        :param name: ROM name
+        :param size: Size in 16384 bytes blocks
+        :param flags: String with the ROM flags
+        :param crc: String with the CRC16 values
+        """
+        self.index = index
+        self.slot = slot
+        self.name = name
+        self.size = size
+        self.flags = flags
+        self.crc = crc
 
 
 def get_rom_list(str_in_file, dict_parts, b_data=None):
@@ -2065,7 +4019,7 @@ def get_rom_list(str_in_file, dict_parts, b_data=None):
     Obtain list of ROM names ands slots in file
     :param str_in_file: Path to file
     :param dict_parts: Dictionary with file blocks info
-    :return: List of slots, name strings and other info
+    :return: List of RomEntry objects
     """
     roms_list = []
 
@@ -2073,100 +4027,304 @@ def get_rom_list(str_in_file, dict_parts, b_data=None):
     if len(block_info) < 6:
         LOGGER.error('ROMs dir data missing from database')
     else:
-        b_start = int(block_info[4])
-        b_len = int(block_info[5]) + int(block_info[6])
-        if b_data:
-            roms_use = b_data[b_start:b_start + b_len]
-        else:
-            with open(str_in_file, "rb") as in_zxdata:
-                in_zxdata.seek(b_start)
-                roms_use = in_zxdata.read(b_len)
-
-        for i, rom_index in enumerate(roms_use):
+        if b_data is None:
+            b_data = get_flash_image(str_in_file).view
+
+        layout = get_layout(dict_parts)
+        b_start = layout.roms_use
+        roms_use = bytes(b_data[b_start:b_start + layout.max_roms])
+        b_start = layout.roms_dir
+        roms_dir = b_data[b_start:b_start + len(roms_use) * ROM_ENTRY.size]
+        roms_dir = roms_dir[:len(roms_dir) - len(roms_dir) % ROM_ENTRY.size]
+
+        flags_1 = get_flag_tables('* icdnpt')[0]
+        flags_2 = get_flag_tables('smhl172a')[0]
+        flags_3 = get_flag_tables('     rxu')[0]
+        for rom_index, rom_data in zip(roms_use,
+                                       ROM_ENTRY.iter_unpack(roms_dir)):
             if rom_index != 0xff:
-                b_start = int(block_info[0]) + i * 64
-                b_len = 64
-                if b_data:
-                    rom_data = b_data[b_start:b_start + b_len]
-                else:
-                    with open(str_in_file, "rb") as in_zxdata:
-                        in_zxdata.seek(b_start)
-                        rom_data = in_zxdata.read(b_len)
-
-                rom_slot = rom_data[0]
-                rom_size = rom_data[1]
-                rom_flags = bit_to_flag(rom_data[2] ^ 0b00110000, '* icdnpt')
-                rom_flags += bit_to_flag(rom_data[3] ^ 0b00000000, 'smhl172a')
-                rom_flags += bit_to_flag(rom_data[4] ^ 0b00000000, '     rxu')
-                rom_crc = ''
-                for j in range(0, 16):
-                    byte = rom_data[8 + j]
-                    if byte:
-                        rom_crc += f'{byte:02X}'
-                rom_name = rom_data[32:]
+                rom_slot, rom_size, flag_1, flag_2, flag_3, rom_crc, rom_name = rom_data
                 if rom_name[0] >= 32:
+                    rom_flags = flags_1[flag_1 ^ 0b00110000] + flags_2[
+                        flag_2 ^ 0b00000000] + flags_3[flag_3 ^ 0b00000000]
                     try:
-                        roms_list.append([
-                            rom_index, rom_slot,
-                            rom_name.decode('utf-8'), rom_size, rom_flags,
-                            rom_crc
-                        ])
+                        roms_list.append(
+                            RomEntry(rom_index, rom_slot,
+                                     str(rom_name, 'utf-8'), rom_size,
+                                     rom_flags,
+                                     rom_crc.replace(b'\x00',
+                                                     b'').hex().upper()))
                     except UnicodeDecodeError:
                         LOGGER.debug('Bad ROM entry or corrupted ROM name')
-            else:
-                continue
 
     return roms_list
 
 
-def get_rom_bin(str_in_file,
-                rom_slot,
-                rom_blocks,
-                rom_split,
-                rom_bases,
-                roms_file=False):
+def get_rom_bin(str_in_file, rom_slot, rom_blocks, layout):
     """
-    Extract ROM data blocks to memory
+    Extract ROM data blocks of SPI flash file to memory
     :param str_in_file: Path to file
     :param rom_slot: Slot number
     :param rom_blocks: Size of ROM in 16384 bytes blocks
-    :param rom_split: Slot number where rom binary data is split in two
-    :param rom_bases: Offsets for ROM binary data
-    :param roms_file: If True, add extra offset as in ROM.ZX1 file
+    :param layout: DeviceLayout of the file
     :return: Binary data of ROM
     """
 
+    flash_image = get_flash_image(str_in_file)
     rom_data = b''
     for rom_blk in range(rom_slot, rom_slot + rom_blocks):
-        rom_offset = get_romb_offset(rom_blk, rom_split, rom_bases, roms_file)
+        rom_offset = layout.rom_offset(rom_blk)
         LOGGER.debug('Slot %i: %X (%i)', rom_blk, rom_offset, rom_offset)
 
-        with open(str_in_file, "rb") as in_zxrom:
-            in_zxrom.seek(rom_offset)
-            rom_data += in_zxrom.read(16384)
+        rom_data += flash_image.block([rom_offset, 16384], True)
 
     return rom_data
 
 
-def get_romb_offset(rom_slot, rom_split, rom_bases, roms_file=False):
+class ROMPack:
     """
-    Get ROM slot offset in SPI Flash or ROMS.ZX1 file
-    :param rom_slot: ROM slot index
-    :param rom_split: Slot number where rom binary data is split in two
-    :param rom_bases: Offsets for ROM binary data
-    :param roms_file: If True, add extra offset as in ROM.ZX1 file
+    Access to the ROMs of a ROMPack v2 (or ROMS.ZX1) file, using the shared
+    FlashImage of the file. Entries come from the directory alone, and ROM
+    data is only read (and hashed) when asked for. Changes are written in
+    place with patch_bindata, so they are journaled
     """
-    if rom_slot < rom_split:
-        rom_base = int(rom_bases[0])
-        rom_offset = rom_base + rom_slot * 16384
-    else:
-        rom_base = int(rom_bases[4])
-        rom_offset = rom_base + (rom_slot - rom_split) * 16384
 
-    if roms_file:
-        rom_offset += 1
+    def __init__(self, str_file, fullhash_dict, str_kind='RPv2'):
+        """
+        :param str_file: Path to ROMPack file
+        :param fullhash_dict: Dictionary with hashes data
+        :param str_kind: Kind of ROMPack in dictionary (RPv2 or ROMS)
+        """
+        self.str_file = str_file
+        self.dict_rom_hash = fullhash_dict['ROM']
+        self.dict_parts = fullhash_dict[str_kind]['parts']
+        self.layout = get_layout(self.dict_parts)
+        self.versions = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def image_data(self):
+        """
+        Get the current data of the file, without copying it
+        :return: memoryview of the whole file
+        """
+        return get_flash_image(self.str_file).view
+
+    def entries(self):
+        """
+        Obtain the ROMs in the file, reading only the directory
+        :return: List of RomEntry objects
+        """
+        return get_rom_list(self.str_file, self.dict_parts, self.image_data())
+
+    def get_entry(self, rom_index):
+        """
+        Find a ROM in the directory
+        :param rom_index: ROM index
+        :return: RomEntry object or None if not found
+        """
+        for rom_entry in self.entries():
+            if rom_entry.index == rom_index:
+                return rom_entry
+
+        return None
+
+    def default_rom(self):
+        """
+        Get default boot ROM (stored just before the ROMs data)
+        :return: ROM index
+        """
+        return self.image_data()[self.layout.roms_base]
+
+    def rom_data(self, rom_entry, b_data=None):
+        """
+        Read the data of a ROM
+        :param rom_entry: RomEntry object
+        :param b_data: Optional data of the file, to not look it up again
+        :return: Binary data of ROM
+        """
+        if b_data is None:
+            b_data = self.image_data()
+
+        arr_blocks = []
+        for rom_slot in range(rom_entry.slot, rom_entry.slot + rom_entry.size):
+            rom_offset = self.layout.rom_offset(rom_slot, True)
+            arr_blocks.append(b_data[rom_offset:rom_offset + 16384])
+
+        return b''.join(arr_blocks)
+
+    def rom_version(self, rom_entry):
+        """
+        Identify a ROM, hashing it only the first time
+        :param rom_entry: RomEntry object
+        :return: List with version string and hash string
+        """
+        return self.rom_versions([rom_entry])[0]
+
+    def rom_versions(self, roms_list):
+        """
+        Identify several ROMs, hashing in parallel the ones that are not
+        already known (or in the identification cache)
+        :param roms_list: List of RomEntry objects
+        :return: List with version string and hash string for each ROM
+        """
+        arr_pending = []
+        for rom_entry in roms_list:
+            rom_key = (rom_entry.slot, rom_entry.size)
+            if rom_key in self.versions:
+                continue
+            cached_id = get_cached_id(self.str_file,
+                                      self.rom_block(rom_entry), 'ROM')
+            if cached_id:
+                self.versions[rom_key] = [cached_id[1], cached_id[0]]
+            elif rom_entry not in arr_pending:
+                arr_pending.append(rom_entry)
+
+        b_data = self.image_data()
+        with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+            arr_new = list(
+                executor.map(
+                    lambda rom_entry: get_romdata_version(
+                        self.rom_data(rom_entry, b_data), self.dict_rom_hash),
+                    arr_pending))
+        for rom_entry, (block_version, block_hash) in zip(arr_pending,
+                                                          arr_new):
+            put_cached_id(self.str_file, self.rom_block(rom_entry), 'ROM',
+                          block_hash, block_version)
+            self.versions[(rom_entry.slot,
+                           rom_entry.size)] = [block_version, block_hash]
+
+        return [
+            self.versions[(rom_entry.slot, rom_entry.size)]
+            for rom_entry in roms_list
+        ]
+
+    def rom_block(self, rom_entry):
+        """
+        Get offset and length of the data of a ROM
+        :param rom_entry: RomEntry object
+        :return: List with offset and length
+        """
+        return [
+            self.layout.rom_offset(rom_entry.slot, True),
+            rom_entry.size * 16384
+        ]
+
+    def add(self, rom_data, rom_name, rom_params=''):
+        """
+        Add a ROM using the first free slots where it fits
+        :param rom_data: ROM binary data
+        :param rom_name: String with ROM name
+        :param rom_params: String with ROM params (icdnptsmhl172arxu)
+        :return: New ROM index, or -1 if it couldn't be added
+        """
+        rom_len = len(rom_data) // 16384
+        if len(rom_data) % 16384 or rom_len not in [1, 2, 4, 8]:
+            LOGGER.error('Invalid ROM size: %s', rom_name)
+            return -1
+
+        b_data = read_bindata(self.str_file)
+        slot_use, arr_indexes = get_free_roms(self.entries(), self.layout,
+                                              b_data, True)
+        rom_slot = slot_use.find(bytes(rom_len))
+        if rom_slot < 0 or not arr_indexes:
+            LOGGER.error('No free slots for: %s', rom_name)
+            return -1
+
+        _, b_changed = inject_rom_tobin(b_data, self.layout, arr_indexes[0],
+                                        rom_slot, rom_name, rom_params,
+                                        rom_data, None, True)
+        if not b_changed:
+            return -1
+
+        self.write_changes(b_data, rom_slot, rom_len)
+        return arr_indexes[0]
+
+    def replace(self, rom_index, rom_data):
+        """
+        Replace the data of a ROM with another one of the same size,
+        keeping name and params
+        :param rom_index: ROM index
+        :param rom_data: New ROM binary data
+        :return: True if the ROM was replaced
+        """
+        rom_entry = self.get_entry(rom_index)
+        if not rom_entry or len(rom_data) != rom_entry.size * 16384:
+            LOGGER.error('Cannot replace ROM: %i', rom_index)
+            return False
+
+        b_data = read_bindata(self.str_file)
+        _, b_changed = inject_rom_tobin(b_data, self.layout, rom_index,
+                                        rom_entry.slot, rom_entry.name,
+                                        rom_entry.flags, rom_data, None, True)
+        if b_changed:
+            self.write_changes(b_data, rom_entry.slot, rom_entry.size)
+
+        return b_changed
+
+    def rename(self, rom_index, rom_name, rom_params=None):
+        """
+        Change the name (and optionally the params) of a ROM
+        :param rom_index: ROM index
+        :param rom_name: String with new ROM name
+        :param rom_params: String with new ROM params, or None to keep them
+        :return: True if the ROM was renamed
+        """
+        rom_entry = self.get_entry(rom_index)
+        if not rom_entry:
+            LOGGER.error('Cannot rename ROM: %i', rom_index)
+            return False
+
+        if rom_params is None:
+            rom_params = rom_entry.flags
+        b_data = read_bindata(self.str_file)
+        _, b_changed = inject_rom_tobin(b_data, self.layout, rom_index,
+                                        rom_entry.slot, rom_name, rom_params,
+                                        None, rom_entry.crc, True,
+                                        rom_entry.size)
+        if b_changed:
+            self.write_changes(b_data)
+
+        return b_changed
+
+    def delete(self, rom_index):
+        """
+        Remove a ROM from the directory, freeing its slots
+        :param rom_index: ROM index
+        :return: True if the ROM was removed
+        """
+        rom_entry = self.get_entry(rom_index)
+        if not rom_entry:
+            LOGGER.error('Cannot delete ROM: %i', rom_index)
+            return False
 
-    return rom_offset
+        b_data = read_bindata(self.str_file)
+        fill_bindata(b_data, self.layout.roms_dir + rom_index * 64, 64)
+        b_data[self.layout.roms_use + rom_index] = 0xff
+        self.write_changes(b_data, rom_entry.slot, rom_entry.size)
+        return True
+
+    def write_changes(self, b_data, rom_slot=0, rom_len=0):
+        """
+        Write changed data to the file, and forget old identification data
+        :param b_data: New binary data of the file
+        :param rom_slot: First slot with changed ROM data
+        :param rom_len: Number of slots with changed ROM data
+        """
+        forget_cached_ids(self.str_file)
+        i_len = patch_bindata(b_data, self.str_file)
+        LOGGER.debug('%i bytes written', i_len)
+        for rom_key in list(self.versions):
+            if rom_key[0] < rom_slot + rom_len and rom_slot < sum(rom_key):
+                del self.versions[rom_key]
+
+    def close(self):
+        """Unmap the file"""
+        release_flash_image(self.str_file)
 
 
 def new_romentry(rom_slt, rom_name, rom_len, rom_params, rom_crc):
@@ -2199,18 +4357,13 @@ def get_rom_crc(rom_data):
     :param data: ByteArray which contains the data
     :return: String with CRC
     """
-    rom_blocks = int(len(rom_data) / 16384)
-    str_crc = ''
-    for rom_block in range(0, rom_blocks):
-        block_crc = get_crc16(rom_data, rom_block * 16384, 16384)
-        str_crc = f'{block_crc:04X}{str_crc}'
-
-    return str_crc
+    arr_crc = get_crc16_blocks(rom_data, 0, 16384)
+    return ''.join(f'{block_crc:04X}' for block_crc in reversed(arr_crc))
 
 
 def get_crc16(data, offset, length):
     """
-    Computes CRC16
+    Computes CRC16 (CCITT, initial value 0xFFFF)
     :param data: ByteArray which contains the data
     :param offset: Data offset to begin the calculation
     :param length: Number of bytes after the offset
@@ -2219,15 +4372,58 @@ def get_crc16(data, offset, length):
     if data is None or offset < 0 or offset > len(
             data) - 1 and offset + length > len(data):
         return 0
-    crc = 0xFFFF
-    for i in range(0, length):
-        crc ^= data[offset + i] << 8
-        for _ in range(0, 8):
-            if (crc & 0x8000) > 0:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc = crc << 1
-    return crc & 0xFFFF
+    if offset + length > len(data):
+        raise IndexError('CRC data out of range')
+    return crc_hqx(memoryview(data)[offset:offset + length], 0xFFFF)
+
+
+def get_crc16_blocks(data, offset, block_len, num_blocks=None):
+    """
+    Computes CRC16 of several consecutive blocks of the same size
+    :param data: ByteArray which contains the data
+    :param offset: Data offset of the first block
+    :param block_len: Length of each block
+    :param num_blocks: Number of blocks (all the complete blocks if None)
+    :return: List of integers with the CRC of each block
+    """
+    if num_blocks is None:
+        num_blocks = max(0, (len(data) - offset) // block_len)
+
+    data_view = memoryview(data)
+    arr_crc = []
+    for i_start in range(offset, offset + num_blocks * block_len, block_len):
+        arr_crc.append(
+            crc_hqx(data_view[i_start:i_start + block_len], 0xFFFF))
+
+    return arr_crc
+
+
+def get_flag_tables(str_flags):
+    """
+    Obtain (and keep for later) the lookup tables to convert between bytes
+    and flags strings
+    :param str_flags: 8 char string with flags
+    :return: List with the strings for each byte value, and dictionary with
+     the bits set by each flag char
+    """
+    if str_flags not in FLAG_TABLES:
+        arr_strings = []
+        for b_input in range(256):
+            str_result = ''
+            for i in range(8):
+                if b_input << i & 128:
+                    if str_flags[i] != ' ':
+                        str_result += str_flags[i]
+            arr_strings.append(str_result)
+
+        dict_bits = {}
+        for i in range(8):
+            str_flag = str_flags[7 - i]
+            dict_bits[str_flag] = dict_bits.get(str_flag, 0) | 1 << i
+
+        FLAG_TABLES[str_flags] = (arr_strings, dict_bits)
+
+    return FLAG_TABLES[str_flags]
 
 
 def bit_to_flag(b_input, str_flags):
@@ -2237,12 +4433,7 @@ def bit_to_flag(b_input, str_flags):
     :param str_flags: String with chars to use
     :return: String with chars according to bit state
     """
-    str_result = ''
-    for i in range(8):
-        if b_input << i & 128:
-            if str_flags[i] != ' ':
-                str_result += str_flags[i]
-    return str_result
+    return get_flag_tables(str_flags)[0][b_input]
 
 
 def flag_to_bits(str_input, str_flags, i_mask=0):
@@ -2253,15 +4444,12 @@ def flag_to_bits(str_input, str_flags, i_mask=0):
     :param i_mask: Byte mask to apply (xor) to result
     :return: Bytes with bits enabled according to flags
     """
-
+    dict_bits = get_flag_tables(str_flags)[1]
     i_result = 0
-    for i in range(8):
-        if str_flags[7 - i] in str_input:
-            i_result += 1 << i
+    for str_flag in set(str_input):
+        i_result |= dict_bits.get(str_flag, 0)
 
-    i_result ^= i_mask
-    b_result = (i_result).to_bytes(1, 'little')
-    return b_result
+    return BYTE_VALUES[i_result ^ i_mask]
 
 
 # Injection functions
@@ -2273,13 +4461,12 @@ def inject_bindata(str_in_params, hash_dict, b_data, w_progress=None):
     :param str_in_params: String with one of BIOS, esxdos or Spectrum and,
      separated with ',', file path to the binary file
     :param hash_dict: Dictionary with hashes for different blocks
-    :param b_data: SPI flash data
+    :param b_data: SPI flash data (bytearray, modified in place)
     :return: Altered binary data, boolean indicating changes and error string
     """
     b_changed = False
     str_err = ''
     arr_params = str_in_params.split(',')
-    br_data = b_data
 
     for bl_id in ['BIOS', 'esxdos', 'Spectrum', 'Special']:
         hash_parts = hash_dict['parts'].get(bl_id, [])
@@ -2301,19 +4488,17 @@ def inject_bindata(str_in_params, hash_dict, b_data, w_progress=None):
                     if w_progress:
                         w_progress.update(str_message)
                     else:
-                        print(str_message)
-
-                    with open(str_in_file, "rb") as in_zxdata:
-                        in_data = in_zxdata.read(b_len)
+                        print(str_message, file=MSG_STREAM)
 
                     if len(b_data) >= b_offset + b_len:
-                        br_data = b_data[:b_offset] + in_data
-                        br_data += b_data[b_offset + b_len:]
+                        with open(str_in_file, "rb") as in_zxdata:
+                            in_zxdata.readinto(
+                                memoryview(b_data)[b_offset:b_offset + b_len])
                         b_changed = True
 
     if str_err:
         LOGGER.error(str_err)
-    return br_data, b_changed, str_err
+    return b_data, b_changed, str_err
 
 
 def inject_coredata(str_in_params, hash_dict, b_data, w_progress=None):
@@ -2322,7 +4507,7 @@ def inject_coredata(str_in_params, hash_dict, b_data, w_progress=None):
     :param str_in_params: String with CORE, and, separated with ',': core
      number, core name and (optionally) file path to the core file
     :param hash_dict: Dictionary with hashes for different blocks
-    :param b_data: SPI flash data
+    :param b_data: SPI flash data (bytearray, modified in place)
     :return: Altered binary data, boolean indicating changed and error string
     """
     str_err = ''
@@ -2330,19 +4515,15 @@ def inject_coredata(str_in_params, hash_dict, b_data, w_progress=None):
     dict_parts = hash_dict['parts']
 
     arr_params = str_in_params.split(',')
-    br_data = b_data
 
     if arr_params[0].upper() == 'CORE':  # Number, Name, Filename
-        block_info = dict_parts.get('cores_dir', [])
-        max_cores = splitcore_index = int(block_info[4])
-        if len(block_info) > 5:
-            max_cores += int(block_info[5])
-        core_bases = dict_parts['core_base']
-        b_len = int(core_bases[1])
-        b_head = core_bases[3]
-
-        bl_data = b_data[int(block_info[0]):int(block_info[0]) +
-                         int(block_info[1])]
+        layout = get_layout(dict_parts)
+        max_cores = layout.max_cores
+        b_len = layout.core_len
+        b_head = layout.magic['core_base']
+
+        cores_dir = layout.blocks['cores_dir']
+        bl_data = b_data[cores_dir[0]:cores_dir[0] + cores_dir[1]]
         core_list = get_core_list_bindata(bl_data, dict_parts)
 
         if len(arr_params) < 3 or len(arr_params) > 4:
@@ -2361,12 +4542,10 @@ def inject_coredata(str_in_params, hash_dict, b_data, w_progress=None):
                 core_name = ''
                 if str_in_file:
                     block_version = 'Unknown'
-                    for core_item in hash_dict['Cores']:
-                        block_version = get_data_version(
-                            str_hash, hash_dict['Cores'][core_item])
-                        if block_version != 'Unknown':
-                            core_name = core_item
-                            break
+                    arr_found = get_hash_index(hash_dict['Cores']).get(
+                        str_hash, [])
+                    if arr_found:
+                        _, core_name, block_version, _ = arr_found[0]
 
                 if core_index > len(core_list) + 1:
                     core_index = len(core_list) + 2
@@ -2383,36 +4562,31 @@ def inject_coredata(str_in_params, hash_dict, b_data, w_progress=None):
                     if w_progress:
                         w_progress.update(str_message)
                     else:
-                        print(str_message)
+                        print(str_message, file=MSG_STREAM)
                     core_index -= 2
-                    block_data = get_core_blockdata(core_index,
-                                                    splitcore_index,
-                                                    core_bases)
+                    block_data = layout.core_block(core_index)
                     b_offset, b_len = block_data
                     LOGGER.debug('Offset: %X (%i)', b_offset, b_offset)
 
                     if b_offset + b_len > len(b_data):
                         str_err = 'Flash image too small for data'
                     else:
-                        core_index = 0x100 + core_index * 32
-                        bl_data = bl_data[:core_index] + bytes(
-                            str_name, 'utf-8') + bl_data[core_index + 32:]
-
-                        br_data = b_data[:int(block_info[0])] + bl_data
-                        br_data += b_data[int(block_info[0]) +
-                                          int(block_info[1]):]
+                        name_offset = layout.cores_dir + 0x100
+                        name_offset += core_index * 32
+                        b_data[name_offset:name_offset + 32] = bytes(
+                            str_name, 'utf-8')[:32]
 
                         if str_in_file:
                             with open(str_in_file, "rb") as in_zxdata:
-                                in_data = in_zxdata.read()
-                                br_data = br_data[:b_offset] + in_data
-                            br_data += b_data[b_offset + b_len:]
+                                in_zxdata.readinto(
+                                    memoryview(b_data)[b_offset:b_offset +
+                                                       b_len])
 
                         b_changed = True
 
     if str_err:
         LOGGER.error(str_err)
-    return br_data, b_changed, str_err
+    return b_data, b_changed, str_err
 
 
 def inject_romdata(str_in_file, str_in_params, fullhash_dict, str_extension,
@@ -2426,7 +4600,8 @@ def inject_romdata(str_in_file, str_in_params, fullhash_dict, str_extension,
      file path to the ROM file
     :param fullhash_dict: Dictionary with hashes data
     :param str_extension: SPI Flash extension
-    :param b_data: SPI flash data obtained from str_in_file
+    :param b_data: SPI flash data obtained from str_in_file (bytearray,
+     modified in place)
     :return: Altered binary data,boolean indicating changes, and error string
     """
     b_changed = False
@@ -2439,13 +4614,10 @@ def inject_romdata(str_in_file, str_in_params, fullhash_dict, str_extension,
     dict_parts = hash_dict['parts']
 
     arr_params = str_in_params.split(',')
-    br_data = b_data
 
     free_slot = 0
-    block_info = dict_parts['roms_dir']
-    max_slots = int(block_info[5])
-    max_slots += int(block_info[6])
-    block_bases = dict_parts['roms_data']
+    layout = get_layout(dict_parts)
+    max_slots = layout.max_roms
 
     if arr_params[0].upper() == 'ROM':  # Slot, Params, Name, Filename
         if len(arr_params) < 4 or len(arr_params) > 5:
@@ -2461,18 +4633,18 @@ def inject_romdata(str_in_file, str_in_params, fullhash_dict, str_extension,
                 str_rom_file = arr_params[4]
                 b_len = os.stat(str_rom_file).st_size
 
-            roms_list = get_rom_list(str_in_file, dict_parts, br_data)
+            roms_list = get_rom_list(str_in_file, dict_parts, b_data)
             slot_use = []
             for rom_entry in roms_list:
-                if not str_rom_file and rom_entry[1] == rom_slt:
-                    b_len = rom_entry[3] * 16384
+                if not str_rom_file and rom_entry.slot == rom_slt:
+                    b_len = rom_entry.size * 16384
                     if rom_params == '-':
-                        rom_params = rom_entry[4]
-                    rom_crc = rom_entry[5]
-                if rom_entry[1] + 1 > free_slot:
-                    free_slot = rom_entry[1] + 1
-                i_slot = rom_entry[1] + 1
-                for _ in range(1, rom_entry[3]):
+                        rom_params = rom_entry.flags
+                    rom_crc = rom_entry.crc
+                if rom_entry.slot + 1 > free_slot:
+                    free_slot = rom_entry.slot + 1
+                i_slot = rom_entry.slot + 1
+                for _ in range(1, rom_entry.size):
                     slot_use.append(i_slot)
                     i_slot += 1
                     if i_slot > free_slot:
@@ -2494,9 +4666,9 @@ def inject_romdata(str_in_file, str_in_params, fullhash_dict, str_extension,
 
                 rom_index = len(roms_list)
                 for rom_entry in roms_list:
-                    if rom_slt == rom_entry[1]:
-                        rom_index = rom_entry[0]
-                        if b_len != rom_entry[3]:
+                    if rom_slt == rom_entry.slot:
+                        rom_index = rom_entry.index
+                        if b_len != rom_entry.size:
                             str_err = f'Invalid ROM size for slot {rom_slt}'
                             rom_slt = -1
                         break
@@ -2509,17 +4681,162 @@ def inject_romdata(str_in_file, str_in_params, fullhash_dict, str_extension,
 
                         r_v = get_romdata_version(rom_data,
                                                   fullhash_dict['ROM'])
-                        print(f'Injecting ROM in slot {rom_slt} ({r_v[0]})...')
+                        print(f'Injecting ROM in slot {rom_slt} ({r_v[0]})...',
+                              file=MSG_STREAM)
                     else:
-                        print(f'Renaming ROM in slot {rom_slt}...')
+                        print(f'Renaming ROM in slot {rom_slt}...',
+                              file=MSG_STREAM)
+
+                    _, b_changed = inject_rom_tobin(b_data, layout,
+                                                    rom_index, rom_slt,
+                                                    str_name, rom_params,
+                                                    rom_data, rom_crc, b_roms,
+                                                    b_len)
+
+    if str_err:
+        LOGGER.error(str_err)
+    return b_data, b_changed, str_err
+
+
+def inject_romdirdata(str_in_file, str_in_params, fullhash_dict,
+                      str_extension, b_data):
+    """
+    Add all the Spectrum ROM binary files in a directory (or matching a
+    pattern) to SPI flash or RPv2 data, using the first free slots
+    :param str_in_file: File with SPI flash (or ROMPackV2) data
+    :param str_in_params: String with ROMDIR, and, separated with ',': path
+     to a directory or pattern (e.g. 'roms/*.rom') and (optionally) ROM params
+     (icdnptsmhl172arxu) for all the ROMs
+    :param fullhash_dict: Dictionary with hashes data
+    :param str_extension: SPI Flash extension
+    :param b_data: SPI flash data obtained from str_in_file (bytearray,
+     modified in place)
+    :return: Altered binary data,boolean indicating changes, and error string
+    """
+    b_changed = False
+    arr_err = []
+    arr_params = str_in_params.split(',')
+    if arr_params[0].upper() != 'ROMDIR':
+        return b_data, b_changed, ''
+    if len(arr_params) < 2 or len(arr_params) > 3:
+        str_err = f'Invalid argument: {str_in_params}'
+        LOGGER.error(str_err)
+        return b_data, b_changed, str_err
+
+    rom_params = ''
+    if len(arr_params) == 3:
+        rom_params = arr_params[2]
+
+    str_pattern = arr_params[1]
+    if os.path.isdir(str_pattern):
+        arr_files = [
+            str_file for str_file in glob.glob(os.path.join(str_pattern, '*'))
+            if os.path.splitext(str_file)[1].upper() in ['.ROM', '.BIN']
+        ]
+    else:
+        arr_files = glob.glob(str_pattern)
+    arr_files = [
+        str_file for str_file in arr_files if os.path.isfile(str_file)
+    ]
+    if not arr_files:
+        str_err = f'No ROM files found: {str_pattern}'
+        LOGGER.error(str_err)
+        return b_data, b_changed, str_err
+    arr_files.sort()
+
+    dict_parts = fullhash_dict[str_extension]['parts']
+    layout = get_layout(dict_parts)
+
+    # Used slots and free directory entries, computed only once
+    b_roms = str_extension == 'RPv2'
+    slot_use, arr_indexes = get_free_roms(
+        get_rom_list(str_in_file, dict_parts, b_data), layout, b_data, b_roms)
 
-                    br_data, b_changed = inject_rom_tobin(
-                        b_data, block_info, block_bases, rom_index, rom_slt,
-                        str_name, rom_params, rom_data, rom_crc, b_roms, b_len)
+    with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+        arr_roms = [
+            executor.submit(read_romfile, str_file, fullhash_dict['ROM'])
+            for str_file in arr_files
+        ]
+
+    for str_file, rom_future in zip(arr_files, arr_roms):
+        try:
+            rom_data, rom_version, rom_crc = rom_future.result()
+        except OSError as error:
+            arr_err.append(f'Cannot read {str_file}: {error}')
+            continue
+        if not rom_data:
+            arr_err.append(f'Not a valid ROM file: {str_file}')
+            continue
+
+        rom_len = len(rom_data) // 16384
+        rom_slt = slot_use.find(bytes(rom_len))
+        if rom_slt < 0 or not arr_indexes:
+            arr_err.append(f'No free slots for: {str_file}')
+            continue
+
+        str_name = rom_version
+        if rom_version == 'Unknown':
+            str_name = os.path.splitext(os.path.basename(str_file))[0]
+        print(f'Injecting ROM in slot {rom_slt} ({rom_version})...',
+              file=MSG_STREAM)
+        _, b_chg = inject_rom_tobin(b_data, layout, arr_indexes[0], rom_slt,
+                                    str_name, rom_params, rom_data, rom_crc,
+                                    b_roms)
+        if not b_chg:
+            arr_err.append(f'Cannot inject: {str_file}')
+            break
+        b_changed = True
+        slot_use[rom_slt:rom_slt + rom_len] = b'\x01' * rom_len
+        arr_indexes.pop(0)
 
+    str_err = ', '.join(arr_err)
     if str_err:
         LOGGER.error(str_err)
-    return br_data, b_changed, str_err
+    return b_data, b_changed, str_err
+
+
+def get_free_roms(roms_list, layout, b_data, roms_file=False):
+    """
+    Find free ROM slots and directory entries
+    :param roms_list: List of RomEntry objects of the file
+    :param layout: DeviceLayout of the file
+    :param b_data: Binary data of the file
+    :param roms_file: If True, parse data as ROMS.ZX1 file
+    :return: bytearray with one byte for each slot (0 if free) and list of
+     free ROM indexes
+    """
+    slot_use = bytearray(layout.max_roms)
+    for rom_slt in range(layout.max_roms):
+        # Slots past the end of the image (e.g. 16 MiB ZXD) can't be used
+        if layout.rom_offset(rom_slt, roms_file) + 16384 > len(b_data):
+            slot_use[rom_slt] = 1
+    for rom_entry in roms_list:
+        slot_end = min(rom_entry.slot + rom_entry.size, layout.max_roms)
+        slot_use[rom_entry.slot:slot_end] = b'\x01' * (slot_end -
+                                                        rom_entry.slot)
+    roms_use = b_data[layout.roms_use:layout.roms_use + layout.max_roms]
+    arr_indexes = [i for i, rom_use in enumerate(roms_use) if rom_use == 0xff]
+
+    return slot_use, arr_indexes
+
+
+def read_romfile(str_file, dict_rom_hash):
+    """
+    Read and identify a Spectrum ROM file, and compute its CRC
+    :param str_file: Path to ROM file
+    :param dict_rom_hash: Dictionary with hashes and info for ROMs
+    :return: ROM binary data (empty if not valid), version string and CRC
+     string
+    """
+    with open(str_file, 'rb') as in_zxdata:
+        rom_data = in_zxdata.read()
+
+    rom_len = len(rom_data) // 16384
+    if len(rom_data) % 16384 or rom_len not in [1, 2, 4, 8]:
+        return b'', '', ''
+
+    rom_version, _ = get_romdata_version(rom_data, dict_rom_hash)
+    return rom_data, rom_version, get_rom_crc(rom_data)
 
 
 def inject_romszx1data(str_in_params, fullhash_dict, str_extension, b_data):
@@ -2530,7 +4847,8 @@ def inject_romszx1data(str_in_params, fullhash_dict, str_extension, b_data):
      to ROMS.ZX1
     :param fullhash_dict: Dictionary with hashes data
     :param str_extension: SPI Flash extension
-    :param b_data: SPI flash data obtained from str_in_file
+    :param b_data: SPI flash data obtained from str_in_file (bytearray,
+     modified in place)
     :return: Altered binary data, boolean with change state and error strings
     """
     arr_err = []
@@ -2540,27 +4858,18 @@ def inject_romszx1data(str_in_params, fullhash_dict, str_extension, b_data):
     hash_dict = fullhash_dict[str_extension]
     dict_parts = hash_dict['parts']
 
+    layout = get_layout(dict_parts)
     b_roms = False
     def_r_addr = 28736
     if str_extension == 'RPv2':
         b_roms = True
-        def_r_addr = int(dict_parts['roms_data'][0])
-    block_info = dict_parts['roms_dir']
-    max_slots = int(block_info[5])
-    max_slots += int(block_info[6])
-    block_bases = dict_parts['roms_data']
+        def_r_addr = layout.roms_base
+    max_slots = layout.max_roms
 
     # Empty ROMs list
-    roms_use = b'\xff' * (int(block_info[5]) + int(block_info[6]))
-
-    # ZX1 ROMS
-    rom_dict_parts = fullhash_dict['ROMS']['parts']
-    blk_info = rom_dict_parts['roms_dir']
-    rm_split = int(blk_info[5])
-    blk_bases = rom_dict_parts['roms_data']
+    roms_use = b'\xff' * max_slots
 
     arr_params = str_in_params.split(',')
-    br_data = b_data
 
     if arr_params[0].upper() == 'ROMS':  # Filename
         if len(arr_params) != 2:
@@ -2569,52 +4878,47 @@ def inject_romszx1data(str_in_params, fullhash_dict, str_extension, b_data):
             arr_err.append(str_err)
         else:
             str_name = arr_params[1]
-            roms_list = get_rom_list(str_name, rom_dict_parts)
-
-            if roms_list:
-                def_rom = get_peek(str_name, 4160)
-                # Clear ROMs list in SPI flash (Temp Binary Data)
-                br_data = b_data[:int(block_info[4])] + roms_use
-                br_data += b_data[int(block_info[4]) + len(roms_use):]
-
-                print(f'Injecting ROMs from {str_name}...')
-                for rom_item in roms_list:
-                    rom_index = rom_item[0]
-                    rom_slt = rom_item[1]
-                    rom_name = rom_item[2]
-                    rom_params = rom_item[4]
-                    rom_crc = rom_item[5]
-
-                    rom_data = get_rom_bin(str_name, rom_item[1], rom_item[3],
-                                           rm_split, blk_bases, True)
-
-                    rom_len = int(len(rom_data) / 16384)
-                    if rom_slt + rom_len - 1 < max_slots:
-                        LOGGER.debug('Injecting ROM %i (%s)...', rom_slt,
-                                     rom_name)
-
-                        br_data, b_chg = inject_rom_tobin(
-                            br_data, block_info, block_bases, rom_index,
-                            rom_slt, rom_name, rom_params, rom_data, rom_crc,
-                            b_roms)
-                        b_changed |= b_chg
-                    else:
-                        str_err = f'Slot number too high: {rom_slt}'
-                        LOGGER.error(str_err)
-                        arr_err.append(str_err)
+            with ROMPack(str_name, fullhash_dict, 'ROMS') as rom_pack:
+                roms_list = rom_pack.entries()
+
+                if roms_list:
+                    def_rom = rom_pack.default_rom()
+                    # Clear ROMs list in SPI flash (Temp Binary Data)
+                    b_data[layout.roms_use:layout.roms_use +
+                           len(roms_use)] = roms_use
+
+                    print(f'Injecting ROMs from {str_name}...',
+                          file=MSG_STREAM)
+                    for rom_item in roms_list:
+                        rom_slt = rom_item.slot
+                        rom_name = rom_item.name
+
+                        if rom_slt + rom_item.size - 1 < max_slots:
+                            LOGGER.debug('Injecting ROM %i (%s)...', rom_slt,
+                                         rom_name)
+
+                            _, b_chg = inject_rom_tobin(
+                                b_data, layout, rom_item.index, rom_slt,
+                                rom_name, rom_item.flags,
+                                rom_pack.rom_data(rom_item), rom_item.crc,
+                                b_roms)
+                            b_changed |= b_chg
+                        else:
+                            str_err = f'Slot number too high: {rom_slt}'
+                            LOGGER.error(str_err)
+                            arr_err.append(str_err)
 
-                if b_changed:
-                    br_data, b_chg, arr_b_err = inject_biossettings(
-                        br_data, default_rom=def_rom, d_rom_addr=def_r_addr)
-                    if arr_b_err:
-                        arr_err += arr_b_err
+            if b_changed:
+                _, b_chg, arr_b_err = inject_biossettings(
+                    b_data, default_rom=def_rom, d_rom_addr=def_r_addr)
+                if arr_b_err:
+                    arr_err += arr_b_err
 
-    return br_data, b_changed, arr_err
+    return b_data, b_changed, arr_err
 
 
 def inject_rom_tobin(b_data,
-                     block_info,
-                     block_bases,
+                     layout,
                      rom_index,
                      rom_slt,
                      rom_name,
@@ -2626,9 +4930,9 @@ def inject_rom_tobin(b_data,
     """
     Add binary data of a ROM to binary file data (SPI Flash or ROMS.ZX1) or
     rename (and optionally change params) of existing ROM data
-    :param b_data: SPI flash data obtained from str_in_file
-    :param block_info: 'roms_dir' entry of hashes dict
-    :param block_bases: 'roms_data' entry of hashes dict
+    :param b_data: SPI flash data obtained from str_in_file (bytearray,
+     modified in place)
+    :param layout: DeviceLayout of the SPI Flash or ROMS.ZX1 file
     :param rom_index: ROM index number
     :param rom_slt: ROM slot number
     :param rom_name: String with ROM name
@@ -2640,7 +4944,6 @@ def inject_rom_tobin(b_data,
     :return: Altered binary file data and boolean indicating if it changed
     """
     b_changed = False
-    rom_split = int(block_info[5])
 
     rom_name = f'{rom_name[:32]:<32}'
     if rom_data:
@@ -2649,45 +4952,31 @@ def inject_rom_tobin(b_data,
             rom_crc = get_rom_crc(rom_data)
     rom_entry = new_romentry(rom_slt, rom_name, rom_len, rom_params, rom_crc)
 
+    arr_offsets = []
+    if rom_data:
+        for i in range(rom_len):
+            rom_offset = layout.rom_offset(rom_slt + i, roms_file)
+            if rom_offset + 16384 > len(b_data):
+                LOGGER.error('Flash image too small for: %s', rom_name)
+                return b_data, b_changed
+            arr_offsets.append(rom_offset)
+
     # Inject ROM entry
-    cur_pos = int(block_info[0]) + rom_index * 64
-    br_data = b_data[:cur_pos]
-    br_data += rom_entry
-    cur_pos += 64
+    cur_pos = layout.roms_dir + rom_index * 64
+    b_data[cur_pos:cur_pos + 64] = rom_entry[:64]
 
     # Inject ROM index
-    br_data += b_data[cur_pos:int(block_info[4])]
-    cur_pos = int(block_info[4])
-    br_data += b_data[cur_pos:cur_pos + rom_index]
+    cur_pos = layout.roms_use
     LOGGER.debug(b_data[cur_pos:cur_pos + rom_index])
-    br_data += (rom_index).to_bytes(1, byteorder='little')
-    cur_pos += rom_index + 1
+    b_data[cur_pos + rom_index] = rom_index
 
     # Inject ROM binary data
-    if rom_data:
-        for i in range(rom_len):
-            rom_offset = get_romb_offset(rom_slt + i, rom_split, block_bases,
-                                         roms_file)
-            if rom_offset > cur_pos:
-                if rom_offset + 16384 <= len(b_data):
-                    br_data += b_data[cur_pos:rom_offset]
-                    b_changed = True
-                else:
-                    LOGGER.error('Flash image too small for: %s', rom_name)
-                    b_changed = False
-                    break
-
-            br_data += rom_data[i * 16384:(i + 1) * 16384]
-            cur_pos = rom_offset + 16384
-    else:
-        b_changed = True
-
-    if b_changed:
-        br_data += b_data[cur_pos:]
-    else:
-        br_data = b_data
+    for i, rom_offset in enumerate(arr_offsets):
+        b_data[rom_offset:rom_offset + 16384] = rom_data[i * 16384:(i + 1) *
+                                                         16384]
+    b_changed = True
 
-    return br_data, b_changed
+    return b_data, b_changed
 
 
 def inject_biossettings(b_data,
@@ -2699,7 +4988,7 @@ def inject_biossettings(b_data,
                         d_rom_addr=28736):
     """
     Alter SPI flash BIOS or RPv2 settings
-    :param b_data: Binary data to modify
+    :param b_data: Binary data to modify (bytearray, modified in place)
     :param video_mode: Video mode: 0 (PAL), 1 (NTSC) or 2 (VGA)
     :param keyboard_layout: 0 (Auto), 1 (ES), 2 (EN) or 3 (Spectrum)
     :param boot_timer: 0 (No timer), 1, 2 (2x), 3 (4x), 4 (8x)
@@ -2708,19 +4997,16 @@ def inject_biossettings(b_data,
     :return: Altered SPI flash data, alter state and error strings array
     """
     b_changed = False
-    br_data = b_data
     arr_err = []
 
     # 28736 Default ROM: 00-xx
     if default_rom > -1:
-        br_data = br_data[:d_rom_addr] + struct.pack(
-            '<B', default_rom) + br_data[d_rom_addr + 1:]
+        b_data[d_rom_addr:d_rom_addr + 1] = struct.pack('<B', default_rom)
         b_changed = True
 
     # 28737 Default Core: 01-xx
     if default_core > -1:
-        br_data = br_data[:28737] + struct.pack('<B',
-                                                default_core) + br_data[28738:]
+        b_data[28737:28738] = struct.pack('<B', default_core)
         b_changed = True
 
     # 28738 0-4 Boot Timer
@@ -2730,8 +5016,7 @@ def inject_biossettings(b_data,
             LOGGER.error(str_err)
             arr_err.append(str_err)
         else:
-            br_data = br_data[:28738] + struct.pack(
-                '<B', boot_timer) + br_data[28739:]
+            b_data[28738:28739] = struct.pack('<B', boot_timer)
             b_changed = True
 
     # 28746 0-3 Keyboard Layout: Auto-ES-EN-ZX
@@ -2741,8 +5026,7 @@ def inject_biossettings(b_data,
             LOGGER.error(str_err)
             arr_err.append(str_err)
         else:
-            br_data = br_data[:28746] + struct.pack(
-                '<B', keyboard_layout) + br_data[28747:]
+            b_data[28746:28747] = struct.pack('<B', keyboard_layout)
             b_changed = True
 
     # 28749 0-2 Video: PAL-NTSC-VGA
@@ -2752,16 +5036,451 @@ def inject_biossettings(b_data,
             LOGGER.error(str_err)
             arr_err.append(str_err)
         else:
-            br_data = br_data[:28749] + struct.pack(
-                '<B', video_mode) + br_data[28750:]
+            b_data[28749:28750] = struct.pack('<B', video_mode)
             b_changed = True
 
-    return br_data, b_changed, arr_err
+    return b_data, b_changed, arr_err
 
 
 # SPI/ROM file generic functions
 
 
+class DeviceLayout:
+    """Offsets and lengths of the blocks of a kind of file, as numbers"""
+
+    __slots__ = ('blocks', 'magic', 'cores_dir', 'core_split_index',
+                 'max_cores', 'core_base', 'core_len', 'core_split',
+                 'core_offsets', 'roms_dir', 'roms_use', 'rom_split',
+                 'max_roms', 'roms_base', 'roms_split_base', 'rom_offsets')
+
+    def __init__(self, dict_parts):
+        """
+        Parse block data of a file kind
+        :param dict_parts: Dictionary with file blocks info
+        """
+        self.blocks = {}
+        self.magic = {}
+        for str_name, block_info in dict_parts.items():
+            self.blocks[str_name] = [int(block_info[0]), int(block_info[1])]
+            if len(block_info) > 3 and block_info[3]:
+                self.magic[str_name] = unhexlify(block_info[3])
+
+        self.cores_dir = self.core_split_index = self.max_cores = 0
+        self.core_base = self.core_len = self.core_split = 0
+        self.core_offsets = []
+        if 'cores_dir' in dict_parts and 'core_base' in dict_parts:
+            block_info = dict_parts['cores_dir']
+            self.cores_dir = int(block_info[0])
+            self.max_cores = self.core_split_index = int(block_info[4])
+            if len(block_info) > 5:
+                self.max_cores += int(block_info[5])
+
+            core_bases = dict_parts['core_base']
+            self.core_base = int(core_bases[0])
+            self.core_len = int(core_bases[1])
+            if len(core_bases) > 4:
+                self.core_split = int(core_bases[4])
+            self.core_offsets = [
+                self.calc_core_offset(i) for i in range(self.max_cores)
+            ]
+
+        self.roms_dir = self.roms_use = self.rom_split = self.max_roms = 0
+        self.roms_base = self.roms_split_base = 0
+        self.rom_offsets = []
+        if 'roms_dir' in dict_parts and 'roms_data' in dict_parts:
+            block_info = dict_parts['roms_dir']
+            self.roms_dir = int(block_info[0])
+            if len(block_info) > 6:
+                self.roms_use = int(block_info[4])
+                self.rom_split = int(block_info[5])
+                self.max_roms = self.rom_split + int(block_info[6])
+
+            block_bases = dict_parts['roms_data']
+            self.roms_base = int(block_bases[0])
+            if len(block_bases) > 4:
+                self.roms_split_base = int(block_bases[4])
+            self.rom_offsets = [
+                self.calc_rom_offset(i) for i in range(self.max_roms)
+            ]
+
+    def calc_core_offset(self, core_index):
+        """
+        Calculate Core Offset
+        :param core_index: Index of the Core
+        :return: Core offset
+        """
+        core_offset = self.core_base + core_index * self.core_len
+        if self.core_split and core_index + 2 > self.core_split_index:
+            core_offset = self.core_split + (core_index -
+                                             self.core_split_index +
+                                             1) * self.core_len
+
+        return core_offset
+
+    def calc_rom_offset(self, rom_slot):
+        """
+        Calculate ROM slot offset
+        :param rom_slot: ROM slot index
+        :return: ROM slot offset
+        """
+        if rom_slot < self.rom_split:
+            return self.roms_base + rom_slot * 16384
+
+        return self.roms_split_base + (rom_slot - self.rom_split) * 16384
+
+    def core_block(self, core_index):
+        """
+        Get Core Offset and Length
+        :param core_index: Index of the Core
+        :return: Array with core offset and core length
+        """
+        if 0 <= core_index < len(self.core_offsets):
+            return [self.core_offsets[core_index], self.core_len]
+
+        return [self.calc_core_offset(core_index), self.core_len]
+
+    def rom_offset(self, rom_slot, roms_file=False):
+        """
+        Get ROM slot offset in SPI Flash or ROMS.ZX1 file
+        :param rom_slot: ROM slot index
+        :param roms_file: If True, add extra offset as in ROM.ZX1 file
+        :return: ROM slot offset
+        """
+        if 0 <= rom_slot < len(self.rom_offsets):
+            rom_offset = self.rom_offsets[rom_slot]
+        else:
+            rom_offset = self.calc_rom_offset(rom_slot)
+
+        if roms_file:
+            rom_offset += 1
+
+        return rom_offset
+
+
+def get_layout(dict_parts):
+    """
+    Obtain the DeviceLayout of a file kind, building it only the first time
+    that it's needed
+    :param dict_parts: Dictionary with file blocks info
+    :return: DeviceLayout object
+    """
+    layout_data = DEVICE_LAYOUTS.get(id(dict_parts))
+    if not layout_data or layout_data[0] is not dict_parts:
+        layout_data = (dict_parts, DeviceLayout(dict_parts))
+        DEVICE_LAYOUTS[id(dict_parts)] = layout_data
+
+    return layout_data[1]
+
+
+class FlashImage:
+    """Memory-mapped, read only, access to the data of a file"""
+
+    def __init__(self, str_file):
+        """
+        Map the file in memory
+        :param str_file: Path to file
+        """
+        self.str_file = str_file
+        f_stat = os.stat(str_file)
+        self.size = f_stat.st_size
+        self.stat_id = (f_stat.st_size, f_stat.st_mtime_ns)
+        self.data = b''
+        if self.size:
+            with open(str_file, 'rb') as in_zxdata:
+                self.data = mmap.mmap(in_zxdata.fileno(),
+                                      0,
+                                      access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def is_current(self):
+        """
+        Check if the file has not changed since it was mapped
+        :return: True if size and modification time are the same
+        """
+        try:
+            f_stat = os.stat(self.str_file)
+        except FileNotFoundError:
+            return False
+
+        return self.stat_id == (f_stat.st_size, f_stat.st_mtime_ns)
+
+    def block(self, block_info, b_partial=False):
+        """
+        Obtain a data block without copying it
+        :param block_info: List with block offset and block length
+        :param b_partial: If True, return the available data even if the
+         file is too small for the whole block
+        :return: memoryview of the block, or None if the file is too small
+        """
+        i_start = int(block_info[0])
+        i_end = i_start + int(block_info[1])
+        if i_end > self.size and not b_partial:
+            return None
+
+        return self.view[i_start:i_end]
+
+    def peek(self, block_offset):
+        """
+        Get value of one byte
+        :param block_offset: Offset to read
+        :return: Number with the obtained value
+        """
+        return self.view[block_offset]
+
+    def close(self):
+        """Unmap the file"""
+        self.view.release()
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                LOGGER.debug('%s still in use', self.str_file)
+
+
+def get_flash_image(str_in_file):
+    """
+    Obtain shared FlashImage object for a file, mapping it again if the file
+    has changed since the last time
+    :param str_in_file: Path to file
+    :return: FlashImage object
+    """
+    str_key = os.path.abspath(str_in_file)
+    flash_image = FLASH_IMAGES.get(str_key)
+    if not flash_image or not flash_image.is_current():
+        release_flash_image(str_key)
+        recover_journal(str_key)
+        flash_image = FlashImage(str_key)
+        FLASH_IMAGES[str_key] = flash_image
+
+    return flash_image
+
+
+def release_flash_image(str_file=None):
+    """
+    Unmap shared FlashImage objects (needed before writing to a file)
+    :param str_file: Path to file. If not set, release all of them
+    """
+    arr_keys = list(FLASH_IMAGES)
+    if str_file:
+        arr_keys = [os.path.abspath(str_file)]
+
+    for str_key in arr_keys:
+        flash_image = FLASH_IMAGES.pop(str_key, None)
+        if flash_image:
+            flash_image.close()
+
+
+class IdentCache:
+    """Persistent cache with hashes and versions of blocks inside files"""
+
+    def __init__(self, str_file, str_dbid, max_entries=IDENT_CACHE_MAX):
+        """
+        Open (or create) the cache database
+        :param str_file: Path to SQLite file
+        :param str_dbid: Hash database identifier. If it's not the same as
+         when the cache was written, all the entries are discarded
+        :param max_entries: Max number of entries to keep
+        """
+        self.max_entries = max_entries
+        self.changes = 0
+        # Last use of the entries found, saved all together when closing
+        self.touched = {}
+        self.conn = sqlite3.connect(str_file, isolation_level=None)
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta '
+                          '(key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS blocks (path TEXT, size INTEGER, '
+            'mtime_ns INTEGER, inode INTEGER, offset INTEGER, len INTEGER, '
+            'kind TEXT, hash TEXT, version TEXT, last_used REAL, '
+            'PRIMARY KEY (path, size, mtime_ns, inode, offset, len, kind))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS blocks_lru '
+                          'ON blocks (last_used)')
+
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key='dbid'").fetchone()
+        if not row or row[0] != str_dbid:
+            LOGGER.debug('Discarding identification cache')
+            self.conn.execute('DELETE FROM blocks')
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('dbid', ?)",
+                (str_dbid, ))
+        self.conn.commit()
+
+    @staticmethod
+    def file_id(str_file):
+        """
+        Obtain identity of a file
+        :param str_file: Path to file
+        :return: List with path, size, modification time and inode
+        """
+        f_stat = os.stat(str_file)
+        return [
+            os.path.abspath(str_file), f_stat.st_size, f_stat.st_mtime_ns,
+            f_stat.st_ino
+        ]
+
+    def get(self, str_file, block_info, str_kind):
+        """
+        Find cached data of a block
+        :param str_file: Path to file
+        :param block_info: List with block offset and block length
+        :param str_kind: Kind of block (e.g. Core)
+        :return: List with hash string and version string, or None
+        """
+        arr_key = self.file_id(str_file)
+        arr_key += [int(block_info[0]), int(block_info[1]), str_kind]
+        row = self.conn.execute(
+            'SELECT hash, version FROM blocks WHERE path=? AND size=? AND '
+            'mtime_ns=? AND inode=? AND offset=? AND len=? AND kind=?',
+            arr_key).fetchone()
+        if row:
+            self.touched[tuple(arr_key)] = time.time()
+
+        return row
+
+    def put(self, str_file, block_info, str_kind, str_hash, str_version):
+        """
+        Store data of a block
+        :param str_file: Path to file
+        :param block_info: List with block offset and block length
+        :param str_kind: Kind of block (e.g. Core)
+        :param str_hash: Hash string of the block
+        :param str_version: Version string of the block
+        """
+        arr_key = self.file_id(str_file)
+        # File modified too recently (the time resolution of some file
+        # systems is too coarse to see another change in the same period)
+        if time.time_ns() - arr_key[2] < 2000000000:
+            return
+
+        arr_key += [int(block_info[0]), int(block_info[1]), str_kind]
+        self.conn.execute(
+            'INSERT OR REPLACE INTO blocks VALUES (?,?,?,?,?,?,?,?,?,?)',
+            arr_key + [str_hash, str_version, time.time()])
+        self.changes += 1
+
+    def forget(self, str_file):
+        """
+        Remove all the entries of a file
+        :param str_file: Path to file
+        """
+        self.conn.execute('DELETE FROM blocks WHERE path=?',
+                          (os.path.abspath(str_file), ))
+        self.changes += 1
+
+    def close(self):
+        """
+        Save last use of the entries found, remove least recently used
+        entries and close, in only one transaction
+        """
+        if self.touched or self.changes:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(
+                'UPDATE blocks SET last_used=? WHERE path=? AND size=? AND '
+                'mtime_ns=? AND inode=? AND offset=? AND len=? AND kind=?',
+                [(f_time, ) + arr_key
+                 for arr_key, f_time in self.touched.items()])
+            if self.changes:
+                self.conn.execute(
+                    'DELETE FROM blocks WHERE rowid IN (SELECT rowid FROM '
+                    'blocks ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries, ))
+            self.conn.execute('COMMIT')
+            self.touched = {}
+            self.changes = 0
+        self.conn.close()
+
+
+def open_ident_cache(str_json, str_dbversion):
+    """
+    Open the identification cache, stored with the hash database
+    :param str_json: Path to hash database file
+    :param str_dbversion: Version of hash database
+    """
+    global IDENT_CACHE  # pylint: disable=global-statement
+
+    close_ident_cache()
+    if sqlite3 is None:
+        return
+
+    str_file = os.path.join(os.path.dirname(str_json), 'zx123_cache.db')
+    f_stat = os.stat(str_json)
+    str_dbid = f'{str_dbversion}:{f_stat.st_size}:{f_stat.st_mtime_ns}'
+    try:
+        IDENT_CACHE = IdentCache(str_file, str_dbid)
+    except sqlite3.Error as error:
+        LOGGER.debug('Identification cache not available: %s', error)
+
+
+def close_ident_cache():
+    """Save and close the identification cache"""
+    global IDENT_CACHE  # pylint: disable=global-statement
+
+    if IDENT_CACHE:
+        try:
+            IDENT_CACHE.close()
+        except sqlite3.Error as error:
+            LOGGER.debug('Error saving identification cache: %s', error)
+        IDENT_CACHE = None
+
+
+atexit.register(close_ident_cache)
+
+
+def get_cached_id(str_in_file, block_info, str_kind):
+    """
+    Obtain cached hash and version of a block in a file
+    :param str_in_file: Path to file
+    :param block_info: List with block offset and block length
+    :param str_kind: Kind of block (e.g. Core)
+    :return: List with hash string and version string, or None
+    """
+    cached_id = None
+    if IDENT_CACHE:
+        try:
+            cached_id = IDENT_CACHE.get(str_in_file, block_info, str_kind)
+        except (sqlite3.Error, OSError) as error:
+            LOGGER.debug('Error reading identification cache: %s', error)
+
+    return cached_id
+
+
+def put_cached_id(str_in_file, block_info, str_kind, str_hash, str_version):
+    """
+    Store hash and version of a block in a file in the cache
+    :param str_in_file: Path to file
+    :param block_info: List with block offset and block length
+    :param str_kind: Kind of block (e.g. Core)
+    :param str_hash: Hash string of the block
+    :param str_version: Version string of the block
+    """
+    if IDENT_CACHE and str_hash:
+        try:
+            IDENT_CACHE.put(str_in_file, block_info, str_kind, str_hash,
+                            str_version)
+        except (sqlite3.Error, OSError) as error:
+            LOGGER.debug('Error writing identification cache: %s', error)
+
+
+def forget_cached_ids(str_file):
+    """
+    Remove from the cache all the data of a file
+    :param str_file: Path to file
+    """
+    if IDENT_CACHE:
+        try:
+            IDENT_CACHE.forget(str_file)
+        except sqlite3.Error as error:
+            LOGGER.debug('Error writing identification cache: %s', error)
+
+
 def get_version(str_in_file, block_info, hash_dict):
     """
     Obtain version string in block in file using dictionary of hashes
@@ -2770,24 +5489,69 @@ def get_version(str_in_file, block_info, hash_dict):
     :param hash_dict: Dictionary with hashes for different blocks
     :return: List with version string and hash string
     """
-    f_size = os.stat(str_in_file).st_size
-    str_version = ''
-    str_hash = ''
+    cached_id = get_cached_id(str_in_file, block_info, 'Block')
+    if cached_id:
+        return cached_id[1], cached_id[0]
 
-    i_start = int(block_info[0])
-    i_len = int(block_info[1])
-    if f_size >= i_start + i_len:
-        with open(str_in_file, "rb") as in_zxd:
-            in_zxd.seek(i_start)
-            bin_data = in_zxd.read(i_len)
-            str_hash = hashlib.sha256(bin_data).hexdigest()
-            del bin_data
+    str_version = ''
 
+    str_hash = get_block_hash(str_in_file, block_info)
+    if str_hash:
         str_version = get_data_version(str_hash, hash_dict)
+        put_cached_id(str_in_file, block_info, 'Block', str_hash, str_version)
+
+    return str_version, str_hash
+
+
+def get_block_hash(str_in_file, block_info):
+    """
+    Obtain sha256 hash string of block in file
+    :param str_in_file: Path to file
+    :param block_info: List with block offset and block length
+    :return: Hash string (empty if the file is too small)
+    """
+    str_hash = ''
+
+    bin_data = get_flash_image(str_in_file).block(block_info)
+    if bin_data is not None:
+        str_hash = hashlib.sha256(bin_data).hexdigest()
+        bin_data.release()
     else:
         LOGGER.debug('File too small to check version')
 
-    return str_version, str_hash
+    return str_hash
+
+
+def hash_blocks(str_in_file, arr_blocks, b_partial=False):
+    """
+    Obtain sha256 hash strings of several blocks in file, using a pool of
+    HASH_THREADS threads
+    :param str_in_file: Path to file
+    :param arr_blocks: List of blocks. Each block is a list of pieces
+     (offset and length) to hash together
+    :param b_partial: If True, hash the available data even if the file is
+     too small for the whole block
+    :return: List of hash strings (empty if the file is too small), in the
+     same order as the blocks
+    """
+    flash_image = get_flash_image(str_in_file)
+
+    def hash_block(arr_pieces):
+        block_hash = hashlib.sha256()
+        for block_info in arr_pieces:
+            bin_data = flash_image.block(block_info, b_partial)
+            if bin_data is None:
+                LOGGER.debug('File too small to check version')
+                return ''
+            block_hash.update(bin_data)
+            bin_data.release()
+        return block_hash.hexdigest()
+
+    if len(arr_blocks) < 2 or HASH_THREADS == 1:
+        return [hash_block(arr_pieces) for arr_pieces in arr_blocks]
+
+    with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+        return list(executor.map(hash_block, arr_blocks))
 
 
 def get_data_version(str_hash, hash_dict):
@@ -2799,17 +5563,63 @@ def get_data_version(str_hash, hash_dict):
     """
     str_version = 'Unknown'
 
-    if 'versions' in hash_dict:
-        hash_dict = hash_dict['versions']
-
-    for hash_elem in hash_dict:
-        if str_hash == hash_dict[hash_elem]:
-            str_version = hash_elem
+    for _, str_name, hash_version, _ in get_hash_index(hash_dict).get(
+            str_hash, []):
+        if not str_name:
+            str_version = hash_version
             break
 
     return str_version
 
 
+def get_hash_index(hash_dict):
+    """
+    Obtain the reverse index of a dictionary of hashes, building it only
+    the first time that it's needed
+    :param hash_dict: Dictionary with hashes (full database or any part of it)
+    :return: Dictionary with hash strings as keys and lists of (kind, name,
+     version, features) as values
+    """
+    index_data = HASH_INDEX.get(id(hash_dict))
+    if not index_data or index_data[0] is not hash_dict:
+        index_data = (hash_dict, build_hash_index(hash_dict))
+        HASH_INDEX[id(hash_dict)] = index_data
+
+    return index_data[1]
+
+
+def build_hash_index(hash_dict, str_kind='', str_name=''):
+    """
+    Build reverse index of a dictionary of hashes. For each entry, kind is
+    the first key of its path inside hash_dict, and name the last one (both
+    are empty for the versions of hash_dict itself)
+    :param hash_dict: Dictionary with hashes (full database or any part of it)
+    :param str_kind: Kind to use for the versions found in hash_dict
+    :param str_name: Name to use for the versions found in hash_dict
+    :return: Dictionary with hash strings as keys and lists of (kind, name,
+     version, features) as values
+    """
+    dict_index = {}
+
+    dict_versions = hash_dict.get('versions', hash_dict)
+    dict_features = hash_dict.get('features', {})
+    for str_version, str_hash in dict_versions.items():
+        if isinstance(str_hash, str):
+            dict_index.setdefault(str_hash, []).append(
+                (str_kind, str_name, str_version, dict_features))
+
+    for str_key, dict_child in hash_dict.items():
+        if isinstance(dict_child, dict) and str_key not in [
+                'versions', 'features', 'parts'
+        ]:
+            child_index = build_hash_index(dict_child, str_kind or str_key,
+                                           str_key)
+            for str_hash, arr_entries in child_index.items():
+                dict_index.setdefault(str_hash, []).extend(arr_entries)
+
+    return dict_index
+
+
 def get_peek(str_in_file, block_offset):
     """
     Get value of one byte in binary file
@@ -2817,11 +5627,7 @@ def get_peek(str_in_file, block_offset):
     :param block_offset: Offset in file to read
     :return: Number with the obtained value
     """
-    with open(str_in_file, "rb") as in_zxd:
-        in_zxd.seek(block_offset)
-        bin_data = in_zxd.read(1)
-
-    return struct.unpack('<B', bin_data)[0]
+    return get_flash_image(str_in_file).peek(block_offset)
 
 
 def validate_and_export_bin(str_in_file,
@@ -2836,16 +5642,9 @@ def validate_and_export_bin(str_in_file,
     :param str_out_bin: Path to bin file to create
     :param str_magic: String with the bytes to match
     """
-    f_size = os.stat(str_in_file).st_size
-    bin_data = None
-    i_start = int(block_info[0])
-    i_len = int(block_info[1])
-
-    if f_size >= i_start + i_len:
-        with open(str_in_file, "rb") as in_zxdata:
-            in_zxdata.seek(i_start)
-            bin_data = in_zxdata.read(i_len)
+    bin_data = get_flash_image(str_in_file).block(block_info)
 
+    if bin_data is not None:
         if str_magic:
             if not validate_bin(bin_data, str_magic):
                 LOGGER.error('Invalid data')
@@ -2863,9 +5662,7 @@ def export_bin(str_in_file, block_info, str_out_bin, b_force=False):
     :param block_info: List with block offset and block length
     :param str_out_bin: Path to bin file to create
     """
-    with open(str_in_file, "rb") as in_zxdata:
-        in_zxdata.seek(block_info[0])
-        bin_data = in_zxdata.read(block_info[1])
+    bin_data = get_flash_image(str_in_file).block(block_info, True)
 
     export_bindata(bin_data, str_out_bin, b_force)
 
@@ -2877,15 +5674,17 @@ def validate_file(str_in_file, str_magic):
     """
     Try to detect ZX... file type from first bytes
     :param str_in_file: Path to file
-    :param str_magic: String with the bytes to match
+    :param str_magic: String with the bytes to match (or the bytes)
     :return: True if bytes match, False in other case
     """
-    magic_bin = unhexlify(str_magic)
+    magic_bin = str_magic
+    if isinstance(str_magic, str):
+        magic_bin = unhexlify(str_magic)
     if str_magic:
         try:
-            with open(str_in_file, "rb") as bin_file:
-                bin_data = bin_file.read(len(magic_bin))
-                b_validate = validate_bin(bin_data, str_magic)
+            bin_data = get_flash_image(str_in_file).block(
+                [0, len(magic_bin)], True)
+            b_validate = validate_bin(bin_data, str_magic)
         except FileNotFoundError:
             b_validate = False
 
@@ -2898,10 +5697,12 @@ def validate_bin(bin_data, str_magic):
     """
     Try to detect ZX data type from first bytes
     :param bin_data: binary data of file
-    :param str_magic: String with the bytes to match
+    :param str_magic: String with the bytes to match (or the bytes)
     :return: True if bytes match, False in other case
     """
-    magic_bin = unhexlify(str_magic)
+    magic_bin = str_magic
+    if isinstance(str_magic, str):
+        magic_bin = unhexlify(str_magic)
     if magic_bin:
         if magic_bin == bin_data[:len(magic_bin)]:
             return True
@@ -2911,6 +5712,205 @@ def validate_bin(bin_data, str_magic):
         return False
 
 
+def read_bindata(str_in_file, b_len=-1):
+    """
+    Read file (or the first bytes of it) into a mutable buffer
+    :param str_in_file: Path to file
+    :param b_len: Number of bytes to read (all the file if negative)
+    :return: bytearray with the data
+    """
+    if b_len < 0:
+        b_len = os.stat(str_in_file).st_size
+
+    b_data = bytearray(b_len)
+    with open(str_in_file, "rb") as in_zxdata:
+        b_len = in_zxdata.readinto(b_data)
+    del b_data[b_len:]
+
+    return b_data
+
+
+def fill_bindata(b_data, b_offset, b_len, b_value=0):
+    """
+    Fill in place a region of binary data with the same byte value
+    :param b_data: bytearray to modify
+    :param b_offset: Offset of the region
+    :param b_len: Length of the region (nothing is done if not positive)
+    :param b_value: Byte value to use
+    """
+    b_len = min(b_len, len(b_data) - b_offset)
+    if b_len > 0:
+        b_data[b_offset:b_offset + b_len] = bytes([b_value]) * b_len
+
+
+def save_bindata(b_data, str_outfile, str_in_file=''):
+    """
+    Write binary data to file. If the file is the same one where the data
+    was read from, only write the sectors that have changed
+    :param b_data: Binary data
+    :param str_outfile: Path to file to create or update
+    :param str_in_file: Path to the file where the data was read from
+    """
+    forget_cached_ids(str_outfile)
+    if str_in_file and os.path.isfile(str_outfile) and os.path.samefile(
+            str_in_file, str_outfile):
+        i_len = patch_bindata(b_data, str_outfile)
+        LOGGER.debug('%i bytes written', i_len)
+        print(f'{str_outfile} updated OK.', file=MSG_STREAM)
+    else:
+        release_flash_image(str_outfile)
+        with open(str_outfile, "wb") as out_zxdata:
+            out_zxdata.write(b_data)
+            print(f'{str_outfile} created OK.', file=MSG_STREAM)
+
+
+def patch_bindata(b_data, str_file):
+    """
+    Update file so its content is the same as binary data, writing only the
+    sectors that are different. A journal file is written (and synced) first,
+    so an interrupted update can be completed later with recover_journal
+    :param b_data: Binary data with the new file contents
+    :param str_file: Path to file to update
+    :return: Number of bytes written to the file
+    """
+    recover_journal(str_file)
+
+    flash_image = get_flash_image(str_file)
+    i_size = flash_image.size
+    arr_ranges = get_dirty_ranges(flash_image.view, b_data)
+    release_flash_image(str_file)
+
+    i_len = 0
+    if arr_ranges or i_size != len(b_data):
+        str_journal = f'{str_file}.journal'
+        write_journal(str_journal, b_data, arr_ranges)
+        with open(str_file, "r+b") as out_zxdata:
+            i_len = apply_ranges(out_zxdata, b_data, arr_ranges, len(b_data))
+        os.remove(str_journal)
+
+    return i_len
+
+
+def get_dirty_ranges(old_data, b_data):
+    """
+    Compare two binary data buffers, sector by sector
+    :param old_data: Original binary data
+    :param b_data: New binary data
+    :return: List of (offset, length) of regions of b_data that are new or
+     different from old_data
+    """
+    arr_ranges = []
+    i_common = min(len(old_data), len(b_data))
+    i_chunk = SECTOR_LEN * 256
+
+    for i_start in range(0, i_common, i_chunk):
+        i_end = min(i_start + i_chunk, i_common)
+        if old_data[i_start:i_end] == b_data[i_start:i_end]:
+            continue
+        for i_sector in range(i_start, i_end, SECTOR_LEN):
+            i_sector_end = min(i_sector + SECTOR_LEN, i_end)
+            if old_data[i_sector:i_sector_end] != b_data[i_sector:i_sector_end]:
+                if arr_ranges and sum(arr_ranges[-1]) == i_sector:
+                    arr_ranges[-1][1] += i_sector_end - i_sector
+                else:
+                    arr_ranges.append([i_sector, i_sector_end - i_sector])
+
+    if len(b_data) > i_common:
+        arr_ranges.append([i_common, len(b_data) - i_common])
+
+    return arr_ranges
+
+
+def apply_ranges(out_data, b_data, arr_ranges, i_size):
+    """
+    Write regions of binary data into an open file, and sync it
+    :param out_data: File object opened for update
+    :param b_data: Binary data (or journal data) with the regions
+    :param arr_ranges: List of (file offset, length[, data offset])
+    :param i_size: Final size of the file
+    :return: Number of bytes written
+    """
+    i_written = 0
+    b_view = memoryview(b_data)
+    for arr_range in arr_ranges:
+        i_offset, i_len = arr_range[:2]
+        i_data = arr_range[2] if len(arr_range) > 2 else i_offset
+        out_data.seek(i_offset)
+        out_data.write(b_view[i_data:i_data + i_len])
+        i_written += i_len
+
+    out_data.truncate(i_size)
+    out_data.flush()
+    os.fsync(out_data.fileno())
+
+    return i_written
+
+
+def write_journal(str_journal, b_data, arr_ranges):
+    """
+    Create journal file with the regions to write in a file, and sync it
+    :param str_journal: Path to journal file
+    :param b_data: New binary data of the file
+    :param arr_ranges: List of (offset, length) of regions to write
+    """
+    journal_hash = hashlib.sha256()
+    with open(str_journal, "wb") as out_journal:
+        for jnl_data in [
+                JOURNAL_MAGIC,
+                struct.pack('<QQ', len(b_data), len(arr_ranges))
+        ]:
+            journal_hash.update(jnl_data)
+            out_journal.write(jnl_data)
+        for i_offset, i_len in arr_ranges:
+            for jnl_data in [
+                    struct.pack('<QQ', i_offset, i_len),
+                    memoryview(b_data)[i_offset:i_offset + i_len]
+            ]:
+                journal_hash.update(jnl_data)
+                out_journal.write(jnl_data)
+        out_journal.write(journal_hash.digest())
+        out_journal.flush()
+        os.fsync(out_journal.fileno())
+
+
+def recover_journal(str_file):
+    """
+    Complete an interrupted update of a file, using its journal if found.
+    Incomplete journals are discarded, since the file was not yet modified
+    :param str_file: Path to file
+    :return: True if the file was modified
+    """
+    str_journal = f'{str_file}.journal'
+    if not os.path.isfile(str_journal):
+        return False
+
+    b_recover = False
+    jnl_data = read_bindata(str_journal)
+    i_pos = len(JOURNAL_MAGIC) + 16
+    if jnl_data[:len(JOURNAL_MAGIC)] == JOURNAL_MAGIC and len(
+            jnl_data) >= i_pos + 32 and hashlib.sha256(
+                jnl_data[:-32]).digest() == jnl_data[-32:]:
+        i_size, i_count = struct.unpack_from('<QQ', jnl_data,
+                                             len(JOURNAL_MAGIC))
+        arr_ranges = []
+        for _ in range(i_count):
+            i_offset, i_len = struct.unpack_from('<QQ', jnl_data, i_pos)
+            arr_ranges.append([i_offset, i_len, i_pos + 16])
+            i_pos += 16 + i_len
+
+        LOGGER.warning('Completing interrupted update of %s', str_file)
+        release_flash_image(str_file)
+        forget_cached_ids(str_file)
+        with open(str_file, "r+b") as out_zxdata:
+            apply_ranges(out_zxdata, jnl_data, arr_ranges, i_size)
+        b_recover = True
+    else:
+        LOGGER.warning('Discarding incomplete journal for %s', str_file)
+
+    os.remove(str_journal)
+    return b_recover
+
+
 def get_file_hash(str_in_file):
     """
     Get file sha26 hash
@@ -2919,8 +5919,9 @@ def get_file_hash(str_in_file):
     """
     sha256_hash = hashlib.sha256()
     with open(str_in_file, "rb") as f_data:
-        # Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f_data.read(4096), b""):
+        # Read and update hash string value in blocks of 1M, without mapping
+        # the file, since it may be replaced or removed later
+        for byte_block in iter(lambda: f_data.read(1048576), b""):
             sha256_hash.update(byte_block)
 
     return sha256_hash.hexdigest()
@@ -2933,9 +5934,10 @@ def export_bindata(bin_data, str_out_bin, b_force=False):
     :param str_out_bin: Path to bin file to create
     """
     if b_force or check_overwrite(str_out_bin):
+        release_flash_image(str_out_bin)
         with open(str_out_bin, "wb") as out_zxdata:
             out_zxdata.write(bin_data)
-            print(f'{str_out_bin} created OK.')
+            print(f'{str_out_bin} created OK.', file=MSG_STREAM)
 
 
 def check_overwrite(str_file):
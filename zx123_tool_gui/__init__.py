@@ -17,6 +17,7 @@ ZX123 Tool GUI Classes
 import os
 import sys
 import json
+import threading
 from shutil import copy
 import ssl
 import tkinter as tk
@@ -26,8 +27,6 @@ from tkinter import messagebox
 import zx123_tool as zx123
 from ._extra_gui import NewEntryDialog, InfoWindow, ROMPWindow
 from ._extra_gui import ProgressWindow, PrefWindow
-if sys.version_info.major == 3:
-    import urllib.request
 
 ssl._create_default_https_context = ssl._create_unverified_context  # pylint: disable=protected-access
 
@@ -89,6 +88,7 @@ class App(tk.Tk):
         self.zxfilepath = ''
         self.zxextension = ''
         self.zxsize = 0
+        self.prefetch_threads = []
         self.old_core = self.old_timer = self.old_keyboard = None
         self.old_video = self.old_rom = None
 
@@ -149,9 +149,10 @@ class App(tk.Tk):
     def check_updates(self, confirm=False):
         """Gets the latest release version from GitHub"""
         print("Checking for updates...")
-        result = urllib.request.urlopen(
-            'https://github.com/kounch/zx123_tool/releases/latest')
-        new_version = result.url.split('/')[-1]
+        with zx123.http_open(
+                'https://github.com/kounch/zx123_tool/releases/latest',
+                str_method='HEAD') as result:
+            new_version = result.url.split('/')[-1]
         old_version = zx123.__MY_VERSION__
         if new_version > old_version:
             str_msg = f'There\'s a new version ({new_version}) of'
@@ -170,7 +171,8 @@ class App(tk.Tk):
             'ask_replace': True,
             'import_unknown': False,
             'import_allroms': False,
-            'remember_pos': False
+            'remember_pos': False,
+            'prefetch_updates': False
         }
         str_prefs = os.path.join(JSON_DIR, 'zx123_prefs.json')
 
@@ -202,25 +204,27 @@ class App(tk.Tk):
     def load_json(self):
         """Initialize JSON Database"""
 
-        fulldict_hash = zx123.load_json_bd(base_dir=JSON_DIR)
+        fulldict_hash = zx123.load_json_bd(base_dir=JSON_DIR, b_caches=True)
         if os.path.isdir(APP_RESDIR):
-            tmp_hash = zx123.load_json_bd(base_dir=APP_RESDIR)
-            if 'version' in tmp_hash:
+            my_version = zx123.get_json_version(
+                os.path.join(APP_RESDIR, 'zx123_hash.json'))
+            if my_version:
                 old_version = '20211201.001'
-                my_version = tmp_hash['version']
                 if 'version' in fulldict_hash:
                     old_version = fulldict_hash['version']
                 if old_version < my_version:
                     print('Updating database file...')
                     copy(os.path.join(APP_RESDIR, 'zx123_hash.json'), JSON_DIR)
+                    fulldict_hash = zx123.load_json_bd(base_dir=JSON_DIR,
+                                                       b_caches=True)
 
-        fulldict_hash = zx123.load_json_bd(base_dir=JSON_DIR)
         self.fulldict_hash = fulldict_hash
 
     def update_json(self):
         """Update JSON Database and show in GUI"""
         fulldict_hash = zx123.load_json_bd(base_dir=JSON_DIR,
-                                           str_update='json')
+                                           str_update='json',
+                                           b_caches=True)
         if 'version' in fulldict_hash:
             str_text = f'Database: {fulldict_hash["version"]}'
             self.version_label.config(text=str_text)
@@ -350,12 +354,54 @@ class App(tk.Tk):
         if response:
             w_progress = ProgressWindow(self, f'Update {str_update}')
             w_progress.show()
-            zx123.update_image(self.zxfilepath, self.zxfilepath,
-                               self.fulldict_hash, self.zxextension,
-                               str_update, False, True, get_1core, get_2mb,
-                               w_progress)
-            self.open_file(self.zxfilepath)
-            w_progress.close()
+            self.after_prefetch(
+                w_progress, lambda: self.do_update(w_progress, str_update,
+                                                   get_1core, get_2mb))
+
+    def do_update(self, w_progress, str_update, get_1core, get_2mb):
+        """
+        Update BIOS and or Core(s) of image file, and show the results
+        :param w_progress: ProgressWindow where the status is shown
+        :param str_update: Description of the update ("all", "bios", etc.)
+        :param get_1core: Use "1core" entries of JSON
+        :param get_2mb: Use "2m" entries of JSON
+        """
+        zx123.update_image(self.zxfilepath, self.zxfilepath,
+                           self.fulldict_hash, self.zxextension, str_update,
+                           False, True, get_1core, get_2mb, w_progress)
+        self.open_file(self.zxfilepath)
+        w_progress.close()
+
+    def prefetch_updates(self):
+        """
+        Start downloading to the cache, in the background, the files needed
+        to update the current image, so a later update mostly only injects
+        """
+        arr_jobs = zx123.plan_prefetch(self.zxfilepath, self.fulldict_hash,
+                                       self.zxextension)
+        if arr_jobs:
+            prefetch_thread = threading.Thread(target=zx123.prefetch_updates,
+                                               args=(arr_jobs, ),
+                                               daemon=True)
+            prefetch_thread.start()
+            self.prefetch_threads.append(prefetch_thread)
+
+    def after_prefetch(self, w_progress, next_action):
+        """
+        Run an action when all background downloads are finished, checking
+        them from time to time, so the GUI keeps responding
+        :param w_progress: ProgressWindow where the status is shown
+        :param next_action: Function to call
+        """
+        self.prefetch_threads = [
+            prefetch_thread for prefetch_thread in self.prefetch_threads
+            if prefetch_thread.is_alive()
+        ]
+        if self.prefetch_threads:
+            w_progress.update('Waiting for background downloads...')
+            self.after(200, self.after_prefetch, w_progress, next_action)
+        else:
+            next_action()
 
     def open_files(self, *args):
         """Open several files"""
@@ -447,21 +493,21 @@ class App(tk.Tk):
                 self.rompack_import_button.state(['!disabled'])
                 if rom_number:
                     self.rompack_export_button.state(['!disabled'])
+
+                if self.dict_prefs.get('prefetch_updates', False):
+                    self.prefetch_updates()
             elif filetype == 'ROMPack v2':
-                dict_roms, default_rom = zx123.list_romsdata(
-                    str_file, self.fulldict_hash, 'RPv2', False, True)
-                ROMPWindow(self, str_filename, filetype, dict_roms,
-                           default_rom)
+                rom_pack = zx123.ROMPack(str_file, self.fulldict_hash, 'RPv2')
+                ROMPWindow(self, str_filename, filetype, rom_pack)
             else:
                 if str_file:
                     dict_file = zx123.find_zxfile(str_file, self.fulldict_hash,
                                                   str_extension, False, True)
                     filetype = dict_file.get('kind', 'Unknown')
                     if filetype == 'ROMPack':
-                        dict_roms, default_rom = zx123.list_romsdata(
-                            str_file, self.fulldict_hash, 'ROMS', False, True)
-                        ROMPWindow(self, str_filename, filetype, dict_roms,
-                                   default_rom)
+                        rom_pack = zx123.ROMPack(str_file, self.fulldict_hash,
+                                                 'ROMS')
+                        ROMPWindow(self, str_filename, filetype, rom_pack)
                     elif filetype != 'Unknown':
                         InfoWindow(self, str_filename, dict_file)
                     else:
@@ -202,8 +202,9 @@ class ROMPWindow:
     from ._main_gui import create_rom_table
     from ._main_gui import populate_roms
 
-    def __init__(self, parent, str_name, str_kind, dict_roms, default_rom):
+    def __init__(self, parent, str_name, str_kind, rom_pack):
         self.parent = parent
+        self.rom_pack = rom_pack
 
         self.top = tk.Toplevel(parent)
         self.top.resizable(False, False)
@@ -224,13 +225,30 @@ class ROMPWindow:
         self.roms_frame = ttk.Frame(main_frame, padding=5)
         self.roms_frame.pack()
         rom_label = ttk.Label(self.roms_frame,
-                              text=f'Default ROM: {default_rom}')
+                              text=f'Default ROM: {rom_pack.default_rom()}')
         rom_label.grid(column=0, row=0, columnspan=4, pady=5)
         self.rom_table = self.create_rom_table(height=26)
         self.rom_table.configure(selectmode='none')
+
+        # Show the directory now, and identify the ROMs later, one by one
+        self.pending_roms = rom_pack.entries()
+        dict_roms = {}
+        for rom in self.pending_roms:
+            dict_roms[rom.index] = [
+                rom.slot, rom.flags, rom.crc, rom.name, rom.size * 16, '...'
+            ]
         self.populate_roms(dict_roms)
 
         center_on_parent(parent, self.top)
+        self.top.after_idle(self.identify_next_rom)
+
+    def identify_next_rom(self):
+        """Identify one of the listed ROMs, and schedule the next one"""
+        if self.pending_roms:
+            rom = self.pending_roms.pop(0)
+            block_version, _ = self.rom_pack.rom_version(rom)
+            self.rom_table.set(rom.index, 'version', block_version)
+            self.top.after_idle(self.identify_next_rom)
 
     def bind_keys(self, *_):
         """Bind Menu Keys"""
@@ -252,7 +270,9 @@ class ROMPWindow:
 
     def do_close(self, *_):
         """Close window"""
+        self.pending_roms = []
         self.top.destroy()
+        self.rom_pack.close()
 
 
 class ProgressWindow:
@@ -326,7 +346,9 @@ class PrefWindow:
             'ask_replace': 'Ask for confirmation when replacing cores or ROMs',
             'import_unknown': 'Allow import of unknown BIOS, esxdos or cores',
             'import_allroms': 'Allow import of unknown ROMs',
-            'remember_pos': 'Remember Main and Preferences window positions'
+            'remember_pos': 'Remember Main and Preferences window positions',
+            'prefetch_updates': 'Download updates in the background when'
+            ' opening an image'
         }
         self.extra_vars = []
         for index, key in enumerate(self.dict_prefs):